@@ -0,0 +1,174 @@
+"""
+Benchmark image wire codecs for grounding requests.
+
+For every codec setting this reports the mean/p50/p95 encode time and mean
+payload size (data URL bytes) on the resized screenshots that
+evaluation/grounding/eval_server.py sends, and, when a VLLM server is given,
+the grounding accuracy obtained with that setting.
+
+Example:
+    python benchmark_codec.py \
+        --dataset_dir ../evaluation/grounding/data/ScreenSpot_V2_data \
+        --image_root <Your_Image_Dir> \
+        --settings png png:1 jpeg:95 jpeg:85 webp:90 \
+        --max_samples 200 \
+        --server_ip 0.0.0.0 --server_port 8001
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation", "grounding"))
+from eval_server import load_resized_image, process_case
+from utils import IMAGE_MIME_TYPES, ImageCodec
+
+
+def parse_setting(setting):
+    """Parse "format[:level]" into an ImageCodec.
+
+    The level is the zlib compress level for png and the quality for jpeg/webp.
+    """
+    image_format, _, level = setting.partition(":")
+    image_format = image_format.lower()
+    if image_format not in IMAGE_MIME_TYPES:
+        raise ValueError(f"Unsupported image format in setting: {setting}")
+    if not level:
+        return ImageCodec(format=image_format)
+    if image_format == "png":
+        return ImageCodec(format=image_format, compress_level=int(level))
+    return ImageCodec(format=image_format, quality=int(level))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_cases(dataset_dir, max_samples, seed):
+    cases = []
+    for json_file in sorted(glob.glob(os.path.join(dataset_dir, "*.json"))):
+        with open(json_file, 'r') as f:
+            for case in json.load(f):
+                case = case.copy()
+                case['dataset_source'] = os.path.basename(json_file)
+                cases.append(case)
+    if max_samples and len(cases) > max_samples:
+        cases = random.Random(seed).sample(cases, max_samples)
+    return cases
+
+
+def measure_encoding(cases, image_root, codecs, repeats):
+    """Return {setting: {"encode_ms": [...], "payload_bytes": [...]}}."""
+    stats = {setting: {"encode_ms": [], "payload_bytes": []} for setting in codecs}
+    images = {}
+    for case in cases:
+        if case['img_filename'] not in images:
+            image, _, _ = load_resized_image(os.path.join(image_root, case['img_filename']))
+            if image is not None:
+                images[case['img_filename']] = image
+
+    for image in images.values():
+        for setting, codec in codecs.items():
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                payload = codec.to_data_url(image)
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            stats[setting]["encode_ms"].append(best)
+            stats[setting]["payload_bytes"].append(len(payload))
+    return stats, len(images)
+
+
+def measure_accuracy(cases, image_root, client, model_name, codec, num_workers):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl', delete=False) as f:
+        output_file = f.name
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(
+                lambda case: process_case(case, image_root, output_file, client, model_name, codec),
+                cases,
+            ))
+        total, correct = 0, 0
+        with open(output_file, 'r') as f:
+            for line in f:
+                result = json.loads(line)
+                total += 1
+                correct += result.get('correctness') == 'correct'
+        return correct / total if total else None
+    finally:
+        os.remove(output_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark image wire codecs on grounding datasets.")
+    parser.add_argument("--dataset_dir", type=str, required=True, help="Directory containing JSON dataset files")
+    parser.add_argument("--image_root", type=str, required=True, help="Root directory for images")
+    parser.add_argument("--settings", type=str, nargs="+", default=["png", "png:1", "jpeg:95", "jpeg:85", "webp:90"],
+                        help="Codec settings as format[:level], level is compress_level for png and quality otherwise")
+    parser.add_argument("--max_samples", type=int, default=200, help="Number of cases sampled from the dataset (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed (default: 0)")
+    parser.add_argument("--repeats", type=int, default=3, help="Encode repetitions per image, best is kept (default: 3)")
+    parser.add_argument("--server_ip", type=str, default=None, help="VLLM server IP; accuracy is skipped when omitted")
+    parser.add_argument("--server_port", type=int, default=8001, help="VLLM server port (default: 8001)")
+    parser.add_argument("--model_name", type=str, default="MAI-UI-8B", help="Model name served by VLLM (default: MAI-UI-8B)")
+    parser.add_argument("--api_key", type=str, default="EMPTY", help="API Key for VLLM server (default: EMPTY)")
+    parser.add_argument("--num_workers", type=int, default=16, help="Number of concurrent workers (default: 16)")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    codecs = {setting: parse_setting(setting) for setting in args.settings}
+    cases = load_cases(args.dataset_dir, args.max_samples, args.seed)
+    print(f"Loaded {len(cases)} cases from {args.dataset_dir}")
+
+    stats, num_images = measure_encoding(cases, args.image_root, codecs, args.repeats)
+    print(f"Encoded {num_images} distinct images per setting")
+
+    client = None
+    if args.server_ip:
+        client = OpenAI(api_key=args.api_key, base_url=f"http://{args.server_ip}:{args.server_port}/v1")
+
+    report = []
+    for setting, codec in codecs.items():
+        encode_ms = stats[setting]["encode_ms"]
+        payload_bytes = stats[setting]["payload_bytes"]
+        row = {
+            "setting": setting,
+            "encode_ms_mean": sum(encode_ms) / len(encode_ms) if encode_ms else None,
+            "encode_ms_p50": percentile(encode_ms, 0.5) if encode_ms else None,
+            "encode_ms_p95": percentile(encode_ms, 0.95) if encode_ms else None,
+            "payload_kb_mean": sum(payload_bytes) / len(payload_bytes) / 1024 if payload_bytes else None,
+            "accuracy": None,
+        }
+        if client is not None:
+            row["accuracy"] = measure_accuracy(
+                cases, args.image_root, client, args.model_name, codec, args.num_workers
+            )
+        report.append(row)
+
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    print("-" * 78)
+    print(f"{'setting':12} {'enc mean ms':>12} {'enc p50 ms':>11} {'enc p95 ms':>11} {'payload KB':>11} {'accuracy':>9}")
+    for row in report:
+        print(
+            f"{row['setting']:12} {fmt(row['encode_ms_mean'], '12.2f')} {fmt(row['encode_ms_p50'], '11.2f')} "
+            f"{fmt(row['encode_ms_p95'], '11.2f')} {fmt(row['payload_kb_mean'], '11.1f')} {fmt(row['accuracy'], '9.4f')}"
+        )
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output_json}")
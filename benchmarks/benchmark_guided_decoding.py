@@ -0,0 +1,135 @@
+"""
+Benchmark parse failures and generated tokens with and without guided decoding.
+
+Each sample of a grounding dataset (ScreenSpot-v2 mobile by default) becomes
+a one-step navigation task: the screenshot is the observation and the
+grounding instruction ("click the button to ...") the task. Every task is
+sent once per guided decoding mode with MAIUINaivigationAgent's request
+settings (no retries), and the benchmark reports per mode:
+
+    parse_failure_rate  responses parse_action_to_structure_output rejects
+    truncated_rate      responses cut off by max_tokens
+    completion_tokens   mean generated tokens (from the server's usage)
+    latency_s           mean request latency
+
+Requires a vLLM server with structured outputs (xgrammar or outlines
+backend). Without a server, --dry_run only prints the size of the derived
+constraints.
+
+Example:
+    python benchmark_guided_decoding.py --server_url http://localhost:8000/v1 \
+        --image_root /data/screenspot_v2 --num_samples 200 --modes none regex structural_tag
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mai_naivigation_agent import MAIUINaivigationAgent, parse_action_to_structure_output
+
+DEFAULT_DATASET = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "evaluation", "grounding", "data",
+    "ScreenSpot_V2_data", "screenspot_mobile_v2_convert.json",
+)
+
+
+def make_agent(mode, args):
+    return MAIUINaivigationAgent(
+        args.server_url or "http://localhost:8000/v1",
+        args.model_name,
+        runtime_conf={
+            "guided_decoding": None if mode == "none" else mode,
+            "max_pixels": args.max_pixels,
+            "max_tokens": args.max_tokens,
+            "retry_policy": {"max_attempts": 1},
+        },
+    )
+
+
+def run_sample(agent, case, image_root):
+    agent.reset()
+    screenshot = Image.open(os.path.join(image_root, case["img_filename"])).convert("RGB")
+    messages, _ = agent._prepare_request(case["instruction"], {"screenshot": screenshot})
+    kwargs = agent._completion_kwargs(messages)
+    start = time.perf_counter()
+    response = agent.llm.chat.completions.create(**kwargs)
+    latency = time.perf_counter() - start
+    choice = response.choices[0]
+    try:
+        parse_action_to_structure_output(choice.message.content)
+        failed = False
+    except (ValueError, KeyError, TypeError):
+        failed = True
+    return {
+        "parse_failure": failed,
+        "truncated": choice.finish_reason == "length",
+        "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+        "latency_s": latency,
+    }
+
+
+def summarize(mode, results):
+    n = len(results)
+    return {
+        "mode": mode,
+        "samples": n,
+        "parse_failure_rate": sum(r["parse_failure"] for r in results) / n,
+        "truncated_rate": sum(r["truncated"] for r in results) / n,
+        "completion_tokens": sum(r["completion_tokens"] for r in results) / n,
+        "latency_s": sum(r["latency_s"] for r in results) / n,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark guided decoding of the action space.")
+    parser.add_argument("--server_url", type=str, default=None, help="vLLM base URL")
+    parser.add_argument("--model_name", type=str, default="MAI-UI-8B", help="Model name served by vLLM (default: MAI-UI-8B)")
+    parser.add_argument("--dataset", type=str, default=DEFAULT_DATASET, help="Grounding dataset JSON (default: ScreenSpot-v2 mobile)")
+    parser.add_argument("--image_root", type=str, default=None, help="Directory of the dataset screenshots")
+    parser.add_argument("--num_samples", type=int, default=200, help="Samples to send per mode (default: 200)")
+    parser.add_argument("--modes", type=str, nargs="+", default=["none", "regex", "structural_tag"], help="Modes to compare")
+    parser.add_argument("--max_pixels", type=int, default=None, help="max_pixels of the agent (default: native resolution)")
+    parser.add_argument("--max_tokens", type=int, default=2048, help="max_tokens of the agent (default: 2048)")
+    parser.add_argument("--dry_run", action="store_true", help="Only print the size of the derived constraints")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        if mode != "none":
+            body = make_agent(mode, args).guided_extra_body
+            print(f"{mode:16} constraint: {len(json.dumps(body))} bytes")
+    if args.dry_run:
+        sys.exit(0)
+    if not args.server_url or not args.image_root:
+        parser.error("--server_url and --image_root are required unless --dry_run is given")
+
+    with open(args.dataset) as f:
+        cases = json.load(f)
+    random.Random(0).shuffle(cases)
+    cases = cases[:args.num_samples]
+
+    rows = []
+    for mode in args.modes:
+        agent = make_agent(mode, args)
+        results = [run_sample(agent, case, args.image_root) for case in cases]
+        rows.append(summarize(mode, results))
+
+    print("-" * 78)
+    print(f"{'mode':16} {'n':>6} {'parse fail':>11} {'truncated':>10} {'gen tokens':>11} {'latency s':>10}")
+    for row in rows:
+        print(
+            f"{row['mode']:16} {row['samples']:6d} {row['parse_failure_rate']:11.4f} {row['truncated_rate']:10.4f} "
+            f"{row['completion_tokens']:11.1f} {row['latency_s']:10.3f}"
+        )
+    print("-" * 78)
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Report saved to {args.output_json}")
@@ -0,0 +1,161 @@
+"""
+Benchmark latency and action agreement of the thinking and no-thinking modes.
+
+Recorded episodes (trajectory archives or journals, e.g. runs of the default
+thinking agent, or human demonstrations) are replayed step by step: for every
+step the agent gets the recorded history and the step's screenshot, and its
+predicted action is compared to the recorded one. Each step is sent once per
+mode with MAIUINaivigationAgent's request settings (no retries), and the
+benchmark reports per mode:
+
+    action_match       same action type and arguments; coordinates within
+                       --coordinate_tolerance (normalized) of the recorded point
+    type_match         same action type
+    parse_failure      responses the mode's parser rejects
+    completion_tokens  mean generated tokens (from the server's usage)
+    latency            mean, p50 and p90 request latency in seconds
+
+Example:
+    python benchmark_no_thinking.py --server_url http://localhost:8000/v1 \
+        --episodes runs/*.zip --max_pixels 1003520
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mai_naivigation_agent import MAIUINaivigationAgent, parse_action_to_structure_output
+from traj_archive import read_traj_archive
+from traj_journal import JournaledTrajMemory
+from unified_memory import TrajMemory
+
+COORDINATE_FIELDS = ("coordinate", "start_coordinate", "end_coordinate")
+MODES = {"thinking": True, "no_thinking": False}
+
+
+def load_episode(path):
+    if path.endswith(".journal"):
+        return JournaledTrajMemory.recover(path)
+    return read_traj_archive(path)
+
+
+def point(values):
+    if len(values) == 4:
+        return (values[0] + values[2]) / 2, (values[1] + values[3]) / 2
+    return values[0], values[1]
+
+
+def actions_match(predicted, recorded, tolerance):
+    if predicted.get("action") != recorded.get("action"):
+        return False
+    for key in set(predicted) | set(recorded):
+        if key in COORDINATE_FIELDS:
+            if key not in predicted or key not in recorded:
+                return False
+            if math.dist(point(predicted[key]), point(recorded[key])) > tolerance:
+                return False
+        elif str(predicted.get(key, "")).strip().lower() != str(recorded.get(key, "")).strip().lower():
+            return False
+    return True
+
+
+def replay_step(agent, episode, index, tolerance):
+    steps = episode.steps
+    agent.reset()
+    agent.traj_memory = TrajMemory(task_goal=episode.task_goal, task_id=episode.task_id, steps=steps[:index])
+    messages, _ = agent._prepare_request(episode.task_goal, {"screenshot": steps[index].load_screenshot()})
+    kwargs = agent._completion_kwargs(messages)
+    start = time.perf_counter()
+    response = agent.llm.chat.completions.create(**kwargs)
+    latency = time.perf_counter() - start
+
+    recorded = steps[index].action
+    try:
+        predicted = parse_action_to_structure_output(
+            response.choices[0].message.content, require_thinking=agent.thinking
+        )["action_json"]
+        failed = False
+    except (ValueError, KeyError, TypeError):
+        predicted, failed = {}, True
+    return {
+        "parse_failure": failed,
+        "type_match": predicted.get("action") == recorded.get("action"),
+        "action_match": not failed and actions_match(predicted, recorded, tolerance),
+        "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+        "latency_s": latency,
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(mode, results):
+    n = len(results)
+    latencies = [r["latency_s"] for r in results]
+    return {
+        "mode": mode,
+        "steps": n,
+        "action_match": sum(r["action_match"] for r in results) / n,
+        "type_match": sum(r["type_match"] for r in results) / n,
+        "parse_failure": sum(r["parse_failure"] for r in results) / n,
+        "completion_tokens": sum(r["completion_tokens"] for r in results) / n,
+        "latency_mean_s": sum(latencies) / n,
+        "latency_p50_s": percentile(latencies, 0.5),
+        "latency_p90_s": percentile(latencies, 0.9),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the no-thinking mode on recorded episodes.")
+    parser.add_argument("--server_url", type=str, required=True, help="vLLM base URL")
+    parser.add_argument("--model_name", type=str, default="MAI-UI-8B", help="Model name served by vLLM (default: MAI-UI-8B)")
+    parser.add_argument("--episodes", type=str, nargs="+", required=True, help="Trajectory archives or .journal files")
+    parser.add_argument("--modes", type=str, nargs="+", default=list(MODES), choices=list(MODES), help="Modes to compare")
+    parser.add_argument("--history_n", type=int, default=3, help="history_n of the agent (default: 3)")
+    parser.add_argument("--max_pixels", type=int, default=None, help="max_pixels of the agent (default: native resolution)")
+    parser.add_argument("--coordinate_tolerance", type=float, default=0.04, help="Normalized click distance counted as a match (default: 0.04)")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    episodes = [load_episode(path) for path in args.episodes]
+    print(f"Replaying {sum(len(e.steps) for e in episodes)} steps from {len(episodes)} episodes")
+
+    rows = []
+    for mode in args.modes:
+        agent = MAIUINaivigationAgent(
+            args.server_url,
+            args.model_name,
+            runtime_conf={
+                "thinking": MODES[mode],
+                "history_n": args.history_n,
+                "max_pixels": args.max_pixels,
+                "retry_policy": {"max_attempts": 1},
+            },
+        )
+        results = [
+            replay_step(agent, episode, index, args.coordinate_tolerance)
+            for episode in episodes
+            for index in range(len(episode.steps))
+        ]
+        rows.append(summarize(mode, results))
+
+    print("-" * 90)
+    print(f"{'mode':12} {'steps':>6} {'match':>7} {'type':>7} {'parse fail':>11} {'gen tokens':>11} {'mean s':>8} {'p50 s':>7} {'p90 s':>7}")
+    for row in rows:
+        print(
+            f"{row['mode']:12} {row['steps']:6d} {row['action_match']:7.4f} {row['type_match']:7.4f} "
+            f"{row['parse_failure']:11.4f} {row['completion_tokens']:11.1f} {row['latency_mean_s']:8.3f} "
+            f"{row['latency_p50_s']:7.3f} {row['latency_p90_s']:7.3f}"
+        )
+    print("-" * 90)
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Report saved to {args.output_json}")
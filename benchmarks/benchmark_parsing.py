@@ -0,0 +1,195 @@
+"""
+Benchmark response parsing against the previous regex-based parsers.
+
+The corpus has three parts:
+    real         grounding responses recorded in evaluation/grounding/output_server
+    tool_call    well-formed navigation responses (thinking and </think> variants)
+    adversarial  ~2048-token malformed outputs: unclosed or repeated tags,
+                 long digit runs, a missing closing tag after a long thought
+
+For each part the benchmark reports the mean and worst parse time of the
+previous parsers (`.*?` DOTALL searches) and of the single-pass parsers in
+src/parsing.py, and on the real and tool_call parts how often both agree.
+
+Example:
+    python benchmark_parsing.py --max_real 2000 --repeat 3
+    python benchmark_parsing.py --save_corpus corpus.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from parsing import parse_coordinates, parse_tagged_text, split_grounding_response
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation", "grounding", "output_server")
+# About 2048 tokens of text
+ADVERSARIAL_CHARS = 8192
+
+
+def legacy_parse_tagged_text(text):
+    if "</think>" in text and "</thinking>" not in text:
+        text = text.replace("</think>", "</thinking>")
+        text = "<thinking>" + text
+    match = re.search(r"<thinking>(.*?)</thinking>.*?<tool_call>(.*?)</tool_call>", text, re.DOTALL)
+    if not match:
+        return {"thinking": None, "tool_call": None}
+    tool_call = match.group(2).strip().strip('"')
+    return {"thinking": match.group(1).strip().strip('"'), "tool_call": json.loads(tool_call) if tool_call else tool_call}
+
+
+def legacy_split_grounding_response(text):
+    think = re.search(r"<grounding_think>(.*?)</grounding_think>", text, re.DOTALL)
+    answer = re.search(r"<answer>(.*?)</answer>", text, re.DOTALL)
+    return think.group(1) if think else None, answer.group(1) if answer else None
+
+
+def legacy_parse_coordinates(raw_string):
+    matches = re.findall(r'\[(\d+),(\d+)\]', raw_string)
+    return tuple(map(int, matches[0])) if matches else (-1, -1)
+
+
+def real_corpus(max_items):
+    responses = []
+    for path in sorted(glob.glob(os.path.join(OUTPUT_DIR, "*.jsonl"))):
+        with open(path) as f:
+            for line in f:
+                response = json.loads(line).get("raw_response")
+                if response:
+                    responses.append(response)
+    random.Random(0).shuffle(responses)
+    return responses[:max_items]
+
+
+def tool_call_corpus(count):
+    rng = random.Random(1)
+    responses = []
+    for index in range(count):
+        thought = " ".join(rng.choice(["tap", "the", "settings", "icon", "scroll", "down", "to", "find"]) for _ in range(rng.randint(10, 200)))
+        call = json.dumps({"name": "mobile_use", "arguments": {"action": "click", "coordinate": [rng.randint(0, 999), rng.randint(0, 999)]}})
+        template = [
+            "<thinking>\n{t}\n</thinking>\n<tool_call>\n{c}\n</tool_call>",
+            "{t}\n</think>\n<tool_call>\n{c}\n</tool_call>",
+            "<think>{t}</think><tool_call>{c}</tool_call>",
+        ][index % 3]
+        responses.append(template.format(t=thought, c=call))
+    return responses
+
+
+def adversarial_corpus():
+    n = ADVERSARIAL_CHARS
+    call = '<tool_call>{"name":"mobile_use","arguments":{"action":"wait"}}</tool_call>'
+    return {
+        "repeated <thinking>, never closed": "<thinking>" * (n // 10),
+        "repeated </thinking>, no tool call": "<thinking>x" + "</thinking>" * (n // 11),
+        "unclosed <tool_call> openers": "<thinking>t</thinking>" + "<tool_call>" * (n // 11),
+        "long thought, missing </tool_call>": "<thinking>" + "a" * n + "</thinking><tool_call>{" + "b" * n,
+        "</think> storm": "</think>" * (n // 8) + call,
+        "unclosed <answer> openers": "<answer>" * (n // 8),
+        "unclosed <grounding_think> openers": "<grounding_think>" * (n // 17) + "<answer>[1,2]</answer>",
+        "digit runs without comma": ("[" + "1" * 60) * (n // 61),
+        "near tags": "<thinkin<tool_cal<answe" * (n // 23),
+    }
+
+
+def timed(function, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            function(text)
+        except (ValueError, json.JSONDecodeError):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def grounding_parse(text):
+    return split_grounding_response(text), parse_coordinates(text)
+
+
+def legacy_grounding_parse(text):
+    return legacy_split_grounding_response(text), legacy_parse_coordinates(text)
+
+
+def safe(function, text):
+    try:
+        return function(text)
+    except (ValueError, json.JSONDecodeError):
+        return "error"
+
+
+def report(name, items, legacy, current, repeat, check_agreement):
+    legacy_ms = [timed(legacy, text, repeat) for _, text in items]
+    current_ms = [timed(current, text, repeat) for _, text in items]
+    row = {
+        "corpus": name,
+        "responses": len(items),
+        "legacy_mean_ms": sum(legacy_ms) / len(items),
+        "legacy_max_ms": max(legacy_ms),
+        "single_pass_mean_ms": sum(current_ms) / len(items),
+        "single_pass_max_ms": max(current_ms),
+    }
+    if check_agreement:
+        row["agreement"] = sum(safe(legacy, text) == safe(current, text) for _, text in items) / len(items)
+    return row, legacy_ms, current_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-pass response parsing.")
+    parser.add_argument("--max_real", type=int, default=2000, help="Recorded grounding responses to use (default: 2000)")
+    parser.add_argument("--num_tool_calls", type=int, default=600, help="Synthetic navigation responses (default: 600)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats per response, best is kept (default: 3)")
+    parser.add_argument("--save_corpus", type=str, default=None, help="Optional path to write the corpus as JSON lines")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    real = [("real", text) for text in real_corpus(args.max_real)]
+    tool_calls = [("tool_call", text) for text in tool_call_corpus(args.num_tool_calls)]
+    adversarial = list(adversarial_corpus().items())
+
+    if args.save_corpus:
+        with open(args.save_corpus, "w") as f:
+            for kind, text in real + tool_calls + adversarial:
+                f.write(json.dumps({"kind": kind, "response": text}, ensure_ascii=False) + "\n")
+        print(f"Corpus saved to {args.save_corpus}")
+
+    rows = []
+    if real:
+        rows.append(report("real grounding", real, legacy_grounding_parse, grounding_parse, args.repeat, True)[0])
+    rows.append(report("tool_call", tool_calls, legacy_parse_tagged_text, parse_tagged_text, args.repeat, True)[0])
+
+    def parse_all(text):
+        parse_tagged_text(text) if "tool_call" in text or "think" in text else None
+        return grounding_parse(text)
+
+    def legacy_parse_all(text):
+        legacy_parse_tagged_text(text) if "tool_call" in text or "think" in text else None
+        return legacy_grounding_parse(text)
+
+    row, legacy_ms, current_ms = report("adversarial", adversarial, legacy_parse_all, parse_all, args.repeat, False)
+    rows.append(row)
+
+    print("-" * 78)
+    print(f"{'corpus':16} {'n':>6} {'legacy ms':>10} {'legacy max':>11} {'single ms':>10} {'single max':>11} {'agree':>7}")
+    for row in rows:
+        agreement = f"{row['agreement']:7.4f}" if "agreement" in row else f"{'-':>7}"
+        print(
+            f"{row['corpus']:16} {row['responses']:6d} {row['legacy_mean_ms']:10.4f} {row['legacy_max_ms']:11.3f} "
+            f"{row['single_pass_mean_ms']:10.4f} {row['single_pass_max_ms']:11.3f} {agreement}"
+        )
+    print("-" * 78)
+    print("Adversarial cases (ms, legacy -> single-pass):")
+    for (name, _), legacy, current in zip(adversarial, legacy_ms, current_ms):
+        print(f"  {name:40} {legacy:10.3f} -> {current:8.3f}")
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Report saved to {args.output_json}")
@@ -0,0 +1,150 @@
+"""
+Benchmark prefill tokens per step of the navigation agent's history layouts.
+
+The server's prefix cache only saves prefill for the part of a prompt that is
+identical to an earlier prompt. For each layout this replays a synthetic
+episode through MAIUINaivigationAgent and reports, per step, the prompt size
+and the tokens that must be prefilled after the longest prefix shared with
+the previous step's prompt (an ideal prefix cache).
+
+Token counts are estimated offline with TokenEstimator (image tokens from
+the smart_resize geometry, text tokens from --tokenizer or an
+approximation). With --server_url
+the prompts are also sent to a vLLM server (started with
+--enable-prefix-caching --enable-prompt-tokens-details) and the measured
+prompt/cached tokens are reported next to the estimate.
+
+Example:
+    python benchmark_prefix_layout.py --num_steps 20 --history_n 3 \
+        --layouts sliding chunked --max_pixels 1003520
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mai_naivigation_agent import MAIUINaivigationAgent
+from token_estimator import MESSAGE_OVERHEAD_TOKENS, TokenEstimator
+
+PREDICTION = (
+    "<thinking>\nThe target is not visible yet, scroll down to look for it.\n</thinking>\n"
+    "<tool_call>\n{\"name\":\"mobile_use\",\"arguments\":{\"action\":\"swipe\",\"direction\":\"up\","
+    "\"coordinate\":[500,500]}}\n</tool_call>"
+)
+
+
+def segments(messages, estimator):
+    """Flatten messages into (key, tokens) segments in prompt order."""
+    result = []
+    for message in messages:
+        result.append((("role", message["role"]), MESSAGE_OVERHEAD_TOKENS))
+        for item in message["content"]:
+            text_tokens, image_tokens = estimator.content_tokens(item)
+            if item["type"] == "text":
+                result.append((("text", item["text"]), text_tokens))
+            else:
+                result.append((("image", item["image_url"]["url"]), image_tokens))
+    return result
+
+
+def shared_prefix_tokens(previous, current, estimator):
+    shared = 0
+    for (prev_key, prev_tokens), (key, tokens) in zip(previous, current):
+        if prev_key == key:
+            shared += tokens
+            continue
+        if prev_key[0] == key[0] == "text":
+            shared += estimator.text_tokens(os.path.commonprefix([prev_key[1], key[1]]))
+        break
+    return shared
+
+
+def make_screenshot(step, width, height):
+    """Distinct solid-colour screenshot per step (kept lossless by PNG)."""
+    return Image.new("RGB", (width, height), ((step * 37) % 256, (step * 91) % 256, (step * 53) % 256))
+
+
+def run_layout(layout, args, estimator):
+    runtime_conf = {
+        "history_n": args.history_n,
+        "history_layout": layout,
+        "image_chunk": args.image_chunk,
+        "max_pixels": args.max_pixels,
+    }
+    agent = MAIUINaivigationAgent(args.server_url or "http://localhost:8000/v1", args.model_name, runtime_conf)
+    parsed = agent._parse_prediction(PREDICTION)
+
+    rows = []
+    previous = []
+    for step in range(args.num_steps):
+        screenshot = make_screenshot(step, args.width, args.height)
+        messages, pending_step = agent._prepare_request(args.instruction, {"screenshot": screenshot})
+        current = segments(messages, estimator)
+        total = sum(tokens for _, tokens in current)
+        prefill = total - shared_prefix_tokens(previous, current, estimator)
+        row = {"step": step, "prompt_tokens": total, "prefill_tokens": prefill}
+
+        if args.server_url:
+            response = agent.llm.chat.completions.create(
+                model=args.model_name, messages=messages, max_tokens=1, temperature=0.0
+            )
+            usage = response.usage
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) or 0
+            row["server_prompt_tokens"] = usage.prompt_tokens
+            row["server_prefill_tokens"] = usage.prompt_tokens - cached
+
+        rows.append(row)
+        previous = current
+        agent._record_step(pending_step, PREDICTION, parsed)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prefill tokens per step of history layouts.")
+    parser.add_argument("--layouts", type=str, nargs="+", default=["sliding", "chunked"], help="Layouts to compare")
+    parser.add_argument("--num_steps", type=int, default=20, help="Episode length (default: 20)")
+    parser.add_argument("--history_n", type=int, default=3, help="history_n of the agent (default: 3)")
+    parser.add_argument("--image_chunk", type=int, default=None, help="image_chunk of the chunked layout (default: history_n - 1)")
+    parser.add_argument("--width", type=int, default=1080, help="Screenshot width (default: 1080)")
+    parser.add_argument("--height", type=int, default=2400, help="Screenshot height (default: 2400)")
+    parser.add_argument("--max_pixels", type=int, default=None, help="max_pixels of the agent (default: native resolution)")
+    parser.add_argument("--tokenizer", type=str, default=None, help="Hugging Face tokenizer for text tokens (default: approximate)")
+    parser.add_argument("--instruction", type=str, default="Open the settings app and turn on dark mode.")
+    parser.add_argument("--server_url", type=str, default=None, help="Optional vLLM base URL to measure cached tokens")
+    parser.add_argument("--model_name", type=str, default="MAI-UI-8B", help="Model name served by vLLM (default: MAI-UI-8B)")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump per-step results as JSON")
+    args = parser.parse_args()
+
+    estimator = TokenEstimator(args.tokenizer)
+    print(f"Estimated {estimator.image_tokens(args.width, args.height)} tokens per native-resolution screenshot")
+
+    report = {}
+    for layout in args.layouts:
+        start = time.perf_counter()
+        report[layout] = run_layout(layout, args, estimator)
+        print(f"{layout}: replayed {args.num_steps} steps in {time.perf_counter() - start:.2f}s")
+
+    print("-" * 72)
+    header = f"{'layout':10} {'prompt/step':>12} {'prefill/step':>13} {'prefill total':>14}"
+    if args.server_url:
+        header += f" {'server prefill/step':>20}"
+    print(header)
+    for layout, rows in report.items():
+        prompt = sum(r["prompt_tokens"] for r in rows) / len(rows)
+        prefill = sum(r["prefill_tokens"] for r in rows)
+        line = f"{layout:10} {prompt:12.0f} {prefill / len(rows):13.0f} {prefill:14d}"
+        if args.server_url:
+            server = sum(r["server_prefill_tokens"] for r in rows) / len(rows)
+            line += f" {server:20.0f}"
+        print(line)
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output_json}")
@@ -0,0 +1,137 @@
+"""
+Calibrate the near-duplicate instruction cache on the bundled grounding datasets.
+
+Several datasets ground many instructions on the same screenshot, and some
+phrase the same element in several ways: UI-Vision has basic, functional
+and spatial instructions per element, and OSWorld-G has the original and
+the refined instruction. Per dataset, all instructions are replayed in a
+random order through a SemanticCache that stores each instruction's
+ground-truth box center as its "result". For every query the most similar
+earlier instruction on the same screenshot is looked up, and the query
+counts as:
+
+    exact     the same normalized instruction was cached before (the exact
+              cache would answer it)
+    hit       otherwise, similarity >= threshold
+    correct   a hit whose cached point lies inside the query's ground-truth
+              box, i.e. the returned coordinate would be right
+
+For each threshold the benchmark reports the hit rate (hits / non-exact
+queries) and precision (correct / hits). No model is called.
+
+Example:
+    python benchmark_semantic_cache.py --thresholds 0.6 0.7 0.8 0.9
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from semantic_cache import SemanticCache, SemanticCacheConfig, normalize_instruction
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation", "grounding", "data")
+
+
+# Dataset folders annotating the same screenshots
+MERGED_DATASETS = {"OS_G_Refine_data": "OS_G_data"}
+
+
+def load_datasets(data_dir):
+    datasets = {}
+    for directory in sorted(glob.glob(os.path.join(data_dir, "*"))):
+        name = os.path.basename(directory)
+        name = MERGED_DATASETS.get(name, name)
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            with open(path) as f:
+                datasets.setdefault(name, []).extend(json.load(f))
+    return datasets
+
+
+def center(bbox):
+    return (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+
+
+def inside(point, bbox):
+    return bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3]
+
+
+def replay(cases, config, seed):
+    """Return (exact, [(best similarity, correct)]) for one dataset."""
+    cases = list(cases)
+    random.Random(seed).shuffle(cases)
+    cache = SemanticCache(config)
+    seen = set()
+    exact = 0
+    scored = []
+    for case in cases:
+        screen = case["img_filename"]
+        text = normalize_instruction(case["instruction"])
+        if (screen, text) in seen:
+            exact += 1
+            continue
+        best = cache.match(screen, case["instruction"])
+        if best is not None:
+            score, _, (_, cached) = best
+            scored.append((score, inside(cached["point"], case["bbox"])))
+        cache.put(screen, case["instruction"], "", {"point": center(case["bbox"])})
+        seen.add((screen, text))
+    return exact, scored
+
+
+def sweep(name, exact, scored, queries, thresholds):
+    rows = []
+    for threshold in thresholds:
+        hits = [correct for score, correct in scored if score >= threshold]
+        rows.append({
+            "dataset": name,
+            "threshold": threshold,
+            "queries": queries,
+            "exact": exact,
+            "hit_rate": len(hits) / max(1, queries - exact),
+            "precision": sum(hits) / len(hits) if hits else float("nan"),
+            "hits": len(hits),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the semantic grounding cache threshold.")
+    parser.add_argument("--data_dir", type=str, default=DATA_DIR, help="Directory of grounding dataset folders")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95])
+    parser.add_argument("--seed", type=int, default=0, help="Shuffle seed of the query order (default: 0)")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    config = SemanticCacheConfig(max_screens=100000)
+    datasets = load_datasets(args.data_dir)
+    rows = []
+    all_scored, all_exact, all_queries = [], 0, 0
+    start = time.perf_counter()
+    for name, cases in datasets.items():
+        exact, scored = replay(cases, config, args.seed)
+        rows.extend(sweep(name, exact, scored, len(cases), args.thresholds))
+        all_scored.extend(scored)
+        all_exact += exact
+        all_queries += len(cases)
+    rows.extend(sweep("all", all_exact, all_scored, all_queries, args.thresholds))
+    elapsed = time.perf_counter() - start
+
+    print("-" * 78)
+    print(f"{'dataset':22} {'threshold':>9} {'queries':>8} {'exact':>6} {'hits':>6} {'hit rate':>9} {'precision':>10}")
+    for row in rows:
+        print(
+            f"{row['dataset']:22} {row['threshold']:9.2f} {row['queries']:8d} {row['exact']:6d} "
+            f"{row['hits']:6d} {row['hit_rate']:9.4f} {row['precision']:10.4f}"
+        )
+    print("-" * 78)
+    print(f"Replayed {all_queries} instructions in {elapsed:.1f}s ({1000 * elapsed / max(1, all_queries):.3f} ms each)")
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Report saved to {args.output_json}")
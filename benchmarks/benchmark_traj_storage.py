@@ -0,0 +1,168 @@
+"""
+Benchmark trajectory storage codecs.
+
+Every episode is written as a trajectory archive with the "png" codec (one
+PNG per distinct screenshot) and the "delta" codec (keyframes plus changed
+rectangles), and the benchmark reports archive size, compression ratio,
+write time and the time to restore a randomly chosen step.
+
+An episode is a directory of screenshots (replayed in file name order) or an
+existing trajectory archive. Without --episodes, synthetic episodes that
+change small screen regions step by step are generated.
+
+Example:
+    python benchmark_traj_storage.py --episodes runs/episode_0 runs/episode_1.zip
+    python benchmark_traj_storage.py --synthetic 5 --num_steps 30
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from traj_archive import read_traj_archive, write_traj_archive
+from unified_memory import TrajMemory, TrajStep
+from utils import safe_pil_to_bytes
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def make_step(index, screenshot_bytes):
+    return TrajStep(
+        screenshot=None,
+        accessibility_tree=None,
+        prediction="",
+        action={},
+        conclusion="",
+        thought="",
+        step_index=index,
+        agent_type="MAIMobileAgent",
+        model_name="",
+        screenshot_bytes=screenshot_bytes,
+    )
+
+
+def load_episode(path):
+    if os.path.isdir(path):
+        files = sorted(
+            f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        steps = []
+        for index, file in enumerate(files):
+            with Image.open(file) as image:
+                steps.append(make_step(index, safe_pil_to_bytes(image.convert("RGB"))))
+        return TrajMemory(task_goal="", task_id=os.path.basename(path), steps=steps)
+    memory = read_traj_archive(path)
+    for step in memory.steps:
+        step.screenshot_bytes = step.load_screenshot_bytes()
+    return memory
+
+
+def synthetic_episode(seed, num_steps, width, height):
+    """Phone-like screens where each step types a character, toggles or scrolls."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 120):
+        draw.rectangle((40, row + 20, width - 40, row + 100), fill=(rng.randint(180, 255), 230, 230))
+        draw.text((60, row + 50), f"Item {row // 120}", fill=(20, 20, 20))
+
+    steps = []
+    for index in range(num_steps):
+        event = rng.random()
+        if event < 0.1:
+            # Navigation: a completely different screen
+            image = Image.new("RGB", (width, height), tuple(rng.randint(150, 255) for _ in range(3)))
+            draw = ImageDraw.Draw(image)
+        elif event < 0.6:
+            draw.text((60 + 12 * index % (width - 120), 60), chr(65 + index % 26), fill=(0, 0, 0))
+        else:
+            x, y = rng.randrange(0, width - 120), rng.randrange(0, height - 60)
+            draw.rectangle((x, y, x + 120, y + 60), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        draw.text((width - 100, 10), f"12:{index:02d}", fill=(0, 0, 0))
+        steps.append(make_step(index, safe_pil_to_bytes(image)))
+    return TrajMemory(task_goal="", task_id=f"synthetic-{seed}", steps=steps)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(memory, codec, args, workdir):
+    path = os.path.join(workdir, f"{memory.task_id}-{codec}.zip")
+    start = time.perf_counter()
+    write_traj_archive(memory, path, codec=codec, max_delta_ratio=args.max_delta_ratio, delta_tile=args.tile)
+    write_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    decode_ms = []
+    for _ in range(args.random_reads):
+        # A fresh reader per read, so no keyframe is served from a warm cache
+        loaded = read_traj_archive(path)
+        step = rng.choice(loaded.steps)
+        start = time.perf_counter()
+        step.load_screenshot().load()
+        decode_ms.append((time.perf_counter() - start) * 1000)
+    return {"bytes": os.path.getsize(path), "write_s": write_s, "decode_ms": decode_ms}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare png and delta trajectory storage.")
+    parser.add_argument("--episodes", type=str, nargs="*", default=[], help="Screenshot directories or trajectory archives")
+    parser.add_argument("--synthetic", type=int, default=3, help="Synthetic episodes used when --episodes is empty (default: 3)")
+    parser.add_argument("--num_steps", type=int, default=30, help="Steps per synthetic episode (default: 30)")
+    parser.add_argument("--width", type=int, default=1080, help="Synthetic screenshot width (default: 1080)")
+    parser.add_argument("--height", type=int, default=2400, help="Synthetic screenshot height (default: 2400)")
+    parser.add_argument("--max_delta_ratio", type=float, default=0.3, help="Changed area above which a keyframe is stored (default: 0.3)")
+    parser.add_argument("--tile", type=int, default=32, help="Delta grid cell size in pixels (default: 32)")
+    parser.add_argument("--random_reads", type=int, default=50, help="Random step restores per episode (default: 50)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--output_json", type=str, default=None, help="Optional path to dump the report as JSON")
+    args = parser.parse_args()
+
+    if args.episodes:
+        episodes = [load_episode(path) for path in args.episodes]
+    else:
+        episodes = [synthetic_episode(seed, args.num_steps, args.width, args.height) for seed in range(args.synthetic)]
+    print(f"Loaded {len(episodes)} episodes, {sum(len(e.steps) for e in episodes)} steps")
+
+    totals = {codec: {"bytes": 0, "write_s": 0.0, "decode_ms": []} for codec in ("png", "delta")}
+    with tempfile.TemporaryDirectory() as workdir:
+        for memory in episodes:
+            for codec, total in totals.items():
+                result = measure(memory, codec, args, workdir)
+                total["bytes"] += result["bytes"]
+                total["write_s"] += result["write_s"]
+                total["decode_ms"].extend(result["decode_ms"])
+
+    report = []
+    for codec, total in totals.items():
+        report.append({
+            "codec": codec,
+            "megabytes": total["bytes"] / 1024 / 1024,
+            "ratio_vs_png": totals["png"]["bytes"] / total["bytes"],
+            "write_s": total["write_s"],
+            "decode_ms_mean": sum(total["decode_ms"]) / len(total["decode_ms"]),
+            "decode_ms_p95": percentile(total["decode_ms"], 0.95),
+        })
+
+    print("-" * 72)
+    print(f"{'codec':8} {'size MB':>10} {'ratio':>7} {'write s':>9} {'decode ms':>10} {'p95 ms':>8}")
+    for row in report:
+        print(
+            f"{row['codec']:8} {row['megabytes']:10.2f} {row['ratio_vs_png']:7.2f} {row['write_s']:9.2f} "
+            f"{row['decode_ms_mean']:10.2f} {row['decode_ms_p95']:8.2f}"
+        )
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output_json}")
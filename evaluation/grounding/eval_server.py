@@ -1,17 +1,22 @@
 import os
+import sys
 import json
-import base64
-import re
 import threading
 import argparse
 import glob
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from io import BytesIO
 from PIL import Image
-from openai import OpenAI
+from openai import DEFAULT_MAX_RETRIES
 from qwen_vl_utils import smart_resize
 from collections import defaultdict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+from endpoints import EndpointPool, EndpointPoolConfig, RoutedClient
+from llm_client import ClientPoolConfig, get_client
+from parsing import parse_coordinates
+from token_estimator import TokenEstimator
+from utils import IMAGE_MIME_TYPES, ImageCodec
+
 try:
     from tqdm import tqdm
 except ImportError:
@@ -32,21 +37,12 @@ Return a json object with a reasoning process in <grounding_think></grounding_th
 
 file_write_lock = threading.Lock()
 
-def parse_coordinates(raw_string):
-    matches = re.findall(r'\[(\d+),(\d+)\]', raw_string)
-    matches = [tuple(map(int, match)) for match in matches]
-    if len(matches) == 0:
-        return -1, -1
-    else:
-        return matches[0]
-
-def pil_to_base64(screenshot_path):
+def load_resized_image(screenshot_path):
     try:
         image = Image.open(screenshot_path).convert('RGB')
     except FileNotFoundError:
         return None, 0, 0
     
-    buffer = BytesIO()
     ori_width = image.width
     ori_height = image.height
     
@@ -58,35 +54,41 @@ def pil_to_base64(screenshot_path):
         max_pixels=6553600,
     )
     resized_image = image.resize((resized_width, resized_height))
-    resized_image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode("utf-8"), ori_width, ori_height
+    return resized_image, ori_width, ori_height
 
-def process_case(case, image_root, output_file, client, model_name):
+def pil_to_data_url(screenshot_path, image_codec):
+    resized_image, ori_width, ori_height = load_resized_image(screenshot_path)
+    if resized_image is None:
+        return None, 0, 0
+    return image_codec.to_data_url(resized_image), ori_width, ori_height
+
+def process_case(case, image_root, output_file, client, model_name, image_codec=None, token_estimator=None):
     try:
         image_path = os.path.join(image_root, case['img_filename'])
-        base64_img, ori_width, ori_height = pil_to_base64(image_path)
+        image_url, ori_width, ori_height = pil_to_data_url(image_path, image_codec or ImageCodec())
         
-        if base64_img is None:
+        if image_url is None:
             print(f"Image not found: {image_path}")
             return
 
+        messages = [
+            {   
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": SYSTEM_PROMPT}
+                ]
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": case['instruction'] + "\n"},
+                    {"type": "image_url", "image_url": {"url": image_url}},
+                ],
+            },
+        ]
         completion = client.chat.completions.create(
             model=model_name, 
-            messages=[
-                {   
-                    "role": "system",
-                    "content": [
-                        {"type": "text", "text": SYSTEM_PROMPT}
-                    ]
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": case['instruction'] + "\n"},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_img}"}},
-                    ],
-                },
-            ],
+            messages=messages,
             temperature=0.0,
             max_tokens=256,
         )
@@ -108,6 +110,11 @@ def process_case(case, image_root, output_file, client, model_name):
         result['raw_response'] = response_content
         result['pred'] = [abs_x, abs_y] if abs_x is not None else None
         result['pred_norm'] = [norm_x, norm_y] if norm_x is not None else None  
+        if token_estimator is not None:
+            result['estimated_prompt_tokens'] = token_estimator.estimate(messages).total
+        usage = getattr(completion, 'usage', None)
+        if usage is not None:
+            result['prompt_tokens'] = usage.prompt_tokens
         
         if norm_x is None or norm_y is None:
             result['correctness'] = 'wrong_format'
@@ -148,21 +155,63 @@ if __name__ == "__main__":
     # Server configuration arguments
     parser.add_argument("--server_ip", type=str, default="localhost", help="VLLM server IP address (default: localhost)")
     parser.add_argument("--server_port", type=int, default=8001, help="VLLM server port (default: 8001)")
+    parser.add_argument("--server_urls", type=str, nargs="+", default=None,
+                        help="Base URLs of several VLLM replicas, e.g. http://host1:8001/v1 http://host2:8001/v1; "
+                             "overrides --server_ip/--server_port and routes each request to the least busy replica")
+    parser.add_argument("--health_check_interval", type=float, default=10.0,
+                        help="Seconds between replica health checks with --server_urls, 0 disables them (default: 10)")
     parser.add_argument("--model_name", type=str, default="MAI-UI-8B", help="Model name served by VLLM (default: MAI-UI-8B)")
     parser.add_argument("--api_key", type=str, default="EMPTY", help="API Key for VLLM server (default: EMPTY)")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="Hugging Face tokenizer name/path for the per-sample prompt token estimate (default: approximate text tokens)")
     
     # Performance arguments
     parser.add_argument("--num_workers", type=int, default=16, help="Number of concurrent workers (default: 16)")
+    parser.add_argument("--max_connections", type=int, default=None, help="HTTP connection pool size shared by all workers (default: num_workers)")
+    parser.add_argument("--keepalive_expiry", type=float, default=30.0, help="Seconds an idle keep-alive connection is kept open (default: 30)")
+    parser.add_argument("--http2", action="store_true", help="Use HTTP/2 for the server connection (falls back to HTTP/1.1 without the h2 package)")
+
+    # Image wire codec arguments
+    parser.add_argument("--image_format", type=str, default="png", choices=sorted(IMAGE_MIME_TYPES), help="Image wire format (default: png)")
+    parser.add_argument("--image_quality", type=int, default=None, help="Quality for jpeg/webp (default: Pillow default)")
+    parser.add_argument("--image_compress_level", type=int, default=None, help="zlib compress level 0-9 for png (default: Pillow default)")
     
     args = parser.parse_args()
 
-    vllm_base_url = f"http://{args.server_ip}:{args.server_port}/v1"
+    image_codec = ImageCodec(
+        format=args.image_format,
+        quality=args.image_quality,
+        compress_level=args.image_compress_level,
+    )
+
+    vllm_base_urls = args.server_urls or [f"http://{args.server_ip}:{args.server_port}/v1"]
 
-    client = OpenAI(
-        api_key=args.api_key,
-        base_url=vllm_base_url,
+    # One client, and therefore one warm connection pool, is shared by all
+    # workers; size the pool so no worker waits for a free connection.
+    max_connections = args.max_connections or args.num_workers
+    client_pool = ClientPoolConfig(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=args.keepalive_expiry,
+        http2=args.http2,
     )
 
+    def make_client(base_url):
+        # Built like the agents' shared clients (HTTP/1.1 fallback without
+        # h2), keeping the SDK's own retries of this script
+        client = get_client(base_url, api_key=args.api_key, pool=client_pool)
+        return client.with_options(max_retries=DEFAULT_MAX_RETRIES)
+
+    if len(vllm_base_urls) == 1:
+        client = make_client(vllm_base_urls[0])
+    else:
+        endpoint_pool = EndpointPool(
+            vllm_base_urls, EndpointPoolConfig(health_check_interval=args.health_check_interval)
+        )
+        endpoint_pool.start_health_checks()
+        client = RoutedClient(endpoint_pool, {url: make_client(url) for url in vllm_base_urls})
+        print(f"Routing over {len(vllm_base_urls)} replicas: {', '.join(vllm_base_urls)}")
+
     output_dir = os.path.dirname(args.output_file)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -177,15 +226,19 @@ if __name__ == "__main__":
         print(f"No JSON files found in {args.dataset_dir}")
         exit(1)
 
-    print(f"Connecting to VLLM server: {vllm_base_url}")
+    print(f"Connecting to VLLM server: {', '.join(vllm_base_urls)}")
     print(f"Using model: {args.model_name}")
     print(f"Image Root: {args.image_root}")
     print(f"Dataset Directory: {args.dataset_dir}")
     print(f"Output File: {args.output_file}")
     print(f"Found {len(json_files)} dataset files.")
     print(f"Concurrent workers: {args.num_workers}")
+    print(f"Image codec: {image_codec}")
     print("-" * 60)
 
+    # Images are already resized to max_pixels=6553600 by load_resized_image
+    token_estimator = TokenEstimator(args.tokenizer, max_pixels=6553600)
+
     all_tasks = []
 
     for json_file in json_files:
@@ -216,7 +269,9 @@ if __name__ == "__main__":
                 task["image_root"], 
                 task["output_file"], 
                 client, 
-                args.model_name
+                args.model_name,
+                image_codec,
+                token_estimator
             ) for task in all_tasks
         ]
         
@@ -228,6 +283,8 @@ if __name__ == "__main__":
     stats = defaultdict(lambda: {'total': 0, 'correct': 0})
     total_samples = 0
     total_correct = 0
+    estimated_tokens = []
+    measured_tokens = []
 
     if os.path.exists(args.output_file):
         with open(args.output_file, 'r') as f:
@@ -242,6 +299,10 @@ if __name__ == "__main__":
                     if result.get('correctness') == 'correct':
                         stats[source]['correct'] += 1
                         total_correct += 1
+                    if 'estimated_prompt_tokens' in result:
+                        estimated_tokens.append(result['estimated_prompt_tokens'])
+                    if 'prompt_tokens' in result:
+                        measured_tokens.append(result['prompt_tokens'])
                 except json.JSONDecodeError:
                     continue
         
@@ -261,6 +322,10 @@ if __name__ == "__main__":
             print(f"Total Samples: {total_samples}")
             print(f"Total Correct: {total_correct}")
             print(f"Overall Accuracy: {total_acc_rate:.4f}")
+            if estimated_tokens:
+                print(f"Estimated Prompt Tokens/Sample: {sum(estimated_tokens) / len(estimated_tokens):.1f}")
+            if measured_tokens:
+                print(f"Server Prompt Tokens/Sample: {sum(measured_tokens) / len(measured_tokens):.1f}")
         else:
             print("No valid results found in output file.")
             
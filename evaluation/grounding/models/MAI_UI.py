@@ -1,23 +1,18 @@
 import torch
 from transformers import AutoProcessor
-import re
 import os
+import sys
 from PIL import Image
 from tqdm import tqdm
 from qwen_vl_utils import process_vision_info, smart_resize
 import multiprocessing as mp
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "src"))
+from parsing import parse_coordinates
+
 mp.set_start_method('spawn', force=True)
 os.environ["VLLM_WORKER_MULTIPROC_METHOD"] = "spawn"
 
-def parse_coordinates(raw_string):
-    matches = re.findall(r'\[(\d+),(\d+)\]', raw_string)
-    matches = [tuple(map(int, match)) for match in matches]
-    if len(matches) == 0:
-        return -1, -1
-    else:
-        return matches[0]
-
 def get_qwen3_vl_prompt_msg(image, instruction):
     messages = [
         {
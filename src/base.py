@@ -16,6 +16,7 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Tuple
 
+from traj_archive import read_traj_archive, write_traj_archive
 from unified_memory import TrajMemory, TrajStep
 
 
@@ -55,7 +56,7 @@ class BaseAgent(ABC):
         """Return list of observations from trajectory memory."""
         return [
             {
-                "screenshot": step.screenshot_bytes,
+                "screenshot": step.load_screenshot_bytes(),
                 "accessibility_tree": step.accessibility_tree,
             }
             for step in self.traj_memory.steps
@@ -64,7 +65,7 @@ class BaseAgent(ABC):
     @property
     def history_images(self) -> List[bytes]:
         """Return list of screenshot bytes from trajectory memory."""
-        return [step.screenshot_bytes for step in self.traj_memory.steps]
+        return [step.load_screenshot_bytes() for step in self.traj_memory.steps]
 
     @property
     def history_responses(self) -> List[str]:
@@ -118,7 +119,7 @@ class BaseAgent(ABC):
         steps_data = []
         for step in self.traj_memory.steps:
             step_dict = {
-                "screenshot_bytes": step.screenshot_bytes,
+                "screenshot_bytes": step.load_screenshot_bytes(),
                 "accessibility_tree": step.accessibility_tree,
                 "prediction": step.prediction,
                 "action": step.action,
@@ -135,3 +136,27 @@ class BaseAgent(ABC):
             "task_id": self.traj_memory.task_id,
             "steps": steps_data,
         }
+
+    def save_traj_archive(self, path: str, **kwargs: Any) -> None:
+        """
+        Save current trajectory to a compact archive file.
+
+        Unlike `save_traj`, screenshots are stored as raw, deduplicated
+        archive members and written one step at a time (see traj_archive).
+
+        Args:
+            path: Archive file path.
+            **kwargs: Codec options of TrajArchiveWriter, e.g. codec="delta".
+        """
+        write_traj_archive(self.traj_memory, path, **kwargs)
+
+    def load_traj_archive(self, path: str) -> None:
+        """
+        Load trajectory from an archive written by `save_traj_archive`.
+
+        Screenshots are only read and decoded when a step's image is accessed.
+
+        Args:
+            path: Archive file path.
+        """
+        self.load_traj(read_traj_archive(path))
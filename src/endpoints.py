@@ -0,0 +1,574 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client-side load balancing over several OpenAI-compatible endpoints.
+
+An EndpointPool routes each request to the replica with the fewest
+outstanding requests, ejects replicas that fail repeatedly or are much
+slower than their peers, and reinstates them after a cool-down once active
+health checks succeed again. Requests carrying a session key are pinned to
+one replica by consistent hashing so that the steps of an episode reuse that
+replica's prefix cache. RoutedClient exposes the pool behind the
+`client.chat.completions.create(...)` interface the agents already use.
+"""
+
+import bisect
+import hashlib
+import re
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from logging_utils import get_logger
+from retry import OVERLOAD, TRANSPORT, classify_failure
+from utils import config_from_conf
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class EndpointPoolConfig:
+    """
+    Routing and health settings of an EndpointPool.
+
+    Attributes:
+        health_check_interval: Seconds between active health checks; 0
+            disables the background checker.
+        health_check_timeout: Timeout in seconds of one health check.
+        max_failures: Consecutive request failures that eject a replica.
+        slow_factor: A replica is ejected as slow when its latency EWMA
+            exceeds this multiple of the median EWMA of the other replicas.
+        min_samples: Requests a replica must have served before it can be
+            ejected as slow.
+        eject_seconds: Minimum time an ejected replica stays out of rotation.
+        ewma_alpha: Smoothing factor of the latency EWMA.
+        affinity_vnodes: Virtual nodes per replica on the consistent-hash ring.
+        affinity_spill_outstanding: A session spills over to its next replica
+            on the ring when its pinned replica has at least this many
+            requests in flight and another replica has fewer.
+    """
+
+    health_check_interval: float = 10.0
+    health_check_timeout: float = 5.0
+    max_failures: int = 3
+    slow_factor: float = 3.0
+    min_samples: int = 5
+    eject_seconds: float = 30.0
+    ewma_alpha: float = 0.2
+    affinity_vnodes: int = 64
+    affinity_spill_outstanding: int = 8
+
+    @classmethod
+    def from_conf(cls, conf: Union["EndpointPoolConfig", Dict[str, Any], None]) -> "EndpointPoolConfig":
+        """Build a config from an EndpointPoolConfig, a dict of its fields, or None."""
+        return config_from_conf(cls, conf, "endpoint pool")
+
+
+@dataclass
+class Endpoint:
+    """
+    Routing state of one replica.
+
+    Attributes:
+        url: Base URL of the replica.
+        outstanding: Requests currently in flight.
+        latency_ewma: Exponentially weighted request latency in seconds.
+        samples: Requests completed since the replica was (re)instated.
+        consecutive_failures: Failed requests in a row.
+        healthy: Result of the last health check.
+        ejected_until: Monotonic time before which the replica is not routed to.
+        prompt_tokens: Prompt tokens reported by the server's usage blocks.
+        cached_tokens: Prompt tokens the server served from its prefix cache.
+        api_key: Bearer token sent with health checks (the API key of the
+            replica's client, see `RoutedClient`).
+    """
+
+    url: str
+    outstanding: int = 0
+    latency_ewma: Optional[float] = None
+    samples: int = 0
+    consecutive_failures: int = 0
+    healthy: bool = True
+    ejected_until: float = 0.0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    api_key: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """
+    Consistent-hash ring over replica URLs.
+
+    Adding or removing a replica only remaps the sessions that hashed to it,
+    so the other replicas keep their warm prefix caches.
+    """
+
+    def __init__(self, urls: Sequence[str], vnodes: int = 64) -> None:
+        self._ring = sorted(
+            (_hash(f"{url}#{i}"), url) for url in urls for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in self._ring]
+        self._num_urls = len(set(urls))
+
+    def preference(self, key: str) -> List[str]:
+        """Return all replica URLs in the order `key` should try them."""
+        start = bisect.bisect(self._hashes, _hash(key))
+        order: List[str] = []
+        for i in range(len(self._ring)):
+            url = self._ring[(start + i) % len(self._ring)][1]
+            if url not in order:
+                order.append(url)
+                if len(order) == self._num_urls:
+                    break
+        return order
+
+
+class EndpointPool:
+    """Least-outstanding-requests router with health checks and ejection."""
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        config: Optional[EndpointPoolConfig] = None,
+    ) -> None:
+        if not urls:
+            raise ValueError("EndpointPool requires at least one URL")
+        self.config = config or EndpointPoolConfig()
+        self.endpoints = [Endpoint(url=url) for url in urls]
+        self._by_url = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self._ring = ConsistentHashRing(self.urls, self.config.affinity_vnodes)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def _candidates(self, now: float) -> List[Endpoint]:
+        available = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        # Never fail outright: with every replica out, route to all of them
+        return available or self.endpoints
+
+    def _affine(self, key: str, now: float) -> Optional[Endpoint]:
+        """Return the replica a session is pinned to, spilling over if it is overloaded."""
+        available = [e for e in self.endpoints if e.available(now)]
+        if not available:
+            return None
+        least = min(e.outstanding for e in available)
+        for url in self._ring.preference(key):
+            endpoint = self._by_url[url]
+            if not endpoint.available(now):
+                continue
+            if endpoint.outstanding < self.config.affinity_spill_outstanding or endpoint.outstanding <= least:
+                return endpoint
+        return None
+
+    def acquire(
+        self,
+        candidates: Optional[Sequence[Endpoint]] = None,
+        session_key: Optional[str] = None,
+    ) -> Endpoint:
+        """
+        Pick a replica and count the request as outstanding on it.
+
+        Args:
+            candidates: Restrict the choice to these replicas (default: all
+                available replicas).
+            session_key: Pin the request to the replica this key hashes to,
+                unless that replica is out of rotation or overloaded.
+
+        Returns:
+            The chosen endpoint; pass it to `release` when the request ends.
+        """
+        with self._lock:
+            if session_key is not None and not candidates:
+                endpoint = self._affine(session_key, time.monotonic())
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+            pool = list(candidates) if candidates else self._candidates(time.monotonic())
+            # Rotate the start so ties are broken round-robin
+            offset = self._next % len(pool)
+            self._next += 1
+            rotated = pool[offset:] + pool[:offset]
+            endpoint = min(
+                rotated,
+                key=lambda e: (e.outstanding, e.latency_ewma or 0.0),
+            )
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: Optional[float], ok: Optional[bool]) -> None:
+        """
+        Record the outcome of a request routed to `endpoint`.
+
+        Args:
+            endpoint: Endpoint returned by `acquire`.
+            latency: Request latency in seconds (ignored for failures).
+            ok: Whether the request reached the server successfully; None
+                for an outcome that says nothing about the replica (a client
+                error, cancellation), see `release_ok`.
+        """
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if ok is None:
+                return
+            now = time.monotonic()
+            if ok is False:
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.config.max_failures:
+                    self._eject(endpoint, now, f"{endpoint.consecutive_failures} consecutive failures")
+                return
+
+            endpoint.consecutive_failures = 0
+            endpoint.samples += 1
+            if latency is not None:
+                alpha = self.config.ewma_alpha
+                endpoint.latency_ewma = (
+                    latency if endpoint.latency_ewma is None
+                    else alpha * latency + (1 - alpha) * endpoint.latency_ewma
+                )
+            if self._is_slow(endpoint, now):
+                self._eject(endpoint, now, f"latency EWMA {endpoint.latency_ewma:.2f}s")
+
+    def record_usage(self, endpoint: Endpoint, response: Any) -> None:
+        """Accumulate the prompt and prefix-cached token counts of a response."""
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+        if not isinstance(prompt_tokens, int) or not isinstance(cached_tokens, int):
+            # The server does not report prefix-cache usage
+            return
+        with self._lock:
+            endpoint.prompt_tokens += prompt_tokens
+            endpoint.cached_tokens += cached_tokens
+
+    def prefix_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-replica prefix-cache usage reported in response usage blocks.
+
+        vLLM reports `usage.prompt_tokens_details.cached_tokens` when started
+        with --enable-prompt-tokens-details; replicas that never reported it
+        have a hit rate of None.
+
+        Returns:
+            {url: {"prompt_tokens", "cached_tokens", "hit_rate"}}.
+        """
+        with self._lock:
+            return {
+                e.url: {
+                    "prompt_tokens": e.prompt_tokens,
+                    "cached_tokens": e.cached_tokens,
+                    "hit_rate": e.cached_tokens / e.prompt_tokens if e.prompt_tokens else None,
+                }
+                for e in self.endpoints
+            }
+
+    def _is_slow(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.samples < self.config.min_samples or endpoint.latency_ewma is None:
+            return False
+        peers = [
+            e.latency_ewma for e in self.endpoints
+            if e is not endpoint and e.available(now) and e.latency_ewma is not None
+        ]
+        if not peers:
+            return False
+        return endpoint.latency_ewma > self.config.slow_factor * statistics.median(peers)
+
+    def _eject(self, endpoint: Endpoint, now: float, reason: str) -> None:
+        if sum(e.available(now) for e in self.endpoints) <= 1 and endpoint.available(now):
+            # Keep the last replica in rotation; the circuit breaker handles a dead pool
+            return
+        logger.warning("Ejecting endpoint %s for %.0fs: %s", endpoint.url, self.config.eject_seconds, reason)
+        endpoint.ejected_until = now + self.config.eject_seconds
+        endpoint.latency_ewma = None
+        endpoint.samples = 0
+        endpoint.consecutive_failures = 0
+
+    @contextmanager
+    def lease(
+        self,
+        candidates: Optional[Sequence[Endpoint]] = None,
+        session_key: Optional[str] = None,
+    ) -> Iterator[Endpoint]:
+        """Context manager around `acquire`/`release` that times the request."""
+        endpoint = self.acquire(candidates, session_key)
+        start = time.perf_counter()
+        try:
+            yield endpoint
+        except BaseException as e:
+            self.release(endpoint, None, ok=release_ok(e))
+            raise
+        self.release(endpoint, time.perf_counter() - start, ok=True)
+
+    def check_health(self) -> None:
+        """Probe every replica once via GET {url}/models."""
+        for endpoint in self.endpoints:
+            headers = {"Authorization": f"Bearer {endpoint.api_key}"} if endpoint.api_key else None
+            try:
+                response = httpx.get(
+                    endpoint.url.rstrip("/") + "/models",
+                    headers=headers,
+                    timeout=self.config.health_check_timeout,
+                )
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            with self._lock:
+                if healthy != endpoint.healthy:
+                    logger.warning(
+                        "Endpoint %s is %s", endpoint.url, "healthy again" if healthy else "unhealthy"
+                    )
+                endpoint.healthy = healthy
+
+    def start_health_checks(self) -> None:
+        """Start the background health checker (idempotent)."""
+        if self.config.health_check_interval <= 0 or self._health_thread is not None:
+            return
+
+        def run() -> None:
+            while not self._stop.wait(self.config.health_check_interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=run, name="endpoint-health", daemon=True)
+        self._health_thread.start()
+
+    def stop_health_checks(self) -> None:
+        self._stop.set()
+
+
+def release_ok(error: BaseException) -> Optional[bool]:
+    """
+    The `ok` to release an endpoint with after a request raised `error`.
+
+    Returns:
+        False for transport errors, timeouts, 5xx and 429 responses, which
+        count towards ejecting the replica; None (neutral) for client
+        errors such as a 400 on an over-long prompt, and for cancellation.
+    """
+    if isinstance(error, Exception) and classify_failure(error) in (TRANSPORT, OVERLOAD):
+        return False
+    return None
+
+
+def normalize_urls(base_url: Union[str, Sequence[str]]) -> List[str]:
+    """Return `base_url` (one URL or a list of replica URLs) as a list."""
+    urls = [base_url] if isinstance(base_url, str) else list(base_url)
+    if not urls:
+        raise ValueError("At least one base URL is required")
+    return urls
+
+
+_pools: Dict[Tuple[str, ...], EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(
+    urls: Sequence[str],
+    config: Union[EndpointPoolConfig, Dict[str, Any], None] = None,
+) -> EndpointPool:
+    """
+    Return the process-wide pool for a set of replica URLs.
+
+    Outstanding-request counts are only meaningful when every agent talking
+    to the same replicas shares one pool, so pools are keyed by their URLs.
+    The config of the first caller wins.
+    """
+    key = tuple(urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = EndpointPool(urls, EndpointPoolConfig.from_conf(config))
+            pool.start_health_checks()
+            _pools[key] = pool
+        return pool
+
+
+_METRIC_RE = re.compile(r"^(vllm:[a-z_]+?)(?:_total)?(?:\{[^}]*\})?\s+([0-9.eE+-]+)$", re.MULTILINE)
+
+
+def scrape_prefix_cache_hit_rate(base_url: str, timeout: float = 5.0) -> Optional[float]:
+    """
+    Read the prefix-cache hit rate from a vLLM server's Prometheus metrics.
+
+    Uses the prefix_cache_hits/prefix_cache_queries counters of recent vLLM
+    versions and falls back to the older gpu_prefix_cache_hit_rate gauge.
+
+    Args:
+        base_url: OpenAI base URL of the server, e.g. "http://host:8000/v1";
+            metrics are read from /metrics at the server root.
+        timeout: Request timeout in seconds.
+
+    Returns:
+        Hit rate in [0, 1], or None if the server does not expose it.
+    """
+    root = re.sub(r"/v1/?$", "", base_url.rstrip("/"))
+    try:
+        response = httpx.get(root + "/metrics", timeout=timeout)
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+
+    values: Dict[str, float] = {}
+    for name, value in _METRIC_RE.findall(response.text):
+        values[name] = values.get(name, 0.0) + float(value)
+    queries = values.get("vllm:prefix_cache_queries")
+    if queries:
+        return values.get("vllm:prefix_cache_hits", 0.0) / queries
+    return values.get("vllm:gpu_prefix_cache_hit_rate")
+
+
+class _LeasedStream:
+    """Stream wrapper that keeps the endpoint leased until the stream ends."""
+
+    def __init__(self, stream: Any, on_close: Callable[[Optional[bool]], None]) -> None:
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def _finish(self, ok: Optional[bool]) -> None:
+        if not self._closed:
+            self._closed = True
+            self._on_close(ok)
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            yield from self._stream
+        except BaseException as e:
+            self._finish(release_ok(e))
+            raise
+        self._finish(True)
+
+    async def __aiter__(self) -> Any:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except BaseException as e:
+            self._finish(release_ok(e))
+            raise
+        self._finish(True)
+
+    def close(self) -> Any:
+        self._finish(True)
+        return self._stream.close()
+
+
+class _RoutedCompletions:
+    def __init__(self, routed: "RoutedClient") -> None:
+        self._routed = routed
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._routed._create(**kwargs)
+
+
+class _RoutedChat:
+    def __init__(self, routed: "RoutedClient") -> None:
+        self.completions = _RoutedCompletions(routed)
+
+
+class RoutedClient:
+    """
+    Drop-in replacement for an OpenAI client that routes over an EndpointPool.
+
+    Only `chat.completions.create` is routed. Streams keep their endpoint
+    leased until they are exhausted or closed. Only transport errors,
+    timeouts, 5xx and 429 responses count as replica failures, and the
+    pool's health checks use the clients' API keys.
+
+    Args:
+        pool: Endpoint pool to route over.
+        clients: Client (OpenAI or AsyncOpenAI) per endpoint URL.
+        is_async: Whether `clients` are AsyncOpenAI clients; `create` then
+            returns a coroutine.
+        session_key: Pin requests to the replica this key hashes to (see
+            `for_session`).
+    """
+
+    def __init__(
+        self,
+        pool: EndpointPool,
+        clients: Dict[str, Any],
+        is_async: bool = False,
+        session_key: Optional[str] = None,
+    ) -> None:
+        self.pool = pool
+        self.clients = clients
+        self.is_async = is_async
+        self.session_key = session_key
+        self.chat = _RoutedChat(self)
+        for endpoint in pool.endpoints:
+            api_key = getattr(clients.get(endpoint.url), "api_key", None)
+            if isinstance(api_key, str) and api_key:
+                endpoint.api_key = api_key
+
+    def for_session(self, session_key: Optional[str]) -> "RoutedClient":
+        """Return a view of this client whose requests are pinned to `session_key`."""
+        if session_key == self.session_key:
+            return self
+        return RoutedClient(self.pool, self.clients, self.is_async, session_key)
+
+    def _acquire(self) -> Endpoint:
+        return self.pool.acquire(session_key=self.session_key)
+
+    def _create(self, **kwargs: Any) -> Any:
+        if self.is_async:
+            return self._acreate(**kwargs)
+        endpoint = self._acquire()
+        start = time.perf_counter()
+        try:
+            result = self.clients[endpoint.url].chat.completions.create(**kwargs)
+        except BaseException as e:
+            self.pool.release(endpoint, None, ok=release_ok(e))
+            raise
+        if kwargs.get("stream"):
+            return _LeasedStream(
+                result,
+                lambda ok: self.pool.release(endpoint, time.perf_counter() - start, ok),
+            )
+        self.pool.release(endpoint, time.perf_counter() - start, ok=True)
+        self.pool.record_usage(endpoint, result)
+        return result
+
+    async def _acreate(self, **kwargs: Any) -> Any:
+        endpoint = self._acquire()
+        start = time.perf_counter()
+        try:
+            result = await self.clients[endpoint.url].chat.completions.create(**kwargs)
+        except BaseException as e:
+            self.pool.release(endpoint, None, ok=release_ok(e))
+            raise
+        if kwargs.get("stream"):
+            return _LeasedStream(
+                result,
+                lambda ok: self.pool.release(endpoint, time.perf_counter() - start, ok),
+            )
+        self.pool.release(endpoint, time.perf_counter() - start, ok=True)
+        self.pool.record_usage(endpoint, result)
+        return result
@@ -0,0 +1,306 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent cache of grounding results.
+
+Grounding runs at temperature 0 with a fixed seed, so a result is determined
+by the screenshot, the instruction, the model and the sampling/image
+settings. Results are cached under a key hashing all of these: the
+screenshot by content, the rest through a namespace fingerprint of the
+agent's model_name, system prompt and output-affecting runtime_conf. A
+change of model or configuration therefore changes every key, and results
+of the old configuration are never returned; they age out of the store by
+TTL and size eviction, or can be dropped with `GroundingCache.clear`.
+
+Lookups go to an in-memory LRU first, then to a local sqlite database
+shared by all processes using the same path.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional, Tuple, Union
+
+from logging_utils import get_logger
+from utils import config_from_conf
+
+logger = get_logger(__name__)
+
+# runtime_conf keys that do not change a grounding result
+NON_OUTPUT_CONF_KEYS = frozenset({
+    "stream",
+    "retry_policy",
+    "shared_client",
+    "client_pool",
+    "endpoint_pool",
+    "max_prompt_tokens",
+    "tokenizer",
+    "grounding_cache",
+    "semantic_cache",
+})
+
+CachedResult = Tuple[str, Dict[str, Any]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    prediction TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+@dataclass(frozen=True)
+class GroundingCacheConfig:
+    """
+    Settings of a grounding result cache.
+
+    Attributes:
+        path: sqlite database file; None keeps results in memory only.
+        max_entries: Results held in the in-memory LRU.
+        max_disk_entries: Results kept in the database; the least recently
+            used are deleted beyond it (None for no limit).
+        ttl: Seconds a result stays valid after it was computed (None for
+            no expiry).
+    """
+
+    path: Optional[str] = None
+    max_entries: int = 10000
+    max_disk_entries: Optional[int] = 1000000
+    ttl: Optional[float] = None
+
+    @classmethod
+    def from_conf(cls, conf: Union["GroundingCacheConfig", Dict[str, Any], None]) -> "GroundingCacheConfig":
+        """Build a config from a GroundingCacheConfig, a dict of its fields, or None."""
+        return config_from_conf(cls, conf, "grounding cache")
+
+
+@dataclass
+class CacheStats:
+    """Counters of a cache since it was created."""
+
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        metrics = {f.name: getattr(self, f.name) for f in fields(self)}
+        metrics["hit_rate"] = self.hit_rate
+        return metrics
+
+
+def config_fingerprint(model_name: str, system_prompt: str, runtime_conf: Dict[str, Any]) -> str:
+    """
+    Fingerprint the settings that determine an agent's grounding results.
+
+    Args:
+        model_name: Served model name.
+        system_prompt: The agent's system prompt.
+        runtime_conf: The agent's merged runtime configuration; keys in
+            NON_OUTPUT_CONF_KEYS are ignored.
+
+    Returns:
+        Hex digest used as the cache namespace.
+    """
+    conf = {key: value for key, value in runtime_conf.items() if key not in NON_OUTPUT_CONF_KEYS}
+    payload = json.dumps(
+        {"model_name": model_name, "system_prompt": system_prompt, "runtime_conf": conf},
+        sort_keys=True,
+        default=repr,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cache_key(namespace: str, image_hash: str, instruction: str) -> str:
+    """Key of one grounding request."""
+    payload = "\0".join((namespace, image_hash, instruction))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class GroundingCache:
+    """
+    Two-level (in-memory LRU, then sqlite) cache of grounding results.
+
+    Thread-safe; one instance per database path is shared through
+    `get_grounding_cache`.
+
+    Args:
+        config: GroundingCacheConfig or dict of its fields.
+    """
+
+    def __init__(self, config: Union[GroundingCacheConfig, Dict[str, Any], None] = None) -> None:
+        self.config = GroundingCacheConfig.from_conf(config)
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, Tuple[float, CachedResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_entries = 0
+        if self.config.path:
+            directory = os.path.dirname(self.config.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.config.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(_SCHEMA)
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.config.ttl is not None and now - created > self.config.ttl
+
+    def _remember(self, key: str, created: float, value: CachedResult) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.config.max_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """
+        Look up a result.
+
+        Returns:
+            (prediction, result) with a deep copy of the result dict, or None on
+            a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0], now):
+                del self._memory[key]
+                if self._db is None:
+                    self.stats.expirations += 1
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats.hits += 1
+                self.stats.memory_hits += 1
+                prediction, result = entry[1]
+                return prediction, copy.deepcopy(result)
+
+            row = None
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT prediction, result, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self._expired(row[2], now):
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._disk_entries -= 1
+                    self.stats.expirations += 1
+                    row = None
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            value = (row[0], json.loads(row[1]))
+            self._remember(key, row[2], value)
+            self.stats.hits += 1
+            self.stats.disk_hits += 1
+            return value[0], copy.deepcopy(value[1])
+
+    def put(self, key: str, namespace: str, prediction: str, result: Dict[str, Any]) -> None:
+        """Store a result under `key`, evicting the least recently used beyond the size limits."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, (prediction, copy.deepcopy(result)))
+            self.stats.stores += 1
+            if self._db is None:
+                return
+            existed = self._db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, namespace, prediction, result, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, prediction, json.dumps(result), now, now),
+            )
+            self._disk_entries += existed is None
+            limit = self.config.max_disk_entries
+            if limit is not None and self._disk_entries > limit:
+                self._evict_disk(self._disk_entries - limit)
+
+    def _evict_disk(self, count: int) -> None:
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+            (count,),
+        )
+        # Other processes may share the database; recount instead of subtracting
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        self.stats.evictions += count
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """
+        Drop cached results.
+
+        Args:
+            namespace: Only drop results of this namespace (configuration
+                fingerprint); on disk only, the memory level is cleared
+                entirely. None drops everything.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._db is None:
+                return
+            if namespace is None:
+                self._db.execute("DELETE FROM results")
+            else:
+                self._db.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_caches: Dict[Any, GroundingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_grounding_cache(config: Union[GroundingCacheConfig, Dict[str, Any], None]) -> GroundingCache:
+    """
+    Return the process-wide cache of a database path.
+
+    Caches without a path are not shared; every call creates a new one.
+    """
+    config = GroundingCacheConfig.from_conf(config)
+    if not config.path:
+        return GroundingCache(config)
+    path = os.path.abspath(config.path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None or cache._db is None:
+            cache = GroundingCache(config)
+            _caches[path] = cache
+        elif cache.config != config:
+            logger.warning("Grounding cache %s is already open with %s, reusing it.", path, cache.config)
+        return cache
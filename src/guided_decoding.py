@@ -0,0 +1,267 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Guided decoding of navigation responses.
+
+The action space of the system prompts is a closed set of JSON shapes, one
+per line of its "## Action Space" section, e.g.
+
+    {"action": "swipe", "direction": "up or down or left or right", "coordinate": [x, y]} # "coordinate" is optional.
+
+Each line is read into an ActionSpec: "[x, y]" placeholders are coordinate
+pairs, "a or b" values and "# Options: a, b" comments are enums, and fields
+a comment calls optional are optional. From the specs (and the registered
+MCP tools) two constraints are derived for the server's structured-output
+extension:
+
+    regex           A regex for the whole response (thinking, then the tool
+                    call), sent as vLLM's `guided_regex`.
+    structural_tag  A JSON schema for the tool-call body, enforced only
+                    between <tool_call> and </tool_call>, sent as a
+                    structural_tag response_format (vLLM with xgrammar).
+                    Thinking is unconstrained, and MCP tool arguments follow
+                    the tools' own parameter schemas.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+GUIDED_DECODING_MODES = ("regex", "structural_tag")
+
+_ACTION_LINE_PATTERN = re.compile(r'^\s{0,8}(\{"action".{0,512}?\})[ \t]{0,8}(?:#(.{0,512}))?$', re.MULTILINE)
+_FIELD_PATTERN = re.compile(r'"(\w{1,64})"\s{0,8}:\s{0,8}(?:"([^"]{0,256})"|\[([^\]]{0,64})\])')
+_OPTIONS_PATTERN = re.compile(r"Options:\s{0,8}(.{1,256})")
+_OPTIONAL_PATTERN = re.compile(r'"(\w{1,64})" is optional')
+
+# Building blocks of the response regex. Whitespace is limited to what
+# tokenizers commonly emit so the model cannot stall on padding.
+_WS = " ?"
+_INT = "(0|[1-9][0-9]{0,3})"
+_STRING = r'"([^"\\\x00-\x1f]|\\(["\\/bfnrt]|u[0-9a-fA-F]{4}))*"'
+_NUMBER = r"-?(0|[1-9][0-9]{0,15})(\.[0-9]{1,16})?([eE][+-]?[0-9]{1,3})?"
+_PRIMITIVE = f"({_STRING}|{_NUMBER}|true|false|null)"
+# Thinking text: anything up to the first closing tag
+_THINKING = "([^<]|<[^/])*"
+_SEPARATOR = "[ \n]{0,2}"
+
+
+@dataclass
+class ActionSpec:
+    """
+    Arguments of one mobile_use action.
+
+    Attributes:
+        name: Action name ("click", "swipe", ...).
+        fields: (field, kind) pairs in prompt order; kind is "coordinate",
+            "string" or a tuple of the allowed string values.
+        optional: Names of the fields that may be omitted.
+    """
+
+    name: str
+    fields: List[Tuple[str, Any]] = field(default_factory=list)
+    optional: Tuple[str, ...] = ()
+
+
+def parse_action_space(prompt: str) -> List[ActionSpec]:
+    """
+    Read the mobile_use actions listed in a system prompt.
+
+    Args:
+        prompt: Rendered system prompt containing an "## Action Space" section.
+
+    Returns:
+        ActionSpec per action line, in prompt order.
+    """
+    actions = []
+    for match in _ACTION_LINE_PATTERN.finditer(prompt):
+        line, comment = match.group(1), match.group(2) or ""
+        fields = _FIELD_PATTERN.findall(line)
+        if not fields or fields[0][0] != "action":
+            continue
+        spec = ActionSpec(name=fields[0][1], optional=tuple(_OPTIONAL_PATTERN.findall(comment)))
+        options = _OPTIONS_PATTERN.search(comment)
+        for index, (name, text, array) in enumerate(fields[1:], start=2):
+            if array:
+                kind: Any = "coordinate"
+            elif " or " in text:
+                kind = tuple(value.strip() for value in text.split(" or "))
+            elif options and index == len(fields):
+                kind = tuple(value.strip() for value in options.group(1).split(",") if value.strip())
+            else:
+                kind = "string"
+            spec.fields.append((name, kind))
+        actions.append(spec)
+    return actions
+
+
+def _field_schema(kind: Any) -> Dict[str, Any]:
+    if kind == "coordinate":
+        return {"type": "array", "items": {"type": "integer"}, "minItems": 2, "maxItems": 2}
+    if isinstance(kind, tuple):
+        return {"type": "string", "enum": list(kind)}
+    return {"type": "string"}
+
+
+def tool_call_schema(actions: List[ActionSpec], mcp_tools: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Build the JSON schema of a tool-call body.
+
+    Args:
+        actions: mobile_use actions, see `parse_action_space`.
+        mcp_tools: MCP tool definitions with "name" and "parameters" keys.
+
+    Returns:
+        JSON schema accepting {"name": "mobile_use", "arguments": <action>}
+        for every action, and {"name": <tool>, "arguments": <parameters>}
+        for every MCP tool.
+    """
+    arguments = []
+    for action in actions:
+        properties: Dict[str, Any] = {"action": {"const": action.name}}
+        properties.update((name, _field_schema(kind)) for name, kind in action.fields)
+        arguments.append({
+            "type": "object",
+            "properties": properties,
+            "required": [name for name in properties if name not in action.optional],
+            "additionalProperties": False,
+        })
+    calls = [_call_schema("mobile_use", {"anyOf": arguments})]
+    for tool in mcp_tools or []:
+        calls.append(_call_schema(tool["name"], tool.get("parameters") or {"type": "object"}))
+    return {"anyOf": calls}
+
+
+def _call_schema(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {"name": {"const": name}, "arguments": arguments},
+        "required": ["name", "arguments"],
+        "additionalProperties": False,
+    }
+
+
+def _field_regex(kind: Any) -> str:
+    if kind == "coordinate":
+        return rf"\[{_WS}{_INT}{_WS},{_WS}{_INT}{_WS}\]"
+    if isinstance(kind, tuple):
+        return '"(' + "|".join(re.escape(value) for value in kind) + ')"'
+    return _STRING
+
+
+def _key_value(name: str, value: str) -> str:
+    return f'"{re.escape(name)}"{_WS}:{_WS}{value}'
+
+
+def _json_value_regex(depth: int) -> str:
+    """Regex of a JSON value nested at most `depth` arrays/objects deep."""
+    if depth == 0:
+        return _PRIMITIVE
+    inner = _json_value_regex(depth - 1)
+    member = f"{_STRING}{_WS}:{_WS}{inner}"
+    return (
+        f"({_PRIMITIVE}"
+        rf"|\[{_WS}({inner}({_WS},{_WS}{inner})*)?{_WS}\]"
+        rf"|\{{{_WS}({member}({_WS},{_WS}{member})*)?{_WS}\}})"
+    )
+
+
+def action_regex(action: ActionSpec) -> str:
+    """Regex of the arguments object of one action, with fields in prompt order."""
+    parts = [_key_value("action", f'"{re.escape(action.name)}"')]
+    for name, kind in action.fields:
+        part = f"{_WS},{_WS}" + _key_value(name, _field_regex(kind))
+        parts.append(f"({part})?" if name in action.optional else part)
+    return rf"\{{{_WS}" + "".join(parts) + rf"{_WS}\}}"
+
+
+def tool_call_regex(actions: List[ActionSpec], mcp_tools: Optional[List[Dict[str, Any]]] = None) -> str:
+    """
+    Build a regex of a tool-call body.
+
+    MCP tool arguments are matched as any JSON object nested up to two
+    levels deep; use the structural_tag mode to enforce their schemas.
+    """
+    calls = [
+        rf"\{{{_WS}" + _key_value("name", '"mobile_use"') + f"{_WS},{_WS}"
+        + _key_value("arguments", "(" + "|".join(action_regex(action) for action in actions) + ")")
+        + rf"{_WS}\}}"
+    ]
+    if mcp_tools:
+        names = "|".join(re.escape(tool["name"]) for tool in mcp_tools)
+        calls.append(
+            rf"\{{{_WS}" + _key_value("name", f'"({names})"') + f"{_WS},{_WS}"
+            + _key_value("arguments", _json_value_regex(2)) + rf"{_WS}\}}"
+        )
+    return "(" + "|".join(calls) + ")"
+
+
+def response_regex(
+    actions: List[ActionSpec],
+    mcp_tools: Optional[List[Dict[str, Any]]] = None,
+    thinking: bool = True,
+) -> str:
+    """
+    Build a regex of a whole navigation response.
+
+    The opening thinking tag is optional (a thinking chat template may have
+    opened it already) and thinking may be closed by </thinking> or </think>.
+    Without thinking, the response is the bare tool call.
+    """
+    prefix = f"(<thinking>)?{_THINKING}</think(ing)?>{_SEPARATOR}" if thinking else ""
+    return (
+        f"{prefix}<tool_call>{_SEPARATOR}"
+        f"{tool_call_regex(actions, mcp_tools)}{_SEPARATOR}</tool_call>"
+    )
+
+
+def guided_extra_body(
+    mode: str,
+    prompt: str,
+    mcp_tools: Optional[List[Dict[str, Any]]] = None,
+    thinking: bool = True,
+) -> Dict[str, Any]:
+    """
+    Build the extra_body fields that constrain decoding to the prompt's actions.
+
+    Args:
+        mode: "regex" or "structural_tag" (see the module docstring).
+        prompt: Rendered system prompt listing the action space.
+        mcp_tools: MCP tool definitions registered with the agent.
+        thinking: Whether the response starts with thinking (regex mode).
+
+    Returns:
+        Fields to merge into the request's extra_body.
+
+    Raises:
+        ValueError: If the mode is unknown or the prompt lists no actions.
+    """
+    if mode not in GUIDED_DECODING_MODES:
+        raise ValueError(f"Unsupported guided_decoding: {mode!r}")
+    actions = parse_action_space(prompt)
+    if not actions:
+        raise ValueError("No action space found in the system prompt")
+    if mode == "regex":
+        return {"guided_regex": response_regex(actions, mcp_tools, thinking)}
+    return {
+        "response_format": {
+            "type": "structural_tag",
+            "structures": [{
+                "begin": "<tool_call>",
+                "schema": tool_call_schema(actions, mcp_tools),
+                "end": "</tool_call>",
+            }],
+            "triggers": ["<tool_call>"],
+        }
+    }
@@ -0,0 +1,151 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Process-wide registry of OpenAI-compatible clients.
+
+Every OpenAI client owns its own httpx connection pool. Agents that opt in
+share one client (and thus one pool of warm keep-alive connections) per
+endpoint instead of paying TCP setup for every short-lived agent instance.
+"""
+
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Tuple, Union
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from logging_utils import get_logger
+from utils import config_from_conf
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class ClientPoolConfig:
+    """
+    Connection pool settings of a shared client.
+
+    Attributes:
+        max_connections: Maximum number of concurrent connections.
+        max_keepalive_connections: Maximum number of idle keep-alive connections.
+        keepalive_expiry: Seconds an idle connection is kept open.
+        http2: Use HTTP/2 (requires the optional `h2` package).
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_conf(cls, conf: Union["ClientPoolConfig", Dict[str, Any], None]) -> "ClientPoolConfig":
+        """Build a config from a ClientPoolConfig, a dict of its fields, or None."""
+        return config_from_conf(cls, conf, "client pool")
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_ClientKey = Tuple[str, str, ClientPoolConfig, bool]
+_clients: Dict[_ClientKey, Union[OpenAI, AsyncOpenAI]] = {}
+_clients_lock = threading.Lock()
+
+
+def _build_client(
+    base_url: str,
+    api_key: str,
+    pool: ClientPoolConfig,
+    is_async: bool,
+) -> Union[OpenAI, AsyncOpenAI]:
+    http2 = pool.http2
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1.")
+        http2 = False
+
+    # Retries are decided by the agents' RetryPolicy, not by the client.
+    if is_async:
+        return AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=pool.limits, http2=http2),
+        )
+    return OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=pool.limits, http2=http2),
+    )
+
+
+def get_client(
+    base_url: str,
+    api_key: str = "empty",
+    pool: Union[ClientPoolConfig, Dict[str, Any], None] = None,
+    is_async: bool = False,
+) -> Union[OpenAI, AsyncOpenAI]:
+    """
+    Return the shared client for an endpoint, creating it on first use.
+
+    Clients are keyed by (base_url, api_key, pool settings, sync/async), so
+    agents with the same endpoint and pool settings share one pool. Async
+    clients hold connections bound to an event loop and must only be shared
+    by agents running on the same loop.
+
+    Args:
+        base_url: Base URL of the OpenAI-compatible endpoint.
+        api_key: API key.
+        pool: Pool settings (ClientPoolConfig or dict of its fields).
+        is_async: Return an AsyncOpenAI client instead of OpenAI.
+
+    Returns:
+        Shared OpenAI or AsyncOpenAI client.
+    """
+    pool = ClientPoolConfig.from_conf(pool)
+    key = (base_url, api_key, pool, is_async)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.debug("Creating shared client for %s with pool %s", base_url, asdict(pool))
+            client = _build_client(base_url, api_key, pool, is_async)
+            _clients[key] = client
+        return client
+
+
+def close_clients() -> None:
+    """Close and forget all shared synchronous clients.
+
+    Async clients are only dropped from the registry; close them with
+    `await client.close()` on their event loop.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        if isinstance(client, OpenAI):
+            client.close()
@@ -0,0 +1,149 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Logging helpers for agent requests and responses.
+
+Request payloads carry multi-megabyte base64 screenshots, so they are never
+copied for logging. Instead a lazy, redacting view renders the messages only
+when a record is actually emitted.
+
+Like any library, the agents only attach a NullHandler to the "mai_ui"
+logger; records propagate to the application's handlers. Scripts that want
+the agents' output on stdout without blocking on it opt in with
+`configure_logging`, which hands records to a queue-backed sink.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Any, Dict, List, Optional, TextIO
+
+LOGGER_NAME = "mai_ui"
+IMAGE_PLACEHOLDER = "[IMAGE_DATA]"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rebuild the message structure with image URLs replaced by a placeholder.
+
+    Only the containers on the path to an image URL are rebuilt; all other
+    values are shared with the input, so no image payload is ever copied.
+
+    Args:
+        messages: List of message dictionaries that may contain image URLs.
+
+    Returns:
+        New list of messages with image URLs replaced by "[IMAGE_DATA]".
+    """
+    redacted = []
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            redacted.append(message)
+            continue
+        items = []
+        for item in content:
+            if isinstance(item, dict) and "image_url" in item:
+                item = {**item, "image_url": {**item["image_url"], "url": IMAGE_PLACEHOLDER}}
+            items.append(item)
+        redacted.append({**message, "content": items})
+    return redacted
+
+
+class RedactedMessages:
+    """
+    Lazy logging view of a message list with image URLs redacted.
+
+    The view holds a reference to the messages and renders them only when
+    converted to a string, i.e. when a log record is actually emitted.
+    """
+
+    __slots__ = ("messages",)
+
+    def __init__(self, messages: List[Dict[str, Any]]) -> None:
+        self.messages = messages
+
+    def __str__(self) -> str:
+        return str(redact_messages(self.messages))
+
+    __repr__ = __str__
+
+
+def configure_logging(
+    level: int = logging.INFO,
+    stream: Optional[TextIO] = None,
+) -> logging.Logger:
+    """
+    Attach a non-blocking, queue-backed stream sink to the agent logger.
+
+    Opt-in, for scripts: records are put on an in-process queue by the
+    caller and written to the stream by a background listener thread, and
+    no longer propagate to the root logger. Calling this again replaces the
+    previous sink.
+
+    Args:
+        level: Logging level. Use logging.DEBUG to include full request dumps.
+        stream: Output stream (default: sys.stdout).
+
+    Returns:
+        The configured agent logger.
+    """
+    global _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    """
+    Return the agent logger (or a child of it).
+
+    A NullHandler is attached on first use, so records are silent unless the
+    application configures logging (or calls `configure_logging`).
+
+    Args:
+        name: Optional child logger name.
+
+    Returns:
+        Logger instance.
+    """
+    root = logging.getLogger(LOGGER_NAME)
+    if not root.handlers:
+        root.addHandler(logging.NullHandler())
+    return root.getChild(name) if name else root
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _listener is not None:
+        _listener.stop()
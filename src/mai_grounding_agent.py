@@ -18,20 +18,37 @@ This module provides the MAIGroundingAgent class that uses vision-language model
 to locate UI elements based on natural language instructions.
 """
 
+import asyncio
 import json
-import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict
 from io import BytesIO
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from PIL import Image
 
+from endpoints import RoutedClient, get_endpoint_pool, normalize_urls
+from grounding_cache import CachedResult, GroundingCache, cache_key, config_fingerprint, get_grounding_cache
+from llm_client import get_client
+from logging_utils import RedactedMessages, get_logger
+from parsing import split_grounding_response
 from prompt import MAI_MOBILE_SYS_PROMPT_GROUNDING
-from utils import pil_to_base64, safe_pil_to_bytes
+from retry import RetryError, RetryPolicy, arun_with_retries, get_circuit_breaker, run_with_retries
+from semantic_cache import SemanticCache
+from streaming import StreamMetrics, aconsume_stream, consume_stream, stream_kwargs
+from token_estimator import PromptTooLongError, TokenEstimator
+from utils import ImageCodec, image_content_hash, resize_to_pixel_budget, safe_pil_to_bytes
 
 
 # Constants
 SCALE_FACTOR = 999
+ANSWER_END_TAG = "</answer>"
+
+logger = get_logger(__name__)
 
 
 def parse_grounding_response(text: str) -> Dict[str, Any]:
@@ -56,17 +73,13 @@ def parse_grounding_response(text: str) -> Dict[str, Any]:
         "coordinate": None,
     }
 
-    # Extract thinking content
-    think_pattern = r"<grounding_think>(.*?)</grounding_think>"
-    think_match = re.search(think_pattern, text, re.DOTALL)
-    if think_match:
-        result["thinking"] = think_match.group(1).strip()
+    thinking, answer = split_grounding_response(text)
+    if thinking is not None:
+        result["thinking"] = thinking.strip()
 
     # Extract answer content
-    answer_pattern = r"<answer>(.*?)</answer>"
-    answer_match = re.search(answer_pattern, text, re.DOTALL)
-    if answer_match:
-        answer_text = answer_match.group(1).strip()
+    if answer is not None:
+        answer_text = answer.strip()
         try:
             answer_json = json.loads(answer_text)
             coordinates = answer_json.get("coordinate", [])
@@ -93,14 +106,15 @@ class MAIGroundingAgent:
     locate a specific UI element and return its coordinates.
 
     Attributes:
-        llm_base_url: Base URL for the LLM API endpoint.
+        llm_base_url: Base URL for the LLM API endpoint, or a list of
+            replica URLs to load-balance over.
         model_name: Name of the model to use for predictions.
         runtime_conf: Configuration dictionary for runtime parameters.
     """
 
     def __init__(
         self,
-        llm_base_url: str,
+        llm_base_url: Union[str, List[str]],
         model_name: str,
         runtime_conf: Optional[Dict[str, Any]] = None,
     ):
@@ -108,15 +122,54 @@ class MAIGroundingAgent:
         Initialize the MAIGroundingAgent.
 
         Args:
-            llm_base_url: Base URL for the LLM API endpoint.
+            llm_base_url: Base URL for the LLM API endpoint, or a list of
+                replica URLs; requests are then routed to the replica with
+                the fewest outstanding requests.
             model_name: Name of the model to use.
             runtime_conf: Optional configuration dictionary with keys:
-                - max_pixels: Maximum pixels for image processing
-                - min_pixels: Minimum pixels for image processing
+                - max_pixels: Maximum pixels for image processing; screenshots
+                  are resized to this budget with smart_resize before encoding
+                  (default: None, send at native resolution)
+                - min_pixels: Minimum pixels for image processing (default: None)
+                - resize_factor: smart_resize patch factor (default: 32)
+                - stream: Stream the response and stop as soon as the closing
+                  </answer> tag is seen; the call's StreamMetrics are returned
+                  as a dict in result["stream_metrics"] (default: False)
+                - retry_policy: RetryPolicy or dict of its fields controlling
+                  attempts, backoff, timeouts and the circuit breaker
+                  (default: RetryPolicy())
+                - shared_client: Reuse the process-wide client (and connection
+                  pool) of llm_base_url instead of creating one (default: False)
+                - client_pool: ClientPoolConfig or dict of its fields for the
+                  shared client's pool size, keepalive and HTTP/2
+                - endpoint_pool: EndpointPoolConfig or dict of its fields for
+                  health checks and replica ejection when several base URLs
+                  are given
+                - max_prompt_tokens: Requests whose estimated input tokens
+                  exceed this are not sent; predict returns "prompt too long"
+                  (default: None, no limit)
+                - tokenizer: Hugging Face tokenizer name/path used to count
+                  text tokens for max_prompt_tokens (default: None, approximate)
+                - grounding_cache: GroundingCacheConfig or dict of its fields
+                  (path, max_entries, max_disk_entries, ttl), or a
+                  GroundingCache, to cache results by screenshot content and
+                  instruction. Keys include a fingerprint of model_name and
+                  runtime_conf, so changing either invalidates the cache
+                  (default: None, disabled)
+                - semantic_cache: SemanticCacheConfig or dict of its fields, or
+                  a SemanticCache, to also answer near-duplicate instructions
+                  on an already grounded screenshot ("tap the Settings icon"
+                  after "open settings") in memory; such results carry the
+                  matched instruction under "semantic_match"
+                  (default: None, disabled)
                 - temperature: Sampling temperature (default: 0.0)
                 - top_k: Top-k sampling parameter (default: -1)
                 - top_p: Top-p sampling parameter (default: 1.0)
                 - max_tokens: Maximum tokens in response (default: 2048)
+                - image_format: Wire format for screenshots, "png", "jpeg" or
+                  "webp" (default: "png")
+                - image_quality: Quality for JPEG/WebP (default: Pillow default)
+                - image_compress_level: zlib level for PNG (default: Pillow default)
         """
         # Set default configuration
         default_conf = {
@@ -124,44 +177,119 @@ class MAIGroundingAgent:
             "top_k": -1,
             "top_p": 1.0,
             "max_tokens": 2048,
+            "max_pixels": None,
+            "min_pixels": None,
+            "resize_factor": 32,
+            "stream": False,
+            "retry_policy": None,
+            "shared_client": False,
+            "client_pool": None,
+            "endpoint_pool": None,
+            "max_prompt_tokens": None,
+            "tokenizer": None,
+            "grounding_cache": None,
+            "semantic_cache": None,
         }
         self.runtime_conf = {**default_conf, **(runtime_conf or {})}
 
         self.llm_base_url = llm_base_url
         self.model_name = model_name
-        self.llm = OpenAI(
-            base_url=self.llm_base_url,
-            api_key="empty",
-        )
+        self.llm = self._create_client()
 
         # Extract frequently used config values
         self.temperature = self.runtime_conf["temperature"]
         self.top_k = self.runtime_conf["top_k"]
         self.top_p = self.runtime_conf["top_p"]
         self.max_tokens = self.runtime_conf["max_tokens"]
+        self.image_codec = ImageCodec.from_conf(self.runtime_conf)
+        self.max_pixels = self.runtime_conf["max_pixels"]
+        self.min_pixels = self.runtime_conf["min_pixels"]
+        self.resize_factor = self.runtime_conf["resize_factor"]
+        self.max_prompt_tokens = self.runtime_conf["max_prompt_tokens"]
+        self.token_estimator = TokenEstimator(self.runtime_conf["tokenizer"], factor=self.resize_factor)
+        self.stream = self.runtime_conf["stream"]
+        self.retry_policy = RetryPolicy.from_conf(self.runtime_conf["retry_policy"])
+        self.circuit_breaker = get_circuit_breaker(
+            ",".join(normalize_urls(self.llm_base_url)), self.retry_policy
+        )
+        cache_conf = self.runtime_conf["grounding_cache"]
+        self.cache: Optional[GroundingCache] = None
+        if cache_conf is not None:
+            self.cache = cache_conf if isinstance(cache_conf, GroundingCache) else get_grounding_cache(cache_conf)
+        semantic_conf = self.runtime_conf["semantic_cache"]
+        self.semantic_cache: Optional[SemanticCache] = None
+        if semantic_conf is not None:
+            self.semantic_cache = (
+                semantic_conf if isinstance(semantic_conf, SemanticCache) else SemanticCache(semantic_conf)
+            )
+        self.cache_namespace = config_fingerprint(self.model_name, self.system_prompt, self.runtime_conf)
+
+    def _create_client(self) -> Union[OpenAI, RoutedClient]:
+        """Create the client used for predictions, routed if several URLs are given."""
+        urls = normalize_urls(self.llm_base_url)
+        if len(urls) == 1:
+            return self._create_endpoint_client(urls[0])
+        return RoutedClient(
+            get_endpoint_pool(urls, self.runtime_conf["endpoint_pool"]),
+            {url: self._create_endpoint_client(url) for url in urls},
+            is_async=isinstance(self, AsyncMAIGroundingAgent),
+        )
+
+    def _create_endpoint_client(self, base_url: str) -> OpenAI:
+        """Create the OpenAI-compatible client of one endpoint."""
+        if self.runtime_conf["shared_client"]:
+            return get_client(base_url, pool=self.runtime_conf["client_pool"])
+        return OpenAI(
+            base_url=base_url,
+            api_key="empty",
+            max_retries=0,
+        )
 
     @property
     def system_prompt(self) -> str:
         """Return the system prompt for grounding tasks."""
         return MAI_MOBILE_SYS_PROMPT_GROUNDING
 
+    def _encode_image(self, image: Union[Image.Image, bytes]) -> str:
+        """
+        Decode a screenshot and encode it into the data-URL payload.
+
+        Args:
+            image: PIL Image or bytes of the screenshot.
+
+        Returns:
+            Data URL string.
+        """
+        # Convert bytes to PIL Image if necessary
+        if isinstance(image, bytes):
+            image = Image.open(BytesIO(image))
+
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # Resize to the model's pixel budget; the predicted coordinate is
+        # normalized, so it applies to the original screenshot unchanged.
+        image = resize_to_pixel_budget(
+            image, self.min_pixels, self.max_pixels, self.resize_factor
+        )
+        return self.image_codec.to_data_url(image)
+
     def _build_messages(
         self,
         instruction: str,
-        image: Image.Image,
+        image: Union[Image.Image, bytes, str],
     ) -> list:
         """
         Build the message list for the LLM API call.
 
         Args:
             instruction: Grounding instruction from user.
-            image: PIL Image of the screenshot.
-            magic_prompt: Whether to use the magic prompt format.
+            image: PIL Image or bytes of the screenshot, or its encoded data URL.
 
         Returns:
             List of message dictionaries for the API.
         """
-        encoded_string = pil_to_base64(image)
+        image_url = image if isinstance(image, str) else self._encode_image(image)
 
         messages = [
             {
@@ -186,7 +314,7 @@ class MAIGroundingAgent:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{encoded_string}"
+                            "url": image_url
                         },
                     },
                 ],
@@ -195,6 +323,182 @@ class MAIGroundingAgent:
 
         return messages
 
+    def _check_prompt_tokens(self, messages: list) -> Optional[PromptTooLongError]:
+        """Return an error if the estimated prompt exceeds max_prompt_tokens."""
+        if self.max_prompt_tokens is None:
+            return None
+        estimate = self.token_estimator.estimate(messages)
+        if estimate.total <= self.max_prompt_tokens:
+            return None
+        return PromptTooLongError(
+            f"Estimated prompt of {estimate.total} tokens ({estimate.num_images} images) "
+            f"exceeds max_prompt_tokens={self.max_prompt_tokens}"
+        )
+
+    def _image_hash(self, image: Union[Image.Image, bytes]) -> Optional[str]:
+        """Return the content hash of a screenshot, or None without a cache."""
+        if self.cache is None and self.semantic_cache is None:
+            return None
+        return image_content_hash(image)
+
+    def _cache_lookup(self, instruction: str, image_hash: Optional[str]) -> Optional[CachedResult]:
+        """Look up a request in the grounding cache, then among near-duplicate instructions."""
+        if image_hash is None:
+            return None
+        if self.cache is not None:
+            cached = self.cache.get(cache_key(self.cache_namespace, image_hash, instruction))
+            if cached is not None:
+                # Results of earlier runs also serve near-duplicates
+                if self.semantic_cache is not None:
+                    self.semantic_cache.put((self.cache_namespace, image_hash), instruction, *cached)
+                return cached
+        if self.semantic_cache is not None:
+            return self.semantic_cache.get((self.cache_namespace, image_hash), instruction)
+        return None
+
+    def _cache_result(
+        self,
+        instruction: str,
+        image_hash: Optional[str],
+        prediction: Optional[str],
+        result: Optional[Dict[str, Any]],
+    ) -> None:
+        """Store a successful prediction in the enabled caches."""
+        if image_hash is None or prediction is None or result is None or result.get("coordinate") is None:
+            return
+        # Metrics describe this call, not a later cache hit
+        result = {key: value for key, value in result.items() if key != "stream_metrics"}
+        if self.cache is not None:
+            key = cache_key(self.cache_namespace, image_hash, instruction)
+            self.cache.put(key, self.cache_namespace, prediction, result)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put((self.cache_namespace, image_hash), instruction, prediction, result)
+
+    def _batch_cache_lookup(
+        self,
+        requests: Sequence[Tuple[str, Union[Image.Image, bytes]]],
+    ) -> Tuple[List[Optional[str]], List[Optional[CachedResult]]]:
+        """
+        Look up a batch in the caches, hashing each distinct image once.
+
+        Near-duplicates within the batch are not matched against each other;
+        they are all sent.
+
+        Returns:
+            Tuple of (image hashes, results); both are all None without a
+            cache, and results are None for the requests that missed.
+        """
+        if self.cache is None and self.semantic_cache is None:
+            return [None] * len(requests), [None] * len(requests)
+        hashes: Dict[Any, str] = {}
+        image_hashes: List[Optional[str]] = []
+        for _, image in requests:
+            image_key = image if isinstance(image, bytes) else id(image)
+            if image_key not in hashes:
+                hashes[image_key] = image_content_hash(image)
+            image_hashes.append(hashes[image_key])
+        results = [
+            self._cache_lookup(instruction, image_hash)
+            for (instruction, _), image_hash in zip(requests, image_hashes)
+        ]
+        return image_hashes, results
+
+    def _completion_kwargs(
+        self,
+        messages: list,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Return the keyword arguments for chat.completions.create.
+
+        Args:
+            messages: Request messages.
+            overrides: Sampling overrides (seed, temperature) chosen by the
+                retry policy when re-sampling after a parse failure.
+        """
+        kwargs = {
+            "model": self.model_name,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0,
+            "extra_body": {"repetition_penalty": 1.0, "top_k": self.top_k},
+            "seed": 42,
+            "timeout": self.retry_policy.attempt_timeout,
+        }
+        kwargs.update(overrides or {})
+        if self.stream:
+            streaming = stream_kwargs(ANSWER_END_TAG)
+            kwargs["extra_body"] = {**kwargs["extra_body"], **streaming.pop("extra_body")}
+            kwargs.update(streaming)
+        return kwargs
+
+    def _complete(
+        self,
+        messages: list,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[StreamMetrics]]:
+        """
+        Run one chat completion.
+
+        In streaming mode the response is read incrementally and the stream
+        is closed as soon as the closing </answer> tag arrives.
+
+        Returns:
+            Tuple of (stripped response text, StreamMetrics of the call or
+            None when not streaming).
+        """
+        kwargs = self._completion_kwargs(messages, overrides)
+        if not self.stream:
+            response = self.llm.chat.completions.create(**kwargs)
+            return response.choices[0].message.content.strip(), None
+
+        start_time = time.perf_counter()
+        stream = self.llm.chat.completions.create(**kwargs)
+        text, metrics = consume_stream(stream, ANSWER_END_TAG, start_time)
+        logger.debug("Stream metrics: %s", metrics)
+        return text.strip(), metrics
+
+    def _parse_prediction(
+        self, prediction: str, stream_metrics: Optional[StreamMetrics] = None
+    ) -> Dict[str, Any]:
+        """Parse a raw model response into thinking and coordinate (and the call's stream metrics)."""
+        logger.info("Raw response:\n%s", prediction)
+        try:
+            result = parse_grounding_response(prediction)
+        except (KeyError, TypeError, IndexError, AttributeError) as e:
+            # Well-formed JSON of the wrong shape, e.g. a list as the answer
+            raise ValueError(f"Malformed answer in model output: {e!r}") from e
+        if stream_metrics is not None:
+            result["stream_metrics"] = asdict(stream_metrics)
+        logger.debug("Parsed result:\n%s", result)
+        return result
+
+    def _request_with_retries(
+        self, messages: list
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[Exception]]:
+        """
+        Call the model under the agent's retry policy.
+
+        Returns:
+            Tuple of (prediction, result, error); prediction and result are
+            None and error is the RetryError if all attempts failed.
+        """
+        logger.debug("Messages:\n%s", RedactedMessages(messages))
+        try:
+            prediction, result = run_with_retries(
+                lambda overrides: self._complete(messages, overrides),
+                lambda response: (response[0], self._parse_prediction(*response)),
+                self.retry_policy,
+                self.circuit_breaker,
+                base_temperature=self.temperature,
+            )
+        except RetryError as e:
+            return None, None, e
+        return prediction, result, None
+
     def predict(
         self,
         instruction: str,
@@ -216,51 +520,257 @@ class MAIGroundingAgent:
                     - "thinking": Model's reasoning process
                     - "coordinate": Normalized [x, y] coordinate
         """
-        # Convert bytes to PIL Image if necessary
-        if isinstance(image, bytes):
-            image = Image.open(BytesIO(image))
+        image_hash = self._image_hash(image)
+        cached = self._cache_lookup(instruction, image_hash)
+        if cached is not None:
+            return cached
+        messages = self._build_messages(instruction, image)
+        error = self._check_prompt_tokens(messages)
+        if error is not None:
+            logger.error("Not sending request: %s", error)
+            return "prompt too long", {"thinking": None, "coordinate": None}
+        prediction, result, _ = self._request_with_retries(messages)
 
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        # Return error if all retries failed
+        if prediction is None or result is None:
+            logger.error("Max retry attempts reached, returning error flag.")
+            return "llm client error", {"thinking": None, "coordinate": None}
 
-        # Build messages
-        messages = self._build_messages(instruction, image)
+        self._cache_result(instruction, image_hash, prediction, result)
+        return prediction, result
 
-        # Make API call with retry logic
-        max_retries = 3
-        prediction = None
-        result = None
+    def _batch_messages(
+        self,
+        encodings: "_BatchEncodings",
+        instruction: str,
+        image: Union[Image.Image, bytes],
+    ) -> Union[list, Exception]:
+        """
+        Build the request messages of one batch item.
 
-        for attempt in range(max_retries):
-            try:
-                response = self.llm.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    frequency_penalty=0.0,
-                    presence_penalty=0.0,
-                    extra_body={"repetition_penalty": 1.0, "top_k": self.top_k},
-                    seed=42,
-                )
-                prediction = response.choices[0].message.content.strip()
-                print(f"Raw response:\n{prediction}")
+        Returns:
+            The message list, or the exception raised while decoding/encoding
+            its image or the PromptTooLongError of a request over
+            max_prompt_tokens.
+        """
+        try:
+            image_url = encodings.get(image)
+        except Exception as e:
+            return e
+        messages = self._build_messages(instruction, image_url)
+        return self._check_prompt_tokens(messages) or messages
+
+    @staticmethod
+    def _batch_result(
+        prediction: Optional[str],
+        result: Optional[Dict[str, Any]],
+        error: Optional[Exception],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Convert a request outcome into a predict-style result tuple."""
+        if prediction is None or result is None:
+            return "llm client error", {"thinking": None, "coordinate": None, "error": repr(error)}
+        return prediction, result
+
+    def predict_batch(
+        self,
+        requests: Sequence[Tuple[str, Union[Image.Image, bytes]]],
+        max_concurrency: int = 8,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Ground many (instruction, image) pairs with bounded concurrency.
+
+        Each worker encodes its screenshot right before sending, so requests
+        go out while later images are still being encoded, and at most
+        max_concurrency images are held at once. Instructions sharing the
+        same screenshot decode and encode it once; requests answered by the
+        grounding or semantic cache are not sent.
+
+        Args:
+            requests: Sequence of (instruction, image) pairs.
+            max_concurrency: Maximum number of in-flight model calls.
+
+        Returns:
+            List of (prediction_text, result_dict) in input order. Failed
+            items return "llm client error" with the failure under
+            result_dict["error"]; they do not affect other items.
+        """
+        image_hashes, results = self._batch_cache_lookup(requests)
+        pending = [index for index, cached in enumerate(results) if cached is None]
+        encodings = _BatchEncodings(self._encode_image, [requests[index][1] for index in pending])
+
+        def run(index: int) -> Tuple[str, Dict[str, Any]]:
+            instruction, image = requests[index]
+            messages = self._batch_messages(encodings, instruction, image)
+            if isinstance(messages, Exception):
+                return self._batch_result(None, None, messages)
+            prediction, result, error = self._request_with_retries(messages)
+            self._cache_result(instruction, image_hashes[index], prediction, result)
+            return self._batch_result(prediction, result, error)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            for index, outcome in zip(pending, executor.map(run, pending)):
+                results[index] = outcome
+        return results
+
+
+class _BatchEncodings:
+    """
+    Encode each distinct image of a batch once, on first use by any worker.
 
-                # Parse response
-                result = parse_grounding_response(prediction)
-                print(f"Parsed result:\n{result}")
-                break
+    Images are shared by object identity (PIL Images) or content (bytes).
+    Workers needing an image that is being encoded wait for the same
+    future; the encoding is dropped after the image's last request got it.
 
+    Args:
+        encode: Function turning an image into its data URL.
+        images: Image of every request of the batch.
+    """
+
+    def __init__(self, encode: Any, images: Sequence[Union[Image.Image, bytes]]) -> None:
+        self._encode = encode
+        self._uses = Counter(self._key(image) for image in images)
+        self._futures: Dict[Any, "Future[str]"] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(image: Union[Image.Image, bytes]) -> Any:
+        return image if isinstance(image, bytes) else id(image)
+
+    def get(self, image: Union[Image.Image, bytes]) -> str:
+        """Return the data URL of an image; raises the encoding error, if any."""
+        key = self._key(image)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(self._encode(image))
             except Exception as e:
-                print(f"Error on attempt {attempt + 1}: {e}")
-                prediction = None
-                result = None
+                future.set_exception(e)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._uses[key] -= 1
+                if not self._uses[key]:
+                    del self._futures[key]
+
+
+class AsyncMAIGroundingAgent(MAIGroundingAgent):
+    """
+    Asyncio variant of MAIGroundingAgent built on AsyncOpenAI.
+
+    Message building and parsing are shared with the synchronous agent; only
+    `predict` is awaitable.
+    """
+
+    def _create_endpoint_client(self, base_url: str) -> AsyncOpenAI:
+        """Create the asynchronous OpenAI-compatible client of one endpoint."""
+        if self.runtime_conf["shared_client"]:
+            return get_client(base_url, pool=self.runtime_conf["client_pool"], is_async=True)
+        return AsyncOpenAI(
+            base_url=base_url,
+            api_key="empty",
+            max_retries=0,
+        )
+
+    async def _complete(
+        self,
+        messages: list,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[StreamMetrics]]:
+        """Asynchronous counterpart of `MAIGroundingAgent._complete`."""
+        kwargs = self._completion_kwargs(messages, overrides)
+        if not self.stream:
+            response = await self.llm.chat.completions.create(**kwargs)
+            return response.choices[0].message.content.strip(), None
+
+        start_time = time.perf_counter()
+        stream = await self.llm.chat.completions.create(**kwargs)
+        text, metrics = await aconsume_stream(stream, ANSWER_END_TAG, start_time)
+        logger.debug("Stream metrics: %s", metrics)
+        return text.strip(), metrics
+
+    async def _request_with_retries(
+        self, messages: list
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[Exception]]:
+        """Asynchronous counterpart of `MAIGroundingAgent._request_with_retries`."""
+        logger.debug("Messages:\n%s", RedactedMessages(messages))
+        try:
+            prediction, result = await arun_with_retries(
+                lambda overrides: self._complete(messages, overrides),
+                lambda response: (response[0], self._parse_prediction(*response)),
+                self.retry_policy,
+                self.circuit_breaker,
+                base_temperature=self.temperature,
+            )
+        except RetryError as e:
+            return None, None, e
+        return prediction, result, None
+
+    async def predict(
+        self,
+        instruction: str,
+        image: Union[Image.Image, bytes],
+        **kwargs: Any,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Predict the coordinate of the UI element based on the instruction.
+
+        See `MAIGroundingAgent.predict` for arguments and return value.
+        """
+        # Hashing, resizing and encoding the screenshot are CPU-bound, and
+        # the persistent cache queries sqlite
+        image_hash = await asyncio.to_thread(self._image_hash, image)
+        if image_hash is not None:
+            cached = await asyncio.to_thread(self._cache_lookup, instruction, image_hash)
+            if cached is not None:
+                return cached
+        messages = await asyncio.to_thread(self._build_messages, instruction, image)
+        error = self._check_prompt_tokens(messages)
+        if error is not None:
+            logger.error("Not sending request: %s", error)
+            return "prompt too long", {"thinking": None, "coordinate": None}
+        prediction, result, _ = await self._request_with_retries(messages)
 
         # Return error if all retries failed
         if prediction is None or result is None:
-            print("Max retry attempts reached, returning error flag.")
+            logger.error("Max retry attempts reached, returning error flag.")
             return "llm client error", {"thinking": None, "coordinate": None}
 
+        if image_hash is not None:
+            await asyncio.to_thread(self._cache_result, instruction, image_hash, prediction, result)
         return prediction, result
 
+    async def predict_batch(
+        self,
+        requests: Sequence[Tuple[str, Union[Image.Image, bytes]]],
+        max_concurrency: int = 8,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Ground many (instruction, image) pairs with bounded concurrency.
+
+        See `MAIGroundingAgent.predict_batch` for arguments and return value.
+        """
+        image_hashes, results = await asyncio.to_thread(self._batch_cache_lookup, requests)
+        pending = [index for index, cached in enumerate(results) if cached is None]
+        encodings = _BatchEncodings(self._encode_image, [requests[index][1] for index in pending])
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(index: int) -> Tuple[str, Dict[str, Any]]:
+            instruction, image = requests[index]
+            async with semaphore:
+                messages = await asyncio.to_thread(self._batch_messages, encodings, instruction, image)
+                if isinstance(messages, Exception):
+                    return self._batch_result(None, None, messages)
+                prediction, result, error = await self._request_with_retries(messages)
+            if image_hashes[index] is not None:
+                await asyncio.to_thread(self._cache_result, instruction, image_hashes[index], prediction, result)
+            return self._batch_result(prediction, result, error)
+
+        outcomes = await asyncio.gather(*(run(index) for index in pending))
+        for index, outcome in zip(pending, outcomes):
+            results[index] = outcome
+        return results
@@ -18,24 +18,52 @@ This module provides the MAIMobileAgent class that uses vision-language models
 to interact with mobile device interfaces based on natural language instructions.
 """
 
+import asyncio
 import copy
 import json
-import re
-import traceback
+import os
+import time
+import uuid
+from dataclasses import asdict
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import numpy as np
-from openai import OpenAI
+from openai import AsyncOpenAI, BadRequestError, OpenAI
 from PIL import Image
 
 from base import BaseAgent
-from prompt import MAI_MOBILE_SYS_PROMPT, MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP
+from endpoints import RoutedClient, get_endpoint_pool, normalize_urls
+from guided_decoding import ActionSpec, guided_extra_body, parse_action_space
+from llm_client import get_client
+from logging_utils import RedactedMessages, get_logger, redact_messages
+from parsing import parse_tagged_text, repair_tool_call
+from prompt import (
+    MAI_MOBILE_SYS_PROMPT,
+    MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP,
+    MAI_MOBILE_SYS_PROMPT_NO_THINKING,
+)
+from retry import RetryError, RetryPolicy, arun_with_retries, get_circuit_breaker, run_with_retries
+from streaming import StreamMetrics, aconsume_stream, consume_stream, stream_kwargs
+from token_estimator import PromptTooLongError, TokenEstimator
+from traj_journal import JournaledTrajMemory
 from unified_memory import TrajStep
-from utils import pil_to_base64, safe_pil_to_bytes
+from utils import (
+    ImageCodec,
+    image_fingerprint,
+    resize_to_pixel_budget,
+    safe_pil_to_bytes,
+    thumbnail_change_ratio,
+)
 
 # Constants
 SCALE_FACTOR = 999
+ACTION_END_TAG = "</tool_call>"
+UNCHANGED_SCREEN_TEXT = "[Screenshot unchanged from the previous step]"
+TRUNCATED_THINKING_MARKER = " [...]"
+# Request fields named by a server that rejects guided decoding
+GUIDED_DECODING_ERROR_FIELDS = ("guided_regex", "structural_tag", "response_format")
+
+logger = get_logger(__name__)
 
 
 def mask_image_urls_for_logging(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -46,82 +74,57 @@ def mask_image_urls_for_logging(messages: List[Dict[str, Any]]) -> List[Dict[str
         messages: List of message dictionaries that may contain image URLs.
 
     Returns:
-        Deep copy of messages with image URLs replaced by "[IMAGE_DATA]".
-    """
-    messages_masked = copy.deepcopy(messages)
-    for message in messages_masked:
-        content = message.get("content", [])
-        if content and isinstance(content, list):
-            for item in content:
-                if isinstance(item, dict) and "image_url" in item:
-                    item["image_url"]["url"] = "[IMAGE_DATA]"
-    return messages_masked
-
-
-def parse_tagged_text(text: str) -> Dict[str, Any]:
-    """
-    Parse text containing XML-style tags to extract thinking and tool_call content.
-
-    Args:
-        text: Text containing <thinking> and <tool_call> tags.
-
-    Returns:
-        Dictionary with keys:
-            - "thinking": Content inside <thinking> tags (str or None)
-            - "tool_call": Parsed JSON content inside <tool_call> tags (dict or None)
-
-    Raises:
-        ValueError: If tool_call content is not valid JSON.
+        Copy of messages with image URLs replaced by "[IMAGE_DATA]". Only the
+        containers around image URLs are rebuilt; payloads are never copied.
     """
-    # Handle thinking model output format (uses </think> instead of </thinking>)
-    if "</think>" in text and "</thinking>" not in text:
-        text = text.replace("</think>", "</thinking>")
-        text = "<thinking>" + text
-
-    # Define regex pattern with non-greedy matching
-    pattern = r"<thinking>(.*?)</thinking>.*?<tool_call>(.*?)</tool_call>"
-
-    result: Dict[str, Any] = {
-        "thinking": None,
-        "tool_call": None,
-    }
-
-    # Use re.DOTALL to match newlines
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        result = {
-            "thinking": match.group(1).strip().strip('"'),
-            "tool_call": match.group(2).strip().strip('"'),
-        }
+    return redact_messages(messages)
 
-    # Parse tool_call as JSON
-    if result["tool_call"]:
-        try:
-            result["tool_call"] = json.loads(result["tool_call"])
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON in tool_call: {e}")
 
-    return result
-
-
-def parse_action_to_structure_output(text: str) -> Dict[str, Any]:
+def parse_action_to_structure_output(
+    text: str,
+    repair: bool = False,
+    require_thinking: bool = True,
+    action_space: Optional[List[ActionSpec]] = None,
+) -> Dict[str, Any]:
     """
     Parse model output text into structured action format.
 
     Args:
         text: Raw model output containing thinking and tool_call tags.
+        repair: If the output does not parse (truncated by max_tokens,
+            malformed JSON), try to recover the action with
+            `parsing.repair_tool_call` instead of failing.
+        require_thinking: If False, a bare <tool_call> response (the
+            no-thinking prompt's format) is accepted; its thinking is None.
+        action_space: Actions of the system prompt that a repaired action
+            is validated against (default: the standard mobile_use actions).
 
     Returns:
         Dictionary with keys:
             - "thinking": The model's reasoning process
             - "action_json": Parsed action with normalized coordinates
+            - "repaired": Whether the action was recovered by repair
+
+    Raises:
+        ValueError: If no action can be parsed (or recovered).
 
     Note:
         Coordinates are normalized to [0, 1] range by dividing by SCALE_FACTOR.
     """
     text = text.strip()
 
-    results = parse_tagged_text(text)
+    repaired = False
+    try:
+        results = parse_tagged_text(text, require_thinking)
+    except ValueError:
+        if not repair:
+            raise
+        results = {"thinking": None, "tool_call": None}
+    if results["tool_call"] is None and repair:
+        results = repair_tool_call(text, require_thinking, action_space) or results
+        repaired = results["tool_call"] is not None
+    if results["tool_call"] is None:
+        raise ValueError("No tool_call found in model output")
     thinking = results["thinking"]
     tool_call = results["tool_call"]
     action = tool_call["arguments"]
@@ -178,6 +181,7 @@ def parse_action_to_structure_output(text: str) -> Dict[str, Any]:
     return {
         "thinking": thinking,
         "action_json": action,
+        "repaired": repaired,
     }
 
 
@@ -189,7 +193,8 @@ class MAIUINaivigationAgent(BaseAgent):
     generate GUI actions for mobile device automation.
 
     Attributes:
-        llm_base_url: Base URL for the LLM API endpoint.
+        llm_base_url: Base URL for the LLM API endpoint, or a list of
+            replica URLs to load-balance over.
         model_name: Name of the model to use for predictions.
         runtime_conf: Configuration dictionary for runtime parameters.
         history_n: Number of history steps to include in context.
@@ -197,7 +202,7 @@ class MAIUINaivigationAgent(BaseAgent):
 
     def __init__(
         self,
-        llm_base_url: str,
+        llm_base_url: Union[str, List[str]],
         model_name: str,
         runtime_conf: Optional[Dict[str, Any]] = None,
         mcp_tools: Optional[List[Dict[str, Any]]] = None,
@@ -206,16 +211,99 @@ class MAIUINaivigationAgent(BaseAgent):
         Initialize the MAIMobileAgent.
 
         Args:
-            llm_base_url: Base URL for the LLM API endpoint.
+            llm_base_url: Base URL for the LLM API endpoint, or a list of
+                replica URLs; requests are then routed to the replica with
+                the fewest outstanding requests.
             model_name: Name of the model to use.
             runtime_conf: Optional configuration dictionary with keys:
                 - history_n: Number of history images to include (default: 3)
-                - max_pixels: Maximum pixels for image processing
-                - min_pixels: Minimum pixels for image processing
+                - thinking: If False, use the no-thinking system prompt: the
+                  model answers with a bare <tool_call>, and history steps
+                  are rendered without thinking. Cuts decode time on simple
+                  flows; not available with MCP tools (default: True)
+                - history_layout: "sliding" drops the oldest history image
+                  every step; "chunked" drops them image_chunk at a time so
+                  the prompt prefix stays byte-identical (and cached by the
+                  server) between drops (default: "sliding")
+                - image_chunk: History images dropped at once in the chunked
+                  layout; up to history_n - 2 + image_chunk history images
+                  are sent (default: history_n - 1)
+                - dedup_screenshots: Detect screenshots (near-)identical to the
+                  previous step's. "share" reuses the previous encoding for
+                  them; "marker" additionally replaces duplicate history
+                  images with a short text marker (default: None, disabled)
+                - dedup_threshold: Fraction of thumbnail cells that may change
+                  for a screenshot to still count as a duplicate; 0 only
+                  ignores noise (default: 0.0)
+                - history_token_budget: Estimated token budget for the text
+                  of all history steps. When exceeded, the thinking of the
+                  oldest steps is truncated to compact_thinking_tokens, one
+                  step at a time; actions are always kept intact
+                  (default: None, unbounded)
+                - history_verbatim_steps: Number of newest steps never
+                  compacted (default: history_n)
+                - compact_thinking_tokens: Tokens of thinking kept for a
+                  compacted step, counted like history_token_budget; 0
+                  drops it (default: 32)
+                - max_prompt_tokens: Requests whose estimated input tokens
+                  exceed this are not sent; predict returns "prompt too long"
+                  (default: None, no limit)
+                - tokenizer: Hugging Face tokenizer name/path used to count
+                  text tokens for history_token_budget, compact_thinking_tokens
+                  and max_prompt_tokens
+                  (default: None, approximate)
+                - traj_journal_dir: Directory for per-episode journals; steps
+                  are written there as they are produced and only the
+                  screenshots of the image window stay in memory
+                  (default: None, keep everything in memory)
+                - journal_fsync: fsync the journal after every step
+                  (default: False)
+                - keep_traj_journals: Keep the journals of episodes ended by
+                  reset(); otherwise they are deleted and only the journals
+                  of interrupted episodes remain for recovery (default: False)
+                - max_pixels: Maximum pixels for image processing; screenshots
+                  are resized to this budget with smart_resize before encoding
+                  (default: None, send at native resolution)
+                - min_pixels: Minimum pixels for image processing (default: None)
+                - resize_factor: smart_resize patch factor (default: 32)
+                - stream: Stream the response and stop as soon as the closing
+                  </tool_call> tag is seen; the call's StreamMetrics are
+                  recorded as a dict in the step's
+                  structured_action["stream_metrics"] (default: False)
+                - repair_output: Recover the action from truncated or
+                  malformed output (unclosed JSON, trailing commas,
+                  unescaped quotes) instead of re-sampling; repaired steps
+                  are tagged with structured_action["repaired"]
+                  (default: False)
+                - guided_decoding: Constrain decoding to the action space of
+                  the system prompt (and the MCP tools) with the server's
+                  structured-output extension: "regex" sends a regex of the
+                  whole response as guided_regex, "structural_tag" a JSON
+                  schema of the tool call as a structural_tag
+                  response_format. If the server rejects it, it is turned
+                  off and the request is sent unconstrained
+                  (default: None, disabled)
+                - retry_policy: RetryPolicy or dict of its fields controlling
+                  attempts, backoff, timeouts and the circuit breaker
+                  (default: RetryPolicy())
+                - shared_client: Reuse the process-wide client (and connection
+                  pool) of llm_base_url instead of creating one (default: False)
+                - client_pool: ClientPoolConfig or dict of its fields for the
+                  shared client's pool size, keepalive and HTTP/2
+                - endpoint_pool: EndpointPoolConfig or dict of its fields for
+                  health checks and replica ejection when several base URLs
+                  are given
+                - session_affinity: With several base URLs, pin all steps of
+                  an episode to one replica (keyed by traj_memory.task_id) so
+                  they reuse its prefix cache (default: False)
                 - temperature: Sampling temperature (default: 0.0)
                 - top_k: Top-k sampling parameter (default: -1)
                 - top_p: Top-p sampling parameter (default: 1.0)
                 - max_tokens: Maximum tokens in response (default: 2048)
+                - image_format: Wire format for screenshots, "png", "jpeg" or
+                  "webp" (default: "png")
+                - image_quality: Quality for JPEG/WebP (default: Pillow default)
+                - image_compress_level: zlib level for PNG (default: Pillow default)
             tools: Optional list of MCP tool definitions. Each tool should be a dict
                 with 'name', 'description', and 'parameters' keys.
         """
@@ -227,19 +315,40 @@ class MAIUINaivigationAgent(BaseAgent):
         # Set default configuration
         default_conf = {
             "history_n": 3,
+            "thinking": True,
+            "history_layout": "sliding",
+            "image_chunk": None,
+            "dedup_screenshots": None,
+            "dedup_threshold": 0.0,
+            "history_token_budget": None,
+            "history_verbatim_steps": None,
+            "compact_thinking_tokens": 32,
+            "max_prompt_tokens": None,
+            "tokenizer": None,
+            "traj_journal_dir": None,
+            "journal_fsync": False,
+            "keep_traj_journals": False,
             "temperature": 0.0,
             "top_k": -1,
             "top_p": 1.0,
             "max_tokens": 2048,
+            "max_pixels": None,
+            "min_pixels": None,
+            "resize_factor": 32,
+            "stream": False,
+            "repair_output": False,
+            "guided_decoding": None,
+            "retry_policy": None,
+            "shared_client": False,
+            "client_pool": None,
+            "endpoint_pool": None,
+            "session_affinity": False,
         }
         self.runtime_conf = {**default_conf, **(runtime_conf or {})}
 
         self.llm_base_url = llm_base_url
         self.model_name = model_name
-        self.llm = OpenAI(
-            base_url=self.llm_base_url,
-            api_key="empty",
-        )
+        self.llm = self._create_client()
 
         # Extract frequently used config values
         self.temperature = self.runtime_conf["temperature"]
@@ -247,6 +356,87 @@ class MAIUINaivigationAgent(BaseAgent):
         self.top_p = self.runtime_conf["top_p"]
         self.max_tokens = self.runtime_conf["max_tokens"]
         self.history_n = self.runtime_conf["history_n"]
+        self.thinking = self.runtime_conf["thinking"]
+        if not self.thinking and self.mcp_tools:
+            raise ValueError("thinking=False is not supported with MCP tools")
+        self.history_layout = self.runtime_conf["history_layout"]
+        if self.history_layout not in ("sliding", "chunked"):
+            raise ValueError(f"Unsupported history_layout: {self.history_layout!r}")
+        self.image_chunk = self.runtime_conf["image_chunk"] or max(1, self.history_n - 1)
+        self.dedup_screenshots = self.runtime_conf["dedup_screenshots"]
+        if self.dedup_screenshots not in (None, "share", "marker"):
+            raise ValueError(f"Unsupported dedup_screenshots: {self.dedup_screenshots!r}")
+        self.dedup_threshold = self.runtime_conf["dedup_threshold"]
+        self.history_token_budget = self.runtime_conf["history_token_budget"]
+        self.history_verbatim_steps = self.runtime_conf["history_verbatim_steps"]
+        if self.history_verbatim_steps is None:
+            self.history_verbatim_steps = self.history_n
+        self.compact_thinking_tokens = self.runtime_conf["compact_thinking_tokens"]
+        self.max_prompt_tokens = self.runtime_conf["max_prompt_tokens"]
+        self.image_codec = ImageCodec.from_conf(self.runtime_conf)
+        self.max_pixels = self.runtime_conf["max_pixels"]
+        self.min_pixels = self.runtime_conf["min_pixels"]
+        self.resize_factor = self.runtime_conf["resize_factor"]
+        self.token_estimator = TokenEstimator(self.runtime_conf["tokenizer"], factor=self.resize_factor)
+        self.stream = self.runtime_conf["stream"]
+        self.repair_output = self.runtime_conf["repair_output"]
+        self.action_space = parse_action_space(self.system_prompt) or None
+        self.guided_decoding = self.runtime_conf["guided_decoding"]
+        self.guided_extra_body = (
+            guided_extra_body(self.guided_decoding, self.system_prompt, self.mcp_tools, self.thinking)
+            if self.guided_decoding else {}
+        )
+        self.session_affinity = self.runtime_conf["session_affinity"]
+        self._session_id = uuid.uuid4().hex
+        self.retry_policy = RetryPolicy.from_conf(self.runtime_conf["retry_policy"])
+        self.circuit_breaker = get_circuit_breaker(
+            ",".join(normalize_urls(self.llm_base_url)), self.retry_policy
+        )
+        self._reset_history_cache()
+        self.traj_journal_dir = self.runtime_conf["traj_journal_dir"]
+        if self.traj_journal_dir:
+            os.makedirs(self.traj_journal_dir, exist_ok=True)
+            self.traj_memory = self._new_journaled_memory()
+
+    def _create_client(self) -> Union[OpenAI, RoutedClient]:
+        """Create the client used for predictions, routed if several URLs are given."""
+        urls = normalize_urls(self.llm_base_url)
+        if len(urls) == 1:
+            return self._create_endpoint_client(urls[0])
+        return RoutedClient(
+            get_endpoint_pool(urls, self.runtime_conf["endpoint_pool"]),
+            {url: self._create_endpoint_client(url) for url in urls},
+            is_async=isinstance(self, AsyncMAIUINaivigationAgent),
+        )
+
+    def _new_journaled_memory(self) -> JournaledTrajMemory:
+        """Create an empty trajectory journaled under traj_journal_dir."""
+        return JournaledTrajMemory(
+            os.path.join(self.traj_journal_dir, f"{self._session_id}.journal"),
+            keep_images=self.image_window,
+            fsync=self.runtime_conf["journal_fsync"],
+        )
+
+    @property
+    def session_key(self) -> str:
+        """Routing key of the current episode: its task_id, or a per-reset id."""
+        return self.traj_memory.task_id or self._session_id
+
+    def _session_client(self) -> Union[OpenAI, RoutedClient]:
+        """Return the client for this episode, pinned to one replica if affinity is on."""
+        if self.session_affinity and isinstance(self.llm, RoutedClient):
+            return self.llm.for_session(self.session_key)
+        return self.llm
+
+    def _create_endpoint_client(self, base_url: str) -> OpenAI:
+        """Create the OpenAI-compatible client of one endpoint."""
+        if self.runtime_conf["shared_client"]:
+            return get_client(base_url, pool=self.runtime_conf["client_pool"])
+        return OpenAI(
+            base_url=base_url,
+            api_key="empty",
+            max_retries=0,
+        )
 
     @property
     def system_prompt(self) -> str:
@@ -256,6 +446,8 @@ class MAIUINaivigationAgent(BaseAgent):
         Returns:
             System prompt string, with MCP tools section if tools are configured.
         """
+        if not self.thinking:
+            return MAI_MOBILE_SYS_PROMPT_NO_THINKING
         if self.mcp_tools:
             mcp_tools_str = "\n".join(
                 [json.dumps(tool, ensure_ascii=False) for tool in self.mcp_tools]
@@ -303,14 +495,18 @@ class MAIUINaivigationAgent(BaseAgent):
                 "arguments": action_json,
             }
             tool_call_json = json.dumps(tool_call_dict, separators=(",", ":"))
+            if not self.thinking:
+                history_responses.append(f"<tool_call>\n{tool_call_json}\n</tool_call>")
+                continue
             history_responses.append(
                 f"<thinking>\n{thinking}\n</thinking>\n<tool_call>\n{tool_call_json}\n</tool_call>"
             )
 
         return history_responses
 
-    def mem2response(self, step: TrajStep) -> str:
-        thinking = step.thought
+    def mem2response(self, step: TrajStep, thinking: Optional[str] = None) -> str:
+        if thinking is None:
+            thinking = step.thought
         structured_action = step.structured_action
 
         if not structured_action:
@@ -339,6 +535,8 @@ class MAIUINaivigationAgent(BaseAgent):
             "arguments": action_json,
         }
         tool_call_json = json.dumps(tool_call_dict, separators=(",", ":"))
+        if not self.thinking:
+            return f"<tool_call>\n{tool_call_json}\n</tool_call>"
         return f"<thinking>\n{thinking}\n</thinking>\n<tool_call>\n{tool_call_json}\n</tool_call>"
 
     def mem2ask_user_response(self, step: TrajStep) -> str:
@@ -347,62 +545,294 @@ class MAIUINaivigationAgent(BaseAgent):
     def mem2mcp_response(self, step: TrajStep) -> str:
         return step.mcp_response
 
-    def _prepare_images(self, screenshot_bytes: bytes) -> List[Image.Image]:
+    @staticmethod
+    def _load_image(image: Union[bytes, Image.Image]) -> Image.Image:
         """
-        Prepare image list including history and current screenshot.
+        Decode a screenshot into an RGB PIL Image.
 
         Args:
-            screenshot_bytes: Current screenshot as bytes.
+            image: Screenshot as bytes or PIL Image.
 
         Returns:
-            List of PIL Images (history + current).
+            RGB PIL Image.
         """
-        # Calculate how many history images to include
-        if len(self.history_images) > 0:
-            max_history = min(len(self.history_images), self.history_n - 1)
-            recent_history = self.history_images[-max_history:] if max_history > 0 else []
-        else:
-            recent_history = []
-
-        # Add current image bytes
-        recent_history.append(screenshot_bytes)
-
-        # Normalize input type
-        if isinstance(recent_history, bytes):
-            recent_history = [recent_history]
-        elif isinstance(recent_history, np.ndarray):
-            recent_history = list(recent_history)
-        elif not isinstance(recent_history, list):
-            raise TypeError(f"Unidentified images type: {type(recent_history)}")
-
-        # Convert all images to PIL format
-        images = []
-        for image in recent_history:
-            if isinstance(image, bytes):
-                image = Image.open(BytesIO(image))
-            elif isinstance(image, Image.Image):
-                pass
-            else:
-                raise TypeError(f"Expected bytes or PIL Image, got {type(image)}")
+        if isinstance(image, bytes):
+            image = Image.open(BytesIO(image))
+        elif not isinstance(image, Image.Image):
+            raise TypeError(f"Expected bytes or PIL Image, got {type(image)}")
 
-            if image.mode != "RGB":
-                image = image.convert("RGB")
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return image
 
-            images.append(image)
+    def _encode_image(self, image: Image.Image) -> str:
+        """
+        Encode an image into the data-URL payload sent to the model.
+
+        The image is first resized to the configured pixel budget. Predicted
+        coordinates are normalized, so they apply to the original screenshot
+        unchanged.
+
+        Args:
+            image: RGB PIL Image.
+
+        Returns:
+            Data URL string.
+        """
+        image = resize_to_pixel_budget(
+            image, self.min_pixels, self.max_pixels, self.resize_factor
+        )
+        return self.image_codec.to_data_url(image)
+
+    def _step_image_url(self, step: TrajStep) -> str:
+        """
+        Return the cached payload of a history step, encoding it on first use.
+
+        Args:
+            step: History step inside the image window.
+
+        Returns:
+            Data URL string of the step's screenshot.
+        """
+        if step.image_url is None:
+            image = self._load_image(step.load_screenshot_bytes())
+            step.image_url = self._encode_image(image)
+            step.image_size = image.size
+        return step.image_url
+
+    def _prepare_images(
+        self, screenshot_bytes: Union[bytes, Image.Image]
+    ) -> List[Optional[Union[Image.Image, str]]]:
+        """
+        Prepare image list including history and current screenshot.
 
+        History screenshots are returned as their cached data-URL payloads so
+        they are neither decoded nor re-encoded on every step. In the "marker"
+        dedup mode, history steps whose screenshot duplicates the previous
+        (included) one are returned as None and sent as a text marker.
+
+        Args:
+            screenshot_bytes: Current screenshot as bytes or PIL Image.
+
+        Returns:
+            List of history payloads followed by the current PIL Image.
+        """
+        recent_steps = self.traj_memory.steps[self._history_image_start():]
+
+        images: List[Optional[Union[Image.Image, str]]] = [
+            None
+            if self.dedup_screenshots == "marker" and index > 0 and step.duplicate_of_previous
+            else self._step_image_url(step)
+            for index, step in enumerate(recent_steps)
+        ]
+        images.append(self._load_image(screenshot_bytes))
         return images
 
+    @property
+    def image_window(self) -> int:
+        """Maximum number of history steps that can carry an image."""
+        if self.history_n <= 1:
+            return 0
+        if self.history_layout == "chunked":
+            return self.history_n - 2 + self.image_chunk
+        return self.history_n - 1
+
+    def _history_image_start(self) -> int:
+        """
+        Index of the first history step sent with its screenshot.
+
+        The sliding layout sends the last history_n - 1 screenshots. The
+        chunked layout only advances the start in multiples of image_chunk,
+        so between advances every new prompt extends the previous one.
+        """
+        num_steps = len(self.traj_memory.steps)
+        if self.history_n <= 1:
+            return num_steps
+        start = max(0, num_steps - (self.history_n - 1))
+        if self.history_layout == "chunked":
+            start -= start % self.image_chunk
+        return start
+
+    def _is_duplicate(self, content_hash: str, thumbnail: bytes) -> bool:
+        """Return whether a screenshot fingerprint matches the previous step's."""
+        if not self.traj_memory.steps:
+            return False
+        previous = self.traj_memory.steps[-1]
+        if previous.content_hash is None:
+            return False
+        if previous.content_hash == content_hash:
+            return True
+        return (
+            previous.thumbnail is not None
+            and thumbnail_change_ratio(previous.thumbnail, thumbnail) <= self.dedup_threshold
+        )
+
+    def _image_message(self, image: Optional[Union[Image.Image, str]]) -> Dict[str, Any]:
+        """
+        Build a user message carrying one image (PIL Image or data URL), or
+        the unchanged-screen marker for a deduplicated history image (None).
+        """
+        if image is None:
+            return {
+                "role": "user",
+                "content": [{"type": "text", "text": UNCHANGED_SCREEN_TEXT}],
+            }
+        url = image if isinstance(image, str) else self._encode_image(image)
+        return {
+            "role": "user",
+            "content": [{
+                "type": "image_url",
+                "image_url": {"url": url},
+            }],
+        }
+
+    def _step_messages(self, step: TrajStep, thinking: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Serialize the text messages of one history step.
+
+        Args:
+            step: History step.
+            thinking: Thinking to render instead of the step's own (used for
+                compacted steps).
+
+        Returns:
+            The assistant response, followed by the ask_user and MCP
+            responses to it if present.
+        """
+        messages = [{
+            "role": "assistant",
+            "content": [{"type": "text", "text": self.mem2response(step, thinking)}],
+        }]
+
+        # Add ask_user_response or mcp_response if present
+        ask_user_response = self.mem2ask_user_response(step)
+        if ask_user_response:
+            messages.append({
+                "role": "user",
+                "content": [{"type": "text", "text": ask_user_response}],
+            })
+        mcp_response = self.mem2mcp_response(step)
+        if mcp_response:
+            messages.append({
+                "role": "user",
+                "content": [{"type": "text", "text": mcp_response}],
+            })
+        return messages
+
+    def _text_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Estimated token count of text-only messages."""
+        if self.history_token_budget is None:
+            return 0
+        return sum(self.token_estimator.text_tokens(m["content"][0]["text"]) for m in messages)
+
+    def _reset_history_cache(self) -> None:
+        """Forget all serialized history messages."""
+        # (step, messages, tokens) per serialized step, see _history_step_messages
+        self._history_cache: List[Tuple[TrajStep, List[Dict[str, Any]], int]] = []
+        # (messages, tokens) of the compacted oldest steps, see _compact_history
+        self._compacted_cache: List[Tuple[List[Dict[str, Any]], int]] = []
+        self._history_prefix_messages: List[Dict[str, Any]] = []
+        self._history_prefix_steps = 0
+
+    def _sync_history_cache(self) -> None:
+        """
+        Drop cached messages of history steps that are no longer in the trajectory.
+
+        The cache is keyed by step identity, so steps replaced by `reset` or
+        `load_traj` are serialized again.
+        """
+        steps = self.traj_memory.steps
+        valid = 0
+        for (step, _, _), current in zip(self._history_cache, steps):
+            if step is not current:
+                break
+            valid += 1
+        del self._history_cache[valid:]
+        del self._compacted_cache[valid:]
+        if self._history_prefix_steps > valid:
+            self._history_prefix_messages = []
+            self._history_prefix_steps = 0
+
+    def _history_step_messages(self, index: int) -> List[Dict[str, Any]]:
+        """Return the text messages of history step `index`, serializing each step once."""
+        if index < len(self._compacted_cache):
+            return self._compacted_cache[index][0]
+        steps = self.traj_memory.steps
+        while len(self._history_cache) <= index:
+            step = steps[len(self._history_cache)]
+            messages = self._step_messages(step)
+            self._history_cache.append((step, messages, self._text_tokens(messages)))
+        return self._history_cache[index][1]
+
+    def _compact_history(self) -> None:
+        """
+        Keep the text of the history within history_token_budget.
+
+        While over budget, the thinking of the oldest not yet compacted step
+        is truncated to compact_thinking_tokens. Compaction only moves
+        forward, so a compacted step renders the same in every later prompt;
+        the newest history_verbatim_steps steps are never compacted.
+        """
+        if self.history_token_budget is None:
+            return
+        num_steps = len(self.traj_memory.steps)
+        self._history_step_messages(num_steps - 1)
+        compacted = len(self._compacted_cache)
+        total = sum(tokens for _, tokens in self._compacted_cache) + sum(
+            tokens for _, _, tokens in self._history_cache[compacted:num_steps]
+        )
+        limit = num_steps - self.history_verbatim_steps
+        while total > self.history_token_budget and len(self._compacted_cache) < limit:
+            step, _, tokens = self._history_cache[len(self._compacted_cache)]
+            thinking = self.token_estimator.truncate_text(step.thought or "", self.compact_thinking_tokens)
+            if thinking != (step.thought or ""):
+                thinking = (thinking + TRUNCATED_THINKING_MARKER).strip()
+            messages = self._step_messages(step, thinking)
+            compact_tokens = self._text_tokens(messages)
+            self._compacted_cache.append((messages, compact_tokens))
+            total -= tokens - compact_tokens
+
+        if len(self._compacted_cache) != compacted and self._history_prefix_steps > compacted:
+            self._history_prefix_messages = []
+            self._history_prefix_steps = 0
+        if total > self.history_token_budget:
+            logger.warning(
+                "History text (~%d tokens) exceeds history_token_budget (%d) after compaction",
+                total, self.history_token_budget,
+            )
+
+    def _history_prefix(self, num_steps: int) -> List[Dict[str, Any]]:
+        """
+        Return the text messages of the first `num_steps` history steps.
+
+        These steps are outside the image window, so their messages only
+        change with the trajectory; the flattened list is extended as the
+        window moves forward instead of being rebuilt.
+        """
+        if self._history_prefix_steps > num_steps:
+            self._history_prefix_messages = []
+            self._history_prefix_steps = 0
+        for index in range(self._history_prefix_steps, num_steps):
+            self._history_prefix_messages.extend(self._history_step_messages(index))
+        self._history_prefix_steps = num_steps
+        return self._history_prefix_messages
+
     def _build_messages(
         self,
         instruction: str,
-        images: List[Image.Image],
+        images: List[Optional[Union[Image.Image, str]]],
     ) -> List[Dict[str, Any]]:
         """
         Build the message list for the LLM API call.
 
+        Text messages of history steps are serialized once and reused by later
+        calls (see `_history_step_messages`); treat the returned messages as
+        read-only.
+
         Args:
             instruction: Task instruction from user.
-            images: List of prepared images.
+            images: List of prepared images (PIL Images or encoded data URLs,
+                None for a deduplicated history image).
         Returns:
             List of message dictionaries for the API.
         """
@@ -417,170 +847,336 @@ class MAIUINaivigationAgent(BaseAgent):
             },
         ]
 
-        image_num = 0
-        # history_responses = self.history_responses
-
-        if len(self.traj_memory.steps) > 0:
-            # Only the last (history_n - 1) history responses need images,
-            start_image_idx = max(0, len(self.traj_memory.steps) - (self.history_n - 1))
-            
-            for history_idx, step in enumerate(self.traj_memory.steps):
-                # Only include images for the last (history_n - 1) history responses
-                should_include_image = (history_idx >= start_image_idx)
-                
-                if should_include_image:
-                    # Add image before the assistant response
-                    if image_num < len(images) - 1:
-                        cur_image = images[image_num]
-                        encoded_string = pil_to_base64(cur_image)
-                        messages.append({
-                            "role": "user",
-                            "content": [{
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/png;base64,{encoded_string}"},
-                            }],
-                        })
-                    image_num += 1
-                
+        num_steps = len(self.traj_memory.steps)
+        if num_steps > 0:
+            # Only the history responses inside the image window need images
+            start_image_idx = self._history_image_start()
+            self._sync_history_cache()
+            self._compact_history()
+            messages.extend(self._history_prefix(start_image_idx))
+
+            image_num = 0
+            for history_idx in range(start_image_idx, num_steps):
+                # Add image before the assistant response
+                if image_num < len(images) - 1:
+                    messages.append(self._image_message(images[image_num]))
+                image_num += 1
                 # Always add the assistant response (regardless of whether an image is included)
-                history_response = self.mem2response(step)
-                messages.append({
-                    "role": "assistant",
-                    "content": [{"type": "text", "text": history_response}],
-                })
-
-                # Add ask_user_response or mcp_response if present
-                ask_user_response = self.mem2ask_user_response(step)
-                if ask_user_response:
-                    messages.append({
-                        "role": "user",
-                        "content": [{"type": "text", "text": ask_user_response}],
-                    })
-                mcp_response = self.mem2mcp_response(step)
-                if mcp_response:
-                    messages.append({
-                        "role": "user",
-                        "content": [{"type": "text", "text": mcp_response}],
-                    })
+                messages.extend(self._history_step_messages(history_idx))
 
             # Add current image (last one in images list)
             if image_num < len(images):
-                cur_image = images[image_num]
-                encoded_string = pil_to_base64(cur_image)
-                messages.append({
-                    "role": "user",
-                    "content": [{
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{encoded_string}"},
-                    }],
-                })
+                messages.append(self._image_message(images[image_num]))
         else:
             # No history, just add the current image
-            cur_image = images[0]
-            encoded_string = pil_to_base64(cur_image)
-            messages.append({
-                "role": "user",
-                "content": [{
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{encoded_string}"},
-                }],
-            })
+            messages.append(self._image_message(images[0]))
 
         return messages
 
-    def predict(
+    def _prepare_request(
         self,
         instruction: str,
         obs: Dict[str, Any],
-        **kwargs: Any,
-    ) -> Tuple[str, Dict[str, Any]]:
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         """
-        Predict the next action based on the current observation.
+        Build the request messages for the current observation.
+
+        The current screenshot is encoded once here so the payload can be
+        reused while its step stays inside the image window.
 
         Args:
             instruction: Task instruction/goal.
-            obs: Current observation containing:
-                - screenshot: PIL Image or bytes of current screen
-                - ask_user_response: Optional response from asking user
-                - mcp_response: Optional response from MCP tools
+            obs: Current observation (see `predict`).
+
         Returns:
-            Tuple of (prediction_text, action_dict) where:
-                - prediction_text: Raw model response or error message
-                - action_dict: Parsed action dictionary
+            Tuple of (messages, pending_step) where pending_step holds the
+            observation data needed by `_record_step`.
         """
         # Set task goal if not already set
         if not self.traj_memory.task_goal:
             self.traj_memory.task_goal = instruction
+        if isinstance(self.traj_memory, JournaledTrajMemory):
+            # Journal replies attached to the previous step before sending
+            self.traj_memory.sync_last_step()
 
         # Process screenshot
         screenshot_pil = obs["screenshot"]
-        screenshot_bytes = safe_pil_to_bytes(screenshot_pil)
+        images = self._prepare_images(screenshot_pil)
+        current_image = images[-1]
+
+        content_hash, thumbnail, duplicate = None, None, False
+        if self.dedup_screenshots:
+            content_hash, thumbnail = image_fingerprint(current_image)
+            duplicate = self._is_duplicate(content_hash, thumbnail)
+        previous = self.traj_memory.steps[-1] if self.traj_memory.steps else None
+        if duplicate and previous.image_url is not None:
+            # Share the previous step's encoding instead of encoding again
+            image_url = previous.image_url
+        else:
+            image_url = self._encode_image(current_image)
+        images[-1] = image_url
+
+        pending_step = {
+            "screenshot": screenshot_pil,
+            "screenshot_bytes": safe_pil_to_bytes(screenshot_pil),
+            "accessibility_tree": obs.get("accessibility_tree"),
+            "image_url": image_url,
+            "image_size": current_image.size,
+            "content_hash": content_hash,
+            "thumbnail": thumbnail,
+            "duplicate_of_previous": duplicate,
+        }
+        return self._build_messages(instruction, images), pending_step
+
+    def _check_prompt_tokens(self, messages: List[Dict[str, Any]]) -> Optional[PromptTooLongError]:
+        """Return an error if the estimated prompt exceeds max_prompt_tokens."""
+        if self.max_prompt_tokens is None:
+            return None
+        estimate = self.token_estimator.estimate(messages)
+        if estimate.total <= self.max_prompt_tokens:
+            return None
+        return PromptTooLongError(
+            f"Estimated prompt of {estimate.total} tokens ({estimate.num_images} images) "
+            f"exceeds max_prompt_tokens={self.max_prompt_tokens}"
+        )
 
-        # Prepare images
-        images = self._prepare_images(screenshot_bytes)
+    def _completion_kwargs(
+        self,
+        messages: List[Dict[str, Any]],
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Return the keyword arguments for chat.completions.create.
 
-        # Build messages
-        messages = self._build_messages(instruction, images)
+        Args:
+            messages: Request messages.
+            overrides: Sampling overrides (seed, temperature) chosen by the
+                retry policy when re-sampling after a parse failure.
+        """
+        kwargs = {
+            "model": self.model_name,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0,
+            "extra_body": {"repetition_penalty": 1.0, "top_k": self.top_k},
+            "seed": 42,
+            "timeout": self.retry_policy.attempt_timeout,
+        }
+        kwargs.update(overrides or {})
+        if self.guided_extra_body:
+            kwargs["extra_body"] = {**kwargs["extra_body"], **self.guided_extra_body}
+        if self.stream:
+            streaming = stream_kwargs(ACTION_END_TAG)
+            kwargs["extra_body"] = {**kwargs["extra_body"], **streaming.pop("extra_body")}
+            kwargs.update(streaming)
+        return kwargs
+
+    def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[StreamMetrics]]:
+        """
+        Run one chat completion.
 
-        # Make API call with retry logic
-        max_retries = 3
-        prediction = None
-        action_json = None
+        In streaming mode the response is read incrementally and the stream
+        is closed as soon as the closing </tool_call> tag arrives.
 
-        for attempt in range(max_retries):
-            try:
-                messages_print = mask_image_urls_for_logging(messages)
-                print(f"Messages (attempt {attempt + 1}):\n{messages_print}")
-
-                response = self.llm.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    frequency_penalty=0.0,
-                    presence_penalty=0.0,
-                    extra_body={"repetition_penalty": 1.0, "top_k": self.top_k},
-                    seed=42,
-                )
-                prediction = response.choices[0].message.content.strip()
-                print(f"Raw response:\n{prediction}")
-
-                # Parse response
-                parsed_response = parse_action_to_structure_output(prediction)
-                thinking = parsed_response["thinking"]
-                action_json = parsed_response["action_json"]
-                print(f"Parsed response:\n{parsed_response}")
-                break
+        Returns:
+            Tuple of (stripped response text, StreamMetrics of the call or
+            None when not streaming).
+        """
+        kwargs = self._completion_kwargs(messages, overrides)
+        llm = self._session_client()
+        start_time = time.perf_counter()
+        try:
+            response = llm.chat.completions.create(**kwargs)
+        except BadRequestError as e:
+            if not self._disable_guided_decoding(kwargs, e):
+                raise
+            response = llm.chat.completions.create(**kwargs)
+        if not self.stream:
+            return response.choices[0].message.content.strip(), None
+
+        text, metrics = consume_stream(response, ACTION_END_TAG, start_time)
+        logger.debug("Stream metrics: %s", metrics)
+        return text.strip(), metrics
+
+    def _disable_guided_decoding(self, kwargs: Dict[str, Any], error: BadRequestError) -> bool:
+        """
+        Turn guided decoding off after the server rejected its fields.
 
-            except Exception as e:
-                print(f"Error on attempt {attempt + 1}: {e}")
-                traceback.print_exc()
-                prediction = None
-                action_json = None
+        Other 400s (e.g. context length, bad image) leave guided decoding on.
+        Otherwise the guided decoding fields are removed from `kwargs` so the
+        request can be sent again unconstrained.
 
-        # Return error if all retries failed
-        if prediction is None or action_json is None:
-            print("Max retry attempts reached, returning error flag.")
-            return "llm client error", {"action": None}
-
-        # Create and store trajectory step
+        Returns:
+            True if the error is about the request's guided decoding fields.
+        """
+        if not self.guided_extra_body:
+            return False
+        message = str(error)
+        if not any(field in message for field in GUIDED_DECODING_ERROR_FIELDS):
+            return False
+        logger.warning("Server rejected guided decoding (%s), sending unconstrained requests.", error)
+        kwargs["extra_body"] = {
+            key: value for key, value in kwargs["extra_body"].items()
+            if key not in self.guided_extra_body
+        }
+        self.guided_extra_body = {}
+        return True
+
+    def _parse_prediction(
+        self, prediction: str, stream_metrics: Optional[StreamMetrics] = None
+    ) -> Dict[str, Any]:
+        """Parse a raw model response into thinking and action_json (and the call's stream metrics)."""
+        logger.info("Raw response:\n%s", prediction)
+        try:
+            parsed_response = parse_action_to_structure_output(
+                prediction,
+                repair=self.repair_output,
+                require_thinking=self.thinking,
+                action_space=self.action_space,
+            )
+        except (KeyError, TypeError, IndexError, AttributeError) as e:
+            # Well-formed JSON of the wrong shape, e.g. a missing "arguments"
+            raise ValueError(f"Malformed action in model output: {e!r}") from e
+        if parsed_response["repaired"]:
+            logger.warning("Repaired malformed model output instead of retrying")
+        if stream_metrics is not None:
+            parsed_response["stream_metrics"] = asdict(stream_metrics)
+        logger.debug("Parsed response:\n%s", parsed_response)
+        return parsed_response
+
+    def _record_step(
+        self,
+        pending_step: Dict[str, Any],
+        prediction: str,
+        parsed_response: Dict[str, Any],
+    ) -> None:
+        """Create the trajectory step for a successful prediction and store it."""
+        action_json = parsed_response["action_json"]
+        structured_action = {"action_json": action_json}
+        if parsed_response.get("repaired"):
+            structured_action["repaired"] = True
+        if parsed_response.get("stream_metrics") is not None:
+            structured_action["stream_metrics"] = parsed_response["stream_metrics"]
         traj_step = TrajStep(
-            screenshot=screenshot_pil,
-            accessibility_tree=obs.get("accessibility_tree"),
+            screenshot=pending_step["screenshot"],
+            accessibility_tree=pending_step["accessibility_tree"],
             prediction=prediction,
             action=action_json,
             conclusion="",
-            thought=thinking,
+            thought=parsed_response["thinking"],
             step_index=len(self.traj_memory.steps),
             agent_type="MAIMobileAgent",
             model_name=self.model_name,
-            screenshot_bytes=screenshot_bytes,
-            structured_action={"action_json": action_json},
+            screenshot_bytes=pending_step["screenshot_bytes"],
+            structured_action=structured_action,
+            image_url=pending_step["image_url"],
+            image_size=pending_step["image_size"],
+            content_hash=pending_step["content_hash"],
+            thumbnail=pending_step["thumbnail"],
+            duplicate_of_previous=pending_step["duplicate_of_previous"],
         )
-        self.traj_memory.steps.append(traj_step)
+        self.traj_memory.append_step(traj_step, image_window=self.image_window)
 
-        return prediction, action_json
+    def _request_with_retries(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Call the model under the agent's retry policy.
+
+        Returns:
+            Tuple of (prediction, parsed_response), both None if all attempts
+            failed.
+        """
+        logger.debug("Messages:\n%s", RedactedMessages(messages))
+        try:
+            return run_with_retries(
+                lambda overrides: self._complete(messages, overrides),
+                lambda response: (response[0], self._parse_prediction(*response)),
+                self.retry_policy,
+                self.circuit_breaker,
+                base_temperature=self.temperature,
+            )
+        except RetryError:
+            return None, None
+
+    def predict(
+        self,
+        instruction: str,
+        obs: Dict[str, Any],
+        **kwargs: Any,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Predict the next action based on the current observation.
+
+        Args:
+            instruction: Task instruction/goal.
+            obs: Current observation containing:
+                - screenshot: PIL Image or bytes of current screen
+                - ask_user_response: Optional response from asking user
+                - mcp_response: Optional response from MCP tools
+        Returns:
+            Tuple of (prediction_text, action_dict) where:
+                - prediction_text: Raw model response or error message
+                - action_dict: Parsed action dictionary
+        """
+        messages, pending_step = self._prepare_request(instruction, obs)
+        error = self._check_prompt_tokens(messages)
+        if error is not None:
+            logger.error("Not sending request: %s", error)
+            return "prompt too long", {"action": None}
+        prediction, parsed_response = self._request_with_retries(messages)
+
+        # Return error if all retries failed
+        if prediction is None or parsed_response is None:
+            logger.error("Max retry attempts reached, returning error flag.")
+            return "llm client error", {"action": None}
+
+        # Create and store trajectory step
+        self._record_step(pending_step, prediction, parsed_response)
+
+        return prediction, parsed_response["action_json"]
+
+    def _warm_up_requests(self) -> List[Tuple[Any, Dict[str, Any]]]:
+        """Return (client, kwargs) pairs that prime the system prompt on every endpoint."""
+        clients = self.llm.clients.values() if isinstance(self.llm, RoutedClient) else [self.llm]
+        kwargs = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": [{"type": "text", "text": self.system_prompt}]},
+                {"role": "user", "content": [{"type": "text", "text": "warm-up"}]},
+            ],
+            "max_tokens": 1,
+            "temperature": 0.0,
+            "timeout": self.retry_policy.attempt_timeout,
+        }
+        return [(client, kwargs) for client in clients]
+
+    def warm_up(self) -> int:
+        """
+        Prime the server's prefix cache with the system prompt.
+
+        Sends a one-token request carrying only the system prompt to every
+        endpoint, so the first step of each episode finds it cached. Failures
+        are logged and ignored.
+
+        Returns:
+            Number of endpoints warmed up successfully.
+        """
+        warmed = 0
+        for client, kwargs in self._warm_up_requests():
+            try:
+                client.chat.completions.create(**kwargs)
+                warmed += 1
+            except Exception as e:
+                logger.warning("Warm-up request failed: %s", e)
+        return warmed
 
     def reset(self, runtime_logger: Any = None) -> None:
         """
@@ -589,6 +1185,114 @@ class MAIUINaivigationAgent(BaseAgent):
         Args:
             runtime_logger: Optional logger (unused, kept for API compatibility).
         """
+        if isinstance(self.traj_memory, JournaledTrajMemory):
+            if self.runtime_conf["keep_traj_journals"]:
+                self.traj_memory.close()
+            else:
+                self.traj_memory.delete()
         super().reset()
+        self._reset_history_cache()
+        self._session_id = uuid.uuid4().hex
+        if self.traj_journal_dir:
+            self.traj_memory = self._new_journaled_memory()
+
+
+class AsyncMAIUINaivigationAgent(MAIUINaivigationAgent):
+    """
+    Asyncio variant of MAIUINaivigationAgent built on AsyncOpenAI.
+
+    Message building, parsing and trajectory handling are shared with the
+    synchronous agent; only `predict` is awaitable, so a single event loop
+    can drive many concurrent device sessions. Screenshot decoding, resizing
+    and encoding run in a worker thread so they do not stall other sessions.
+    """
+
+    def _create_endpoint_client(self, base_url: str) -> AsyncOpenAI:
+        """Create the asynchronous OpenAI-compatible client of one endpoint."""
+        if self.runtime_conf["shared_client"]:
+            return get_client(base_url, pool=self.runtime_conf["client_pool"], is_async=True)
+        return AsyncOpenAI(
+            base_url=base_url,
+            api_key="empty",
+            max_retries=0,
+        )
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[StreamMetrics]]:
+        """Asynchronous counterpart of `MAIUINaivigationAgent._complete`."""
+        kwargs = self._completion_kwargs(messages, overrides)
+        llm = self._session_client()
+        start_time = time.perf_counter()
+        try:
+            response = await llm.chat.completions.create(**kwargs)
+        except BadRequestError as e:
+            if not self._disable_guided_decoding(kwargs, e):
+                raise
+            response = await llm.chat.completions.create(**kwargs)
+        if not self.stream:
+            return response.choices[0].message.content.strip(), None
+
+        text, metrics = await aconsume_stream(response, ACTION_END_TAG, start_time)
+        logger.debug("Stream metrics: %s", metrics)
+        return text.strip(), metrics
+
+    async def warm_up(self) -> int:
+        """Asynchronous counterpart of `MAIUINaivigationAgent.warm_up`."""
+        warmed = 0
+        for client, kwargs in self._warm_up_requests():
+            try:
+                await client.chat.completions.create(**kwargs)
+                warmed += 1
+            except Exception as e:
+                logger.warning("Warm-up request failed: %s", e)
+        return warmed
+
+    async def _request_with_retries(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Asynchronous counterpart of `MAIUINaivigationAgent._request_with_retries`."""
+        logger.debug("Messages:\n%s", RedactedMessages(messages))
+        try:
+            return await arun_with_retries(
+                lambda overrides: self._complete(messages, overrides),
+                lambda response: (response[0], self._parse_prediction(*response)),
+                self.retry_policy,
+                self.circuit_breaker,
+                base_temperature=self.temperature,
+            )
+        except RetryError:
+            return None, None
 
+    async def predict(
+        self,
+        instruction: str,
+        obs: Dict[str, Any],
+        **kwargs: Any,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Predict the next action based on the current observation.
+
+        See `MAIUINaivigationAgent.predict` for arguments and return value.
+        """
+        messages, pending_step = await asyncio.to_thread(self._prepare_request, instruction, obs)
+        error = self._check_prompt_tokens(messages)
+        if error is not None:
+            logger.error("Not sending request: %s", error)
+            return "prompt too long", {"action": None}
+        prediction, parsed_response = await self._request_with_retries(messages)
+
+        # Return error if all retries failed
+        if prediction is None or parsed_response is None:
+            logger.error("Max retry attempts reached, returning error flag.")
+            return "llm client error", {"action": None}
+
+        # Create and store trajectory step; journaling flushes (and fsyncs) the file
+        if isinstance(self.traj_memory, JournaledTrajMemory):
+            await asyncio.to_thread(self._record_step, pending_step, prediction, parsed_response)
+        else:
+            self._record_step(pending_step, prediction, parsed_response)
 
+        return prediction, parsed_response["action_json"]
@@ -0,0 +1,473 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Single-pass parsing of model responses.
+
+A response is scanned once, left to right, for the tags of interest with
+one precompiled pattern whose matches have a bounded length; sections are
+then sliced out by position. No pattern spans a section's content, so
+parsing takes linear time even on long malformed outputs (unclosed tags,
+repeated openers) where `.*?` searches backtrack quadratically.
+
+The closing thinking tag is accepted as </thinking> or </think>, in any
+case and with stray whitespace (e.g. "</ think>"). A response that closes
+thinking without opening it (thinking models emit only </think>) has its
+thinking start at the beginning of the text. Responses of the no-thinking
+prompt, a bare <tool_call>, are accepted with require_thinking=False.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+# Opening/closing tags of interest; whitespace inside tags is bounded so each
+# match attempt inspects a bounded number of characters.
+TAG_PATTERN = re.compile(
+    r"<(/?)[ \t]{0,4}(thinking|think|tool_call|grounding_think|answer)[ \t]{0,4}>",
+    re.IGNORECASE,
+)
+COORDINATE_PATTERN = re.compile(r"\[(\d+),(\d+)\]")
+
+Span = Tuple[int, int]
+
+
+def iter_tags(text: str, pos: int = 0) -> Iterator[Tuple[str, bool, int, int]]:
+    """
+    Yield (name, is_closing, start, end) of every tag of interest in order.
+
+    "think" and "thinking" are both reported as "thinking".
+    """
+    for match in TAG_PATTERN.finditer(text, pos):
+        name = match.group(2).lower()
+        if name == "think":
+            name = "thinking"
+        yield name, bool(match.group(1)), match.start(), match.end()
+
+
+def find_sections(text: str, names: Tuple[str, ...]) -> Dict[str, Span]:
+    """
+    Locate the first complete section of each tag in `names`.
+
+    A section runs from the first opening tag to the first closing tag of the
+    same name after it. Sections are found independently in a single scan.
+
+    Returns:
+        Mapping of name to the (start, end) of the section content, for the
+        names that have a complete section.
+    """
+    opened: Dict[str, int] = {}
+    sections: Dict[str, Span] = {}
+    for name, closing, start, end in iter_tags(text):
+        if name not in names or name in sections:
+            continue
+        if not closing:
+            opened.setdefault(name, end)
+        elif name in opened:
+            sections[name] = (opened[name], start)
+            if len(sections) == len(names):
+                break
+    return sections
+
+
+def split_tool_call_response(
+    text: str, require_thinking: bool = True
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Split a navigation response into its raw thinking and tool_call text.
+
+    The tool call is the first complete <tool_call> section after the end of
+    the thinking section. As in the original format, both are None unless
+    the response has a closed thinking section followed by a tool call.
+
+    Args:
+        text: Raw model response.
+        require_thinking: If False, a tool call not preceded by any thinking
+            tag is accepted too; its thinking is None.
+
+    Returns:
+        Tuple of (thinking, tool_call) raw strings, or (None, None).
+    """
+    thinking: Optional[Span] = None
+    thinking_start: Optional[int] = None
+    call_start: Optional[int] = None
+    for name, closing, start, end in iter_tags(text):
+        if thinking is None:
+            if name == "tool_call" and not require_thinking and thinking_start is None:
+                if not closing and call_start is None:
+                    call_start = end
+                elif closing and call_start is not None:
+                    return None, text[call_start:start]
+                continue
+            if name != "thinking":
+                continue
+            if not closing:
+                if thinking_start is None:
+                    thinking_start = end
+                continue
+            thinking = (thinking_start or 0, start)
+            call_start = None
+        elif name == "tool_call":
+            if not closing and call_start is None:
+                call_start = end
+            elif closing and call_start is not None:
+                return text[thinking[0]:thinking[1]], text[call_start:start]
+    return None, None
+
+
+def parse_tagged_text(text: str, require_thinking: bool = True) -> Dict[str, Any]:
+    """
+    Parse text containing XML-style tags to extract thinking and tool_call content.
+
+    Args:
+        text: Text containing <thinking> (or </think>-closed) and <tool_call> tags.
+        require_thinking: If False, a bare <tool_call> response is accepted;
+            its thinking is None.
+
+    Returns:
+        Dictionary with keys:
+            - "thinking": Content inside <thinking> tags (str or None)
+            - "tool_call": Parsed JSON content inside <tool_call> tags (dict or None)
+
+    Raises:
+        ValueError: If tool_call content is not valid JSON.
+    """
+    result: Dict[str, Any] = {
+        "thinking": None,
+        "tool_call": None,
+    }
+
+    thinking, tool_call = split_tool_call_response(text, require_thinking)
+    if tool_call is not None:
+        result = {
+            "thinking": thinking.strip().strip('"') if thinking is not None else None,
+            "tool_call": tool_call.strip().strip('"'),
+        }
+
+    # Parse tool_call as JSON
+    if result["tool_call"]:
+        try:
+            result["tool_call"] = json.loads(result["tool_call"])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in tool_call: {e}")
+
+    return result
+
+
+def split_grounding_response(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Split a grounding response into its raw grounding_think and answer text.
+
+    Returns:
+        Tuple of (thinking, answer); each is None if its section is missing.
+    """
+    sections = find_sections(text, ("grounding_think", "answer"))
+    thinking = sections.get("grounding_think")
+    answer = sections.get("answer")
+    return (
+        text[thinking[0]:thinking[1]] if thinking else None,
+        text[answer[0]:answer[1]] if answer else None,
+    )
+
+
+def parse_coordinates(raw_string: str) -> Tuple[int, int]:
+    """
+    Return the first "[x,y]" integer pair in a response.
+
+    Used by the grounding evaluation scripts.
+
+    Returns:
+        Tuple (x, y), or (-1, -1) if the response has no coordinate pair.
+    """
+    match = COORDINATE_PATTERN.search(raw_string)
+    if match is None:
+        return -1, -1
+    return int(match.group(1)), int(match.group(2))
+
+
+# Fields each mobile_use action requires (see the action space in prompt.py)
+ACTION_REQUIRED_FIELDS = {
+    "click": ("coordinate",),
+    "long_press": ("coordinate",),
+    "double_click": ("coordinate",),
+    "type": ("text",),
+    "swipe": ("direction",),
+    "open": ("text",),
+    "drag": ("start_coordinate", "end_coordinate"),
+    "system_button": ("button",),
+    "wait": (),
+    "terminate": ("status",),
+    "answer": ("text",),
+    "ask_user": ("text",),
+}
+
+# Allowed values of the enum fields (see the action space in prompt.py)
+ACTION_FIELD_VALUES = {
+    "direction": ("up", "down", "left", "right"),
+    "button": ("back", "home", "menu", "enter"),
+    "status": ("success", "fail"),
+}
+
+_STRING_FIELD_PATTERN = re.compile(r'"(action|text|direction|button|status)"\s{0,8}:\s{0,8}"')
+_COORDINATE_FIELD_PATTERN = re.compile(
+    r'"(coordinate|start_coordinate|end_coordinate)"\s{0,8}:\s{0,8}\[\s{0,8}'
+    r'(-?\d{1,6}(?:\.\d{1,6})?)\s{0,8},\s{0,8}(-?\d{1,6}(?:\.\d{1,6})?)\s{0,8}\]'
+)
+COORDINATE_FIELDS = ("coordinate", "start_coordinate", "end_coordinate")
+# End of a string value: a quote followed by the next key or the closing brace
+_STRING_END_PATTERN = re.compile(r'"\s{0,8}(?:,\s{0,8}"\w{1,32}"\s{0,8}:|\})')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def close_json(text: str) -> str:
+    """
+    Make near-valid JSON parseable in one pass.
+
+    Unterminated strings and brackets are closed, trailing commas before a
+    closing bracket are dropped, and a quote inside a string that is not
+    followed by a delimiter (an unescaped quote in "text") is escaped.
+
+    Args:
+        text: JSON text, possibly truncated or malformed.
+
+    Returns:
+        The repaired text (not guaranteed to be valid JSON).
+    """
+    return _close_json(text)[0]
+
+
+def _close_json(text: str) -> Tuple[str, bool]:
+    """
+    Implement `close_json`.
+
+    Returns:
+        Tuple of (repaired text, cut), where cut tells that the text ends
+        inside a value: in a string, a number or literal, an array, or
+        after a "," or ":" announcing more. Closing such a value would
+        make up data ("[500,50" for "[500,501]", "hel" for "hello").
+    """
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    last = ""
+    length = len(text)
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                following = index + 1
+                while following < length and text[following] in " \t\r\n":
+                    following += 1
+                if following < length and text[following] not in ",:}]":
+                    out.append('\\"')
+                    continue
+                in_string = False
+                last = char
+            out.append(char)
+            continue
+        if char not in " \t\r\n":
+            last = char
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if stack:
+                stack.pop()
+        out.append(char)
+
+    cut = in_string or (bool(stack) and (stack[-1] == "]" or last in ",:" or _is_literal_char(last)))
+    if escaped:
+        out.pop()
+    if in_string:
+        out.append('"')
+    while out and out[-1] in " \t\r\n,:":
+        out.pop()
+    out.extend(reversed(stack))
+    return "".join(out), cut
+
+
+def _is_literal_char(char: str) -> bool:
+    """Whether a character can belong to a JSON number or true/false/null."""
+    return char.isalnum() or char in ".+-"
+
+
+def extract_action_arguments(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract mobile_use action arguments field by field.
+
+    The last resort when the tool call is not repairable JSON: the known
+    string fields and the first coordinate pair of each coordinate field
+    are read directly from the text.
+
+    Returns:
+        Arguments dict, or None if no action name is found.
+    """
+    arguments: Dict[str, Any] = {}
+    for match in _STRING_FIELD_PATTERN.finditer(text):
+        name = match.group(1)
+        if name in arguments:
+            continue
+        end = _STRING_END_PATTERN.search(text, match.end())
+        value = text[match.end():end.start() if end else len(text)]
+        if end is None:
+            value = value.rstrip().rstrip('"}] \t\r\n')
+        try:
+            arguments[name] = json.loads(f'"{value}"')
+        except json.JSONDecodeError:
+            arguments[name] = value
+    if not isinstance(arguments.get("action"), str) or not arguments["action"]:
+        return None
+    for match in _COORDINATE_FIELD_PATTERN.finditer(text):
+        name = match.group(1)
+        if name not in arguments:
+            arguments[name] = [json.loads(match.group(2)), json.loads(match.group(3))]
+    return arguments
+
+
+def valid_action(arguments: Dict[str, Any], action_space: Optional[Sequence[Any]] = None) -> bool:
+    """
+    Check recovered mobile_use arguments against the action space.
+
+    The action must be known and carry its required fields, enum fields
+    ("direction", "button", "status") must hold an allowed value, and
+    coordinates must be [x, y] number pairs.
+
+    Args:
+        arguments: mobile_use arguments.
+        action_space: ActionSpec list (see `guided_decoding.parse_action_space`);
+            None uses ACTION_REQUIRED_FIELDS and ACTION_FIELD_VALUES.
+    """
+    action = arguments.get("action")
+    if action_space is None:
+        required = ACTION_REQUIRED_FIELDS.get(action)
+        values = ACTION_FIELD_VALUES
+    else:
+        spec = next((spec for spec in action_space if spec.name == action), None)
+        if spec is None:
+            return False
+        required = [name for name, _ in spec.fields if name not in spec.optional]
+        values = {name: kind for name, kind in spec.fields if isinstance(kind, tuple)}
+    if required is None or any(field not in arguments for field in required):
+        return False
+    for field, value in arguments.items():
+        if field in values and value not in values[field]:
+            return False
+        if field in COORDINATE_FIELDS and not (
+            isinstance(value, list)
+            and len(value) == 2
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value)
+        ):
+            return False
+    return True
+
+
+def repair_tool_call(
+    text: str,
+    require_thinking: bool = True,
+    action_space: Optional[Sequence[Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Recover the tool call of a truncated or malformed navigation response.
+
+    The tool call runs from the first <tool_call> after the thinking section
+    (or, without the tag, the first "{") to its closing tag, or to the end of
+    the text if the response was cut off. It is parsed as JSON, then as
+    repaired JSON (see `close_json`), then field by field (see
+    `extract_action_arguments`).
+
+    Nothing is made up: a tool call cut off inside a value (a string, a
+    number, a coordinate array) is rejected, and a recovered mobile_use
+    action must be valid for the action space (see `valid_action`).
+
+    Args:
+        text: Raw model response that `parse_tagged_text` could not parse.
+        require_thinking: If False, a response without thinking is repaired
+            too; the tool call then starts at the first <tool_call> or "{".
+        action_space: ActionSpec list of the system prompt (see
+            `guided_decoding.parse_action_space`); None checks against the
+            default mobile_use actions.
+
+    Returns:
+        Dictionary with "thinking" and "tool_call" like `parse_tagged_text`,
+        or None if no action can be recovered.
+    """
+    thinking: Optional[Span] = None
+    thinking_start: Optional[int] = None
+    call_start: Optional[int] = None
+    call_end = len(text)
+    for name, closing, start, end in iter_tags(text):
+        if thinking is None:
+            if name != "thinking":
+                continue
+            if not closing:
+                if thinking_start is None:
+                    thinking_start = end
+                continue
+            thinking = (thinking_start or 0, start)
+        elif name == "tool_call":
+            if not closing and call_start is None:
+                call_start = end
+            elif closing and call_start is not None:
+                call_end = start
+                break
+    if thinking is None:
+        if require_thinking or thinking_start is not None:
+            return None
+        # No thinking: the tool call is the first section of the response
+        for name, closing, start, end in iter_tags(text):
+            if name == "tool_call":
+                if not closing and call_start is None:
+                    call_start = end
+                elif closing and call_start is not None:
+                    call_end = start
+                    break
+    if call_start is None:
+        call_start = text.find("{", thinking[1] if thinking else 0)
+        if call_start < 0:
+            return None
+    raw = text[call_start:call_end].strip()
+    if len(raw) > 1 and raw[0] == raw[-1] == '"':
+        raw = raw[1:-1]
+    closed, cut = _close_json(raw)
+    if cut:
+        return None
+
+    tool_call: Any = None
+    for candidate in (raw, closed):
+        try:
+            tool_call = json.loads(candidate)
+            break
+        except json.JSONDecodeError:
+            continue
+    if isinstance(tool_call, dict) and "action" in tool_call:
+        tool_call = {"name": "mobile_use", "arguments": tool_call}
+    if not (isinstance(tool_call, dict) and isinstance(tool_call.get("arguments"), dict)):
+        arguments = extract_action_arguments(raw)
+        if arguments is None:
+            return None
+        tool_call = {"name": "mobile_use", "arguments": arguments}
+
+    if tool_call.get("name", "mobile_use") == "mobile_use" and not valid_action(tool_call["arguments"], action_space):
+        return None
+
+    return {
+        "thinking": text[thinking[0]:thinking[1]].strip().strip('"') if thinking else None,
+        "tool_call": tool_call,
+    }
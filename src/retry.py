@@ -0,0 +1,378 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Retry policy for model calls.
+
+Failures are classified so that each kind is handled differently:
+transport errors and server overload back off exponentially with jitter,
+parse failures are re-sampled immediately with a different seed and
+temperature (an identical request would give the identical bad output), and
+a per-endpoint circuit breaker makes calls to a dead endpoint fail fast.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar, Union
+
+import httpx
+import openai
+
+from logging_utils import get_logger
+from utils import config_from_conf
+
+logger = get_logger(__name__)
+
+R = TypeVar("R")
+T = TypeVar("T")
+
+# Failure kinds
+TRANSPORT = "transport"
+OVERLOAD = "overload"
+PARSE = "parse"
+CIRCUIT_OPEN = "circuit_open"
+FATAL = "fatal"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker rejects a call to a failing endpoint."""
+
+
+class RetryError(RuntimeError):
+    """
+    Raised when all attempts of a call failed.
+
+    Attributes:
+        kind: Failure kind of the last attempt.
+        last_error: Exception raised by the last attempt.
+        attempts: Number of attempts made.
+    """
+
+    def __init__(self, kind: str, last_error: BaseException, attempts: int) -> None:
+        super().__init__(f"{kind} failure after {attempts} attempt(s): {last_error}")
+        self.kind = kind
+        self.last_error = last_error
+        self.attempts = attempts
+
+
+def classify_failure(error: BaseException) -> str:
+    """
+    Classify an exception raised while requesting or parsing a completion.
+
+    Parse failures are ValueErrors (the agents' parsers raise nothing else);
+    any exception not recognized here is fatal, so programming errors are
+    neither retried nor counted against the endpoint.
+
+    Returns:
+        One of "transport", "overload", "parse", "circuit_open" or "fatal".
+    """
+    if isinstance(error, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return TRANSPORT
+    if isinstance(error, openai.RateLimitError):
+        return OVERLOAD
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code >= 500 or error.status_code in (408, 429):
+            return OVERLOAD
+        return FATAL
+    if isinstance(error, ValueError):
+        return PARSE
+    return FATAL
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How model calls are retried.
+
+    Attributes:
+        max_attempts: Total number of attempts per call.
+        base_delay: Backoff delay in seconds before the first retry of a
+            transport/overload failure; doubled on every further retry.
+        max_delay: Upper bound of a single backoff delay in seconds.
+        jitter: Fraction of each delay that is randomized (0 disables jitter).
+        attempt_timeout: Per-attempt request timeout in seconds (None keeps
+            the client default).
+        total_timeout: Deadline in seconds for all attempts of one call; no
+            retry is started that would sleep past it (None disables it).
+        parse_retry_temperature: Minimum temperature used when re-sampling
+            after a parse failure.
+        failure_threshold: Consecutive transport/overload failures after
+            which the endpoint's circuit opens.
+        reset_timeout: Seconds an open circuit waits before letting a
+            probe call through.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    jitter: float = 0.5
+    attempt_timeout: Optional[float] = 120.0
+    total_timeout: Optional[float] = None
+    parse_retry_temperature: float = 0.3
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    def __post_init__(self) -> None:
+        if self.max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {self.max_attempts}")
+
+    @classmethod
+    def from_conf(cls, conf: Union["RetryPolicy", Dict[str, Any], None]) -> "RetryPolicy":
+        """Build a policy from a RetryPolicy, a dict of its fields, or None."""
+        return config_from_conf(cls, conf, "retry policy")
+
+    def backoff(self, retry_index: int, error: Optional[BaseException] = None) -> float:
+        """
+        Delay before retry number `retry_index` (0-based) of a transport or
+        overload failure. A Retry-After header on the error takes precedence.
+        """
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.base_delay * (2 ** retry_index), self.max_delay)
+        return delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+
+    def resample_overrides(
+        self, parse_failures: int, base_seed: int, base_temperature: float
+    ) -> Dict[str, Any]:
+        """Sampling overrides for a retry after `parse_failures` parse failures."""
+        if parse_failures == 0:
+            return {}
+        return {
+            "seed": base_seed + parse_failures,
+            "temperature": max(base_temperature, self.parse_retry_temperature),
+        }
+
+
+def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for one endpoint.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are rejected until `reset_timeout` has passed; then a single probe
+    call is allowed (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Return whether a call may be attempted now."""
+        return self.acquire()[0]
+
+    def acquire(self) -> Tuple[bool, bool]:
+        """
+        Ask to attempt a call.
+
+        Returns:
+            Tuple of (allowed, probe); `probe` is True for the half-open
+            probe, which the caller must settle with record_success,
+            record_failure or release_probe.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True, False
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False, False
+            self._probing = True
+            return True, True
+
+    def release_probe(self) -> None:
+        """
+        End a probe that proved nothing about the endpoint (a fatal or parse
+        error, cancellation) without changing the state; the next call probes.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str, policy: Optional[RetryPolicy] = None) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for an endpoint URL."""
+    policy = policy or RetryPolicy()
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+            _breakers[endpoint] = breaker
+        return breaker
+
+
+class _Attempts:
+    """Bookkeeping shared by the sync and async retry loops."""
+
+    def __init__(self, policy: RetryPolicy, breaker: Optional[CircuitBreaker]) -> None:
+        self.policy = policy
+        self.breaker = breaker
+        self.start = time.monotonic()
+        self.parse_failures = 0
+        self.backoff_retries = 0
+        self.probe = False
+
+    def check_circuit(self) -> None:
+        if self.breaker is None:
+            return
+        allowed, self.probe = self.breaker.acquire()
+        if not allowed:
+            raise CircuitOpenError("circuit open, endpoint marked as failing")
+
+    def settle_probe(self) -> None:
+        """Release a half-open probe that no success or failure was recorded for."""
+        if self.probe:
+            self.probe = False
+            self.breaker.release_probe()
+
+    def on_response(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_success()
+            self.probe = False
+
+    def on_failure(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Record a failure; return the delay before the next attempt, or raise."""
+        kind = classify_failure(error)
+        logger.warning("Error on attempt %d (%s): %s", attempt + 1, kind, error)
+        logger.debug("Attempt %d traceback", attempt + 1, exc_info=error)
+
+        if kind in (TRANSPORT, OVERLOAD) and self.breaker is not None:
+            self.breaker.record_failure()
+            self.probe = False
+        if kind == FATAL and not isinstance(error, openai.APIError):
+            # Not a failed call but a bug or an unexpected error: surface it as is
+            raise error
+        if kind in (FATAL, CIRCUIT_OPEN) or attempt + 1 >= self.policy.max_attempts:
+            raise RetryError(kind, error, attempt + 1) from error
+
+        if kind == PARSE:
+            self.parse_failures += 1
+            delay = 0.0
+        else:
+            delay = self.policy.backoff(self.backoff_retries, error)
+            self.backoff_retries += 1
+
+        if self.policy.total_timeout is not None:
+            if time.monotonic() - self.start + delay >= self.policy.total_timeout:
+                raise RetryError(kind, error, attempt + 1) from error
+        return delay
+
+
+def run_with_retries(
+    request: Callable[[Dict[str, Any]], R],
+    parse: Callable[[R], T],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    base_seed: int = 42,
+    base_temperature: float = 0.0,
+) -> T:
+    """
+    Run `parse(request(overrides))` under a retry policy.
+
+    Args:
+        request: Sends one request; receives sampling overrides (seed,
+            temperature) to apply and returns the response.
+        parse: Parses the response; a ValueError counts as a parse failure.
+        policy: Retry policy.
+        breaker: Optional circuit breaker of the endpoint.
+        base_seed: Seed of the first attempt.
+        base_temperature: Temperature of the first attempt.
+
+    Returns:
+        The parsed result.
+
+    Raises:
+        RetryError: If all attempts failed or the call failed with a
+            non-retryable API error.
+        Exception: Any error `classify_failure` does not recognize, as is.
+    """
+    state = _Attempts(policy, breaker)
+    attempt = 0
+    while True:
+        try:
+            state.check_circuit()
+            text = request(policy.resample_overrides(state.parse_failures, base_seed, base_temperature))
+            state.on_response()
+            return parse(text)
+        except Exception as e:
+            delay = state.on_failure(attempt, e)
+        finally:
+            state.settle_probe()
+        attempt += 1
+        if delay:
+            time.sleep(delay)
+
+
+async def arun_with_retries(
+    request: Callable[[Dict[str, Any]], Awaitable[R]],
+    parse: Callable[[R], T],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    base_seed: int = 42,
+    base_temperature: float = 0.0,
+) -> T:
+    """Asynchronous counterpart of `run_with_retries`."""
+    state = _Attempts(policy, breaker)
+    attempt = 0
+    while True:
+        try:
+            state.check_circuit()
+            text = await request(policy.resample_overrides(state.parse_failures, base_seed, base_temperature))
+            state.on_response()
+            return parse(text)
+        except Exception as e:
+            delay = state.on_failure(attempt, e)
+        finally:
+            state.settle_probe()
+        attempt += 1
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,152 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Lossless delta coding of consecutive screenshots.
+
+Consecutive screenshots usually differ in a small region only. A delta
+stores the rectangles that differ from a reference keyframe as PNG crops;
+applying it to the keyframe restores the screenshot pixel for pixel. Deltas
+are always taken against a keyframe (never against the previous delta), so
+any screenshot is restored from at most one keyframe and one delta.
+
+Delta payload layout: header length (uint32), JSON header with the image
+size, mode and rectangles ([x, y, width, height, crop length]), followed by
+the PNG crops in rectangle order.
+"""
+
+import json
+import struct
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+_LENGTH = struct.Struct("<I")
+
+Rect = Tuple[int, int, int, int]
+
+
+def diff_rects(reference: np.ndarray, image: np.ndarray, tile: int = 32) -> List[Rect]:
+    """
+    Find the rectangles in which two equally sized images differ.
+
+    Changed pixels are marked on a grid of `tile` x `tile` cells and each run
+    of changed cells in a grid row becomes one rectangle.
+
+    Args:
+        reference: Reference image array (H, W) or (H, W, C).
+        image: Image array of the same shape.
+        tile: Grid cell size in pixels.
+
+    Returns:
+        List of (x, y, width, height) rectangles, clipped to the image.
+    """
+    changed = reference != image
+    if changed.ndim == 2:
+        changed = changed[:, :, None]
+    height, width, channels = changed.shape
+    rows, cols = -(-height // tile), -(-width // tile)
+
+    # Reduce over contiguous pixel rows first; reducing the channel axis of
+    # the full-size mask first is an order of magnitude slower.
+    full_rows = height // tile
+    row_cells = changed[:full_rows * tile].reshape(full_rows, tile, width * channels).any(axis=1)
+    if full_rows < rows:
+        tail = changed[full_rows * tile:].reshape(-1, width * channels).any(axis=0)
+        row_cells = np.vstack([row_cells, tail[None, :]])
+    padded = np.zeros((rows, cols * tile * channels), dtype=bool)
+    padded[:, :width * channels] = row_cells
+    cells = padded.reshape(rows, cols, tile * channels).any(axis=2)
+
+    rects: List[Rect] = []
+    for row in range(rows):
+        line = cells[row]
+        if not line.any():
+            continue
+        # Start/end columns of each run of changed cells
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], line.astype(np.int8), [0]))))
+        y = row * tile
+        h = min(tile, height - y)
+        for start, end in zip(edges[::2], edges[1::2]):
+            x = int(start) * tile
+            rects.append((x, y, min(int(end) * tile, width) - x, h))
+    return rects
+
+
+def changed_ratio(rects: List[Rect], size: Tuple[int, int]) -> float:
+    """Fraction of the image area covered by `rects`."""
+    return sum(w * h for _, _, w, h in rects) / float(size[0] * size[1])
+
+
+def encode_delta(
+    reference: Image.Image,
+    image: Image.Image,
+    tile: int = 32,
+    max_ratio: float = 0.3,
+) -> Optional[bytes]:
+    """
+    Encode `image` as a delta against `reference`.
+
+    Args:
+        reference: Keyframe the delta is applied to.
+        image: Screenshot to encode.
+        tile: Grid cell size used to find changed rectangles.
+        max_ratio: Return None (store a keyframe instead) if the changed area
+            exceeds this fraction of the image.
+
+    Returns:
+        Delta payload, or None if the images are not comparable or changed
+        too much for a delta to pay off.
+    """
+    if reference.size != image.size or reference.mode != image.mode:
+        return None
+    rects = diff_rects(np.asarray(reference), np.asarray(image), tile)
+    if changed_ratio(rects, image.size) > max_ratio:
+        return None
+
+    crops = []
+    entries = []
+    for x, y, w, h in rects:
+        buffer = BytesIO()
+        image.crop((x, y, x + w, y + h)).save(buffer, format="PNG")
+        crops.append(buffer.getvalue())
+        entries.append([x, y, w, h, len(crops[-1])])
+    header = json.dumps({"size": list(image.size), "mode": image.mode, "rects": entries}).encode("utf-8")
+    return _LENGTH.pack(len(header)) + header + b"".join(crops)
+
+
+def apply_delta(reference: Image.Image, payload: bytes) -> Image.Image:
+    """
+    Restore a screenshot from its keyframe and delta payload.
+
+    Args:
+        reference: Keyframe the delta was encoded against (not modified).
+        payload: Output of `encode_delta`.
+
+    Returns:
+        The restored screenshot.
+    """
+    (header_length,) = _LENGTH.unpack_from(payload, 0)
+    offset = _LENGTH.size + header_length
+    header = json.loads(payload[_LENGTH.size:offset])
+    if tuple(header["size"]) != reference.size or header["mode"] != reference.mode:
+        raise ValueError("Delta does not match its keyframe")
+
+    image = reference.copy()
+    for x, y, _, _, length in header["rects"]:
+        crop = Image.open(BytesIO(payload[offset:offset + length]))
+        image.paste(crop, (x, y))
+        offset += length
+    return image
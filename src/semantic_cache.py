@@ -0,0 +1,276 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Near-duplicate instruction cache for grounding on the same screen.
+
+Instructions are compared with TF-IDF weighted character n-grams: the text
+is lowercased, punctuation and filler words ("click", "the", "button", ...)
+are dropped, and its character n-grams are hashed into a fixed number of
+buckets. Document frequencies are counted over every cached instruction.
+A lookup scores the query against the instructions cached for the same
+screenshot by cosine similarity and returns the best one's result when it
+reaches the threshold. Everything runs locally in NumPy.
+
+N-gram similarity alone cannot tell "left of play" from "right of play",
+so candidates must also pass a word guard (`compatible`). The default
+threshold was calibrated with benchmarks/benchmark_semantic_cache.py on the
+bundled grounding datasets: at 0.5 about 99% of the hits point into the
+ground-truth box of the query, against about 34% without the guard.
+"""
+
+import copy
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from grounding_cache import CacheStats, CachedResult
+from utils import config_from_conf
+
+# Words that do not identify the target element
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "on", "at", "please", "click", "tap", "press", "hit",
+    "select", "choose", "button", "icon",
+})
+# Words that pick a different element when added or swapped ("left of X" is
+# not X, "max" is not "min")
+POSITIONAL_WORDS = frozenset({
+    "left", "right", "top", "bottom", "above", "below", "under", "over",
+    "upper", "lower", "next", "previous", "prev", "before", "after", "beside",
+    "near", "nearest", "closest", "adjacent", "first", "second", "third",
+    "last", "middle", "center", "centre", "start", "end", "min", "max",
+    "minimum", "maximum", "up", "down", "horizontally", "vertically",
+})
+_NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+_MIN_STEM = 4
+
+
+@dataclass(frozen=True)
+class SemanticCacheConfig:
+    """
+    Settings of a near-duplicate instruction cache.
+
+    Attributes:
+        threshold: Minimum cosine similarity to return a cached result.
+        ngram_min: Shortest character n-gram.
+        ngram_max: Longest character n-gram.
+        num_buckets: Hashed feature buckets.
+        max_screens: Screenshots indexed; the least recently used are
+            dropped beyond it.
+        max_per_screen: Instructions indexed per screenshot; the oldest are
+            dropped beyond it.
+        word_guard: Only match instructions that differ by added or removed
+            words, none of them positional or numeric (see `compatible`).
+    """
+
+    threshold: float = 0.5
+    ngram_min: int = 2
+    ngram_max: int = 4
+    num_buckets: int = 1 << 18
+    max_screens: int = 1000
+    max_per_screen: int = 256
+    word_guard: bool = True
+
+    @classmethod
+    def from_conf(cls, conf: Union["SemanticCacheConfig", Dict[str, Any], None]) -> "SemanticCacheConfig":
+        """Build a config from a SemanticCacheConfig, a dict of its fields, or None."""
+        return config_from_conf(cls, conf, "semantic cache")
+
+
+def normalize_instruction(text: str) -> str:
+    """Lowercase, drop punctuation and filler words; keep the text if only filler remains."""
+    words = _NON_WORD_PATTERN.sub(" ", text.lower()).split()
+    kept = [word for word in words if word not in FILLER_WORDS]
+    return " ".join(kept or words)
+
+
+def _same_word(first: str, second: str) -> bool:
+    # Crude stemming: "close" ~ "closes", "open" ~ "opened"
+    if first == second:
+        return True
+    shorter, longer = sorted((first, second), key=len)
+    return len(shorter) >= _MIN_STEM and longer.startswith(shorter)
+
+
+def _unmatched(words: List[str], others: List[str]) -> List[str]:
+    return [word for word in words if not any(_same_word(word, other) for other in others)]
+
+
+def compatible(first: str, second: str) -> bool:
+    """
+    Whether two normalized instructions may name the same element.
+
+    Character n-grams score "left of play" and "right of play" as near
+    duplicates. They are only compatible when one instruction's words are a
+    subset of the other's ("close console" / "close console panel") and no
+    differing word is positional or contains a digit.
+    """
+    first_words, second_words = first.split(), second.split()
+    extra_first = _unmatched(first_words, second_words)
+    extra_second = _unmatched(second_words, first_words)
+    if extra_first and extra_second:
+        return False
+    return not any(
+        word in POSITIONAL_WORDS or any(char.isdigit() for char in word)
+        for word in extra_first + extra_second
+    )
+
+
+@dataclass
+class _Entry:
+    text: str
+    buckets: np.ndarray
+    counts: np.ndarray
+    value: CachedResult
+
+
+class SemanticCache:
+    """
+    Per-screenshot index of grounding results searchable by instruction similarity.
+
+    Thread-safe. Screens are identified by any hashable key, e.g. the
+    agent's (configuration namespace, screenshot hash).
+
+    Args:
+        config: SemanticCacheConfig or dict of its fields.
+    """
+
+    def __init__(self, config: Union[SemanticCacheConfig, Dict[str, Any], None] = None) -> None:
+        self.config = SemanticCacheConfig.from_conf(config)
+        self.stats = CacheStats()
+        self._screens: "OrderedDict[Hashable, OrderedDict[str, _Entry]]" = OrderedDict()
+        self._document_frequency = np.zeros(self.config.num_buckets, dtype=np.int64)
+        self._num_documents = 0
+        self._lock = threading.Lock()
+
+    def features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Hash the character n-grams of a normalized instruction.
+
+        Returns:
+            Tuple of (sorted unique bucket indices, n-gram counts).
+        """
+        padded = f" {text} "
+        grams = [
+            padded[start:start + n]
+            for n in range(self.config.ngram_min, self.config.ngram_max + 1)
+            for start in range(max(1, len(padded) - n + 1))
+        ]
+        hashed = np.fromiter(
+            (zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.int64, count=len(grams)
+        ) % self.config.num_buckets
+        buckets, counts = np.unique(hashed, return_counts=True)
+        return buckets, counts.astype(np.float64)
+
+    def _idf(self, buckets: np.ndarray) -> np.ndarray:
+        return np.log((1.0 + self._num_documents) / (1.0 + self._document_frequency[buckets])) + 1.0
+
+    def _weights(self, buckets: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # Sublinear term frequency
+        return (1.0 + np.log(counts)) * self._idf(buckets)
+
+    def _score(self, entries: List[_Entry], text: str) -> np.ndarray:
+        query_buckets, query_counts = self.features(text)
+        query = self._weights(query_buckets, query_counts)
+        query_norm = np.linalg.norm(query)
+        scores = np.zeros(len(entries))
+        if query_norm == 0:
+            return scores
+        for index, entry in enumerate(entries):
+            weights = self._weights(entry.buckets, entry.counts)
+            _, query_index, entry_index = np.intersect1d(
+                query_buckets, entry.buckets, assume_unique=True, return_indices=True
+            )
+            dot = float(query[query_index] @ weights[entry_index])
+            scores[index] = dot / (query_norm * np.linalg.norm(weights))
+        return scores
+
+    def match(self, screen: Hashable, instruction: str) -> Optional[Tuple[float, str, CachedResult]]:
+        """
+        Find the most similar cached instruction on a screen, whatever its similarity.
+
+        Does not count towards the stats or refresh the screen's recency.
+
+        Returns:
+            (cosine similarity, cached normalized instruction, (prediction,
+            result)), or None if nothing is cached for the screen.
+        """
+        with self._lock:
+            return self._match(screen, instruction)
+
+    def _match(self, screen: Hashable, instruction: str) -> Optional[Tuple[float, str, CachedResult]]:
+        entries = list(self._screens.get(screen, {}).values())
+        if not entries:
+            return None
+        text = normalize_instruction(instruction)
+        scores = self._score(entries, text)
+        if self.config.word_guard:
+            scores = np.where([compatible(text, entry.text) for entry in entries], scores, 0.0)
+        best = int(np.argmax(scores))
+        return float(scores[best]), entries[best].text, entries[best].value
+
+    def get(self, screen: Hashable, instruction: str) -> Optional[CachedResult]:
+        """
+        Find the result of the most similar cached instruction on a screen.
+
+        Returns:
+            (prediction, result) of the best match at or above the threshold,
+            with result["semantic_match"] holding the matched instruction and
+            its similarity; None otherwise.
+        """
+        with self._lock:
+            best = self._match(screen, instruction)
+            if best is None or best[0] < self.config.threshold:
+                self.stats.misses += 1
+                return None
+            self._screens.move_to_end(screen)
+            self.stats.hits += 1
+            self.stats.memory_hits += 1
+            similarity, text, (prediction, result) = best
+            result = copy.deepcopy(result)
+            result["semantic_match"] = {"instruction": text, "similarity": similarity}
+            return prediction, result
+
+    def put(self, screen: Hashable, instruction: str, prediction: str, result: Dict[str, Any]) -> None:
+        """Index the result of an instruction on a screen."""
+        text = normalize_instruction(instruction)
+        with self._lock:
+            entries = self._screens.get(screen)
+            if entries is None:
+                entries = self._screens[screen] = OrderedDict()
+            self._screens.move_to_end(screen)
+            if text in entries:
+                self._remove(entries.pop(text))
+            buckets, counts = self.features(text)
+            entries[text] = _Entry(text, buckets, counts, (prediction, copy.deepcopy(result)))
+            self._document_frequency[buckets] += 1
+            self._num_documents += 1
+            self.stats.stores += 1
+
+            while len(entries) > self.config.max_per_screen:
+                self._remove(entries.popitem(last=False)[1])
+                self.stats.evictions += 1
+            while len(self._screens) > self.config.max_screens:
+                _, evicted = self._screens.popitem(last=False)
+                for entry in evicted.values():
+                    self._remove(entry)
+                    self.stats.evictions += 1
+
+    def _remove(self, entry: _Entry) -> None:
+        self._document_frequency[entry.buckets] -= 1
+        self._num_documents -= 1
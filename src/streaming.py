@@ -0,0 +1,172 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming helpers that stop generation once the action is complete."""
+
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class StreamMetrics:
+    """
+    Latency metrics of one streamed completion.
+
+    Attributes:
+        time_to_first_token: Seconds from sending the request to the first
+            content token, or None if no content was received.
+        time_to_action: Seconds from sending the request until the closing
+            action tag was seen, or None if it never appeared.
+        total_time: Seconds from sending the request until the stream ended.
+        cut_off: Whether the client closed the stream after the action tag.
+        num_chunks: Number of content chunks received.
+    """
+
+    time_to_first_token: Optional[float] = None
+    time_to_action: Optional[float] = None
+    total_time: float = 0.0
+    cut_off: bool = False
+    num_chunks: int = 0
+
+
+def stream_kwargs(stop_tag: str) -> Dict[str, Any]:
+    """
+    Return the extra chat.completions.create arguments for streaming mode.
+
+    The closing tag is passed as a stop sequence so the server stops decoding
+    right after the action; `include_stop_str_in_output` (a vLLM extension)
+    keeps the tag in the text so the regular parsers still apply.
+
+    Args:
+        stop_tag: Closing tag that ends the action, e.g. "</tool_call>".
+
+    Returns:
+        Keyword arguments to merge into the request; "extra_body" must be
+        merged with the caller's own extra_body.
+    """
+    return {
+        "stream": True,
+        "stop": [stop_tag],
+        "extra_body": {"include_stop_str_in_output": True},
+    }
+
+
+class _StreamAccumulator:
+    """Collect streamed content and detect the closing action tag."""
+
+    def __init__(self, stop_tag: str, start_time: float) -> None:
+        self.stop_tag = stop_tag
+        self.start_time = start_time
+        self.parts: List[str] = []
+        self.length = 0
+        self.tail = ""
+        self.finish_reason: Optional[str] = None
+        self.metrics = StreamMetrics()
+
+    def feed(self, chunk: Any) -> bool:
+        """Consume one chunk; return True once the action is complete."""
+        if not chunk.choices:
+            return False
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        content = choice.delta.content if choice.delta else None
+        if not content:
+            return False
+
+        now = time.perf_counter()
+        if self.metrics.time_to_first_token is None:
+            self.metrics.time_to_first_token = now - self.start_time
+        self.metrics.num_chunks += 1
+        self.parts.append(content)
+
+        # Only the new content plus a tag-sized overlap can contain a tag
+        # that was not seen before, so each character is scanned O(1) times.
+        window = self.tail + content
+        index = window.find(self.stop_tag)
+        if index != -1:
+            # Drop anything streamed after the closing tag in this chunk
+            overshoot = len(window) - (index + len(self.stop_tag))
+            if overshoot:
+                self.parts[-1] = content[:len(content) - overshoot]
+            self.metrics.time_to_action = now - self.start_time
+            return True
+        self.tail = window[-(len(self.stop_tag) - 1):] if len(self.stop_tag) > 1 else ""
+        return False
+
+    def finish(self, cut_off: bool) -> Tuple[str, StreamMetrics]:
+        text = "".join(self.parts)
+        if self.metrics.time_to_action is None and self.finish_reason == "stop":
+            # Servers that ignore include_stop_str_in_output strip the stop
+            # sequence; restore it so the tagged output stays parseable.
+            opening_tag = "<" + self.stop_tag[2:]
+            if opening_tag in text and self.stop_tag not in text:
+                text += self.stop_tag
+                self.metrics.time_to_action = time.perf_counter() - self.start_time
+        self.metrics.cut_off = cut_off
+        self.metrics.total_time = time.perf_counter() - self.start_time
+        return text, self.metrics
+
+
+def consume_stream(
+    stream: Iterator[Any],
+    stop_tag: str,
+    start_time: float,
+) -> Tuple[str, StreamMetrics]:
+    """
+    Read a streamed chat completion until the closing action tag.
+
+    The stream is closed as soon as the tag is seen, which aborts the request
+    on the server even if it did not honour the stop sequence.
+
+    Args:
+        stream: Stream returned by chat.completions.create(stream=True).
+        stop_tag: Closing tag that ends the action.
+        start_time: time.perf_counter() value taken before sending the request.
+
+    Returns:
+        Tuple of (text, metrics).
+    """
+    accumulator = _StreamAccumulator(stop_tag, start_time)
+    cut_off = False
+    try:
+        for chunk in stream:
+            if accumulator.feed(chunk):
+                cut_off = True
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return accumulator.finish(cut_off)
+
+
+async def aconsume_stream(
+    stream: AsyncIterator[Any],
+    stop_tag: str,
+    start_time: float,
+) -> Tuple[str, StreamMetrics]:
+    """Asynchronous counterpart of `consume_stream`."""
+    accumulator = _StreamAccumulator(stop_tag, start_time)
+    cut_off = False
+    try:
+        async for chunk in stream:
+            if accumulator.feed(chunk):
+                cut_off = True
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+    return accumulator.finish(cut_off)
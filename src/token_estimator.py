@@ -0,0 +1,223 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline estimation of a chat request's input tokens.
+
+Image tokens follow the Qwen-VL processor: the image is resized with
+smart_resize and every factor x factor patch becomes one token, plus the
+vision start/end tokens. Text tokens are counted with a Hugging Face
+tokenizer when one is configured and `transformers` is installed, and with
+`utils.approx_text_tokens` otherwise. The chat template adds a fixed number
+of tokens per message.
+"""
+
+import base64
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from logging_utils import get_logger
+from utils import approx_text_tokens, smart_resize, truncate_text_tokens
+
+logger = get_logger(__name__)
+
+# <|im_start|>, role, "\n", <|im_end|>, "\n"
+MESSAGE_OVERHEAD_TOKENS = 5
+# <|im_start|>assistant\n appended by add_generation_prompt
+GENERATION_PROMPT_TOKENS = 3
+# <|vision_start|> and <|vision_end|> around the image pad tokens
+IMAGE_OVERHEAD_TOKENS = 2
+# Base64 characters decoded to read an image header (a multiple of 4)
+_HEADER_BASE64_CHARS = 8192
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a request's estimated input tokens exceed the configured limit."""
+
+
+@dataclass
+class TokenEstimate:
+    """Estimated input tokens of a request."""
+
+    text_tokens: int = 0
+    image_tokens: int = 0
+    num_images: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.text_tokens + self.image_tokens
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(name_or_path: str) -> Optional[Any]:
+    """
+    Load (once per process) a Hugging Face tokenizer.
+
+    Returns:
+        The tokenizer, or None if `transformers` is not installed or the
+        tokenizer cannot be loaded.
+    """
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        logger.warning("transformers is not installed, approximating text tokens.")
+        return None
+    try:
+        return AutoTokenizer.from_pretrained(name_or_path)
+    except Exception as e:
+        logger.warning("Could not load tokenizer %s (%s), approximating text tokens.", name_or_path, e)
+        return None
+
+
+def data_url_image_size(url: str) -> Optional[Tuple[int, int]]:
+    """
+    Read the (width, height) of a base64 data-URL image from its header.
+
+    Only the first few KB are decoded; the whole payload is decoded only if
+    the header lies further in.
+
+    Returns:
+        Image size, or None if `url` is not a decodable data URL.
+    """
+    if not url.startswith("data:"):
+        return None
+    payload = url[url.find(",") + 1:]
+    for chunk in (payload[:_HEADER_BASE64_CHARS], payload):
+        try:
+            with Image.open(BytesIO(base64.b64decode(chunk))) as image:
+                return image.size
+        except Exception:
+            if len(chunk) == len(payload):
+                return None
+    return None
+
+
+class TokenEstimator:
+    """
+    Estimate the input tokens of chat messages without calling the server.
+
+    Args:
+        tokenizer: Hugging Face tokenizer name/path, a tokenizer object with
+            an `encode` method, or None to approximate text tokens.
+        factor: smart_resize patch factor; one image token per factor x factor
+            patch (32 for MAI-UI: 16 px patches merged 2 x 2).
+        min_pixels: The server processor's minimum image pixels.
+        max_pixels: The server processor's maximum image pixels.
+        cache_size: Number of distinct texts and images whose token counts
+            are cached; history messages repeat across steps.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Optional[Union[str, Any]] = None,
+        factor: int = 32,
+        min_pixels: int = 16 * 16 * 4 * 64,
+        max_pixels: int = 16 * 16 * 4 * 16384,
+        cache_size: int = 4096,
+    ) -> None:
+        if isinstance(tokenizer, str):
+            tokenizer = load_tokenizer(tokenizer)
+        self.tokenizer = tokenizer
+        self.factor = factor
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+        self.cache_size = cache_size
+        self.text_tokens = functools.lru_cache(maxsize=cache_size)(self._count_text)
+        # Image counts keyed by a digest of the data URL, so payloads are not kept alive
+        self._url_cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._url_lock = threading.Lock()
+
+    def _count_text(self, text: str) -> int:
+        if self.tokenizer is None:
+            return approx_text_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate_text(self, text: str, max_tokens: int) -> str:
+        """Truncate `text` to at most `max_tokens` tokens, counted as by `text_tokens`."""
+        if self.tokenizer is None:
+            return truncate_text_tokens(text, max_tokens)
+        token_ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(token_ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(token_ids[:max_tokens])
+
+    def image_tokens(self, width: int, height: int) -> int:
+        """Tokens of an image of the given size, after the server's smart_resize."""
+        resized_height, resized_width = smart_resize(
+            height, width, self.factor, self.min_pixels, self.max_pixels
+        )
+        return (resized_height // self.factor) * (resized_width // self.factor) + IMAGE_OVERHEAD_TOKENS
+
+    def _url_tokens(self, url: str) -> int:
+        key = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        with self._url_lock:
+            tokens = self._url_cache.get(key)
+            if tokens is not None:
+                self._url_cache.move_to_end(key)
+                return tokens
+        tokens = self._count_url(url)
+        with self._url_lock:
+            self._url_cache[key] = tokens
+            if len(self._url_cache) > self.cache_size:
+                self._url_cache.popitem(last=False)
+        return tokens
+
+    def _count_url(self, url: str) -> int:
+        size = data_url_image_size(url)
+        if size is None:
+            # Remote or undecodable image: assume the largest possible image
+            return self.max_pixels // (self.factor * self.factor) + IMAGE_OVERHEAD_TOKENS
+        return self.image_tokens(*size)
+
+    def content_tokens(self, item: Dict[str, Any]) -> Tuple[int, int]:
+        """Return (text_tokens, image_tokens) of one message content item."""
+        if item["type"] == "text":
+            return self.text_tokens(item["text"]), 0
+        if item["type"] == "image_url":
+            return 0, self._url_tokens(item["image_url"]["url"])
+        if item["type"] == "image" and isinstance(item.get("image"), Image.Image):
+            return 0, self.image_tokens(*item["image"].size)
+        raise ValueError(f"Unsupported message content type: {item['type']!r}")
+
+    def estimate(self, messages: List[Dict[str, Any]]) -> TokenEstimate:
+        """
+        Estimate the input tokens of a chat request.
+
+        Args:
+            messages: OpenAI-style messages, as built by the agents.
+
+        Returns:
+            TokenEstimate of the prompt, including the chat template and the
+            generation prompt.
+        """
+        estimate = TokenEstimate(text_tokens=GENERATION_PROMPT_TOKENS)
+        for message in messages:
+            estimate.text_tokens += MESSAGE_OVERHEAD_TOKENS
+            content = message["content"]
+            if isinstance(content, str):
+                estimate.text_tokens += self.text_tokens(content)
+                continue
+            for item in content:
+                text_tokens, image_tokens = self.content_tokens(item)
+                estimate.text_tokens += text_tokens
+                if image_tokens:
+                    estimate.image_tokens += image_tokens
+                    estimate.num_images += 1
+        return estimate
@@ -0,0 +1,281 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact trajectory archives.
+
+An archive is a zip file with:
+    trajectory.json    task goal, task id and format version
+    steps.jsonl        one JSON metadata line per step (TrajStep.to_metadata)
+    images/<sha256>    encoded screenshots, stored once per distinct content
+    deltas/<sha256>    with the "delta" codec, screenshots stored as changed
+                       rectangles against a keyframe (see screenshot_delta)
+
+Screenshots are stored raw (no base64) and uncompressed by zip since PNG is
+already compressed. The "delta" codec stores a screenshot as a keyframe
+whenever it changed too much for a delta to pay off; any step is restored
+from one keyframe and at most one delta.
+
+Steps are written one at a time, so episodes of any length are archived
+without holding all screenshots in memory, and reading an archive back
+yields a TrajMemory whose screenshots are only read and decoded when a
+step's image is accessed.
+"""
+
+import hashlib
+import json
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Dict, Optional, Set, Tuple
+
+from PIL import Image
+
+from screenshot_delta import apply_delta, encode_delta
+from unified_memory import ScreenshotRef, TrajMemory, TrajStep
+
+ARCHIVE_VERSION = 1
+HEADER_MEMBER = "trajectory.json"
+STEPS_MEMBER = "steps.jsonl"
+IMAGE_PREFIX = "images/"
+DELTA_PREFIX = "deltas/"
+CODECS = ("png", "delta")
+
+
+class TrajArchiveWriter:
+    """
+    Streaming writer of a trajectory archive.
+
+    Usage:
+        with TrajArchiveWriter(path, task_goal, task_id) as writer:
+            for step in steps:
+                writer.add_step(step)
+
+    Args:
+        path: Archive file path.
+        task_goal: The goal/instruction of the trajectory.
+        task_id: Unique identifier of the task.
+        codec: "png" stores every distinct screenshot; "delta" stores
+            changed rectangles against the last keyframe.
+        max_delta_ratio: With the delta codec, start a new keyframe when more
+            than this fraction of the screen changed.
+        delta_tile: Grid cell size in pixels used to find changed rectangles.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        task_goal: str = "",
+        task_id: str = "",
+        codec: str = "png",
+        max_delta_ratio: float = 0.3,
+        delta_tile: int = 32,
+    ) -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported archive codec: {codec!r}")
+        self.path = path
+        self.task_goal = task_goal
+        self.task_id = task_id
+        self.codec = codec
+        self.max_delta_ratio = max_delta_ratio
+        self.delta_tile = delta_tile
+        self.num_steps = 0
+        self._keyframe: Optional[Tuple[str, Image.Image]] = None
+        self._zip = zipfile.ZipFile(path, "w")
+        self._images: Set[str] = set()
+        # Step metadata is small; spool it and write it after the images
+        self._steps = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+b")
+
+    def add_step(self, step: TrajStep) -> None:
+        """Write a step's screenshot (if new) and buffer its metadata."""
+        metadata = step.to_metadata()
+        image = step.load_screenshot_bytes()
+        metadata["image"] = None
+        if image is not None:
+            digest = hashlib.sha256(image).hexdigest()
+            delta = None
+            if digest not in self._images and self.codec == "delta":
+                delta = self._encode_delta(Image.open(BytesIO(image)), digest)
+            if delta is not None:
+                metadata["delta"] = delta
+            else:
+                if digest not in self._images:
+                    self._zip.writestr(IMAGE_PREFIX + digest, image, compress_type=zipfile.ZIP_STORED)
+                    self._images.add(digest)
+                metadata["image"] = digest
+        self._steps.write(json.dumps(metadata).encode("utf-8") + b"\n")
+        self.num_steps += 1
+
+    def _encode_delta(self, image: Image.Image, digest: str) -> Optional[Tuple[str, str]]:
+        """Store `image` as a delta against the current keyframe, or make it the keyframe."""
+        image.load()
+        payload = None
+        if self._keyframe is not None:
+            payload = encode_delta(self._keyframe[1], image, self.delta_tile, self.max_delta_ratio)
+        if payload is None:
+            self._keyframe = (digest, image)
+            return None
+        patch = hashlib.sha256(payload).hexdigest()
+        if patch not in self._images:
+            self._zip.writestr(DELTA_PREFIX + patch, payload, compress_type=zipfile.ZIP_STORED)
+            self._images.add(patch)
+        return self._keyframe[0], patch
+
+    def close(self) -> None:
+        """Write the header and step metadata and close the archive."""
+        if self._zip.fp is None:
+            return
+        header = {
+            "version": ARCHIVE_VERSION,
+            "task_goal": self.task_goal,
+            "task_id": self.task_id,
+            "num_steps": self.num_steps,
+            "codec": self.codec,
+        }
+        self._zip.writestr(HEADER_MEMBER, json.dumps(header), compress_type=zipfile.ZIP_DEFLATED)
+        self._steps.seek(0)
+        with self._zip.open(STEPS_MEMBER, "w", force_zip64=True) as member:
+            while True:
+                chunk = self._steps.read(1024 * 1024)
+                if not chunk:
+                    break
+                member.write(chunk)
+        self._steps.close()
+        self._zip.close()
+
+    def __enter__(self) -> "TrajArchiveWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def write_traj_archive(memory: TrajMemory, path: str, **kwargs: Any) -> None:
+    """
+    Write a trajectory to an archive.
+
+    Args:
+        memory: Trajectory to archive; spilled or lazily loaded screenshots
+            are read one step at a time.
+        path: Archive file path.
+        **kwargs: Codec options of TrajArchiveWriter.
+    """
+    with TrajArchiveWriter(path, memory.task_goal, memory.task_id, **kwargs) as writer:
+        for step in memory.steps:
+            writer.add_step(step)
+
+
+class _ArchiveReader:
+    """Shared, thread-safe handle on an open archive."""
+
+    def __init__(self, path: str, keyframe_cache_size: int = 4) -> None:
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        self._lock = threading.Lock()
+        self._keyframes: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._keyframe_cache_size = keyframe_cache_size
+
+    def read(self, name: str) -> bytes:
+        with self._lock:
+            return self._zip.read(name)
+
+    def keyframe(self, digest: str) -> Image.Image:
+        """Return a decoded keyframe, caching the most recently used ones."""
+        with self._lock:
+            image = self._keyframes.get(digest)
+            if image is not None:
+                self._keyframes.move_to_end(digest)
+                return image
+        image = Image.open(BytesIO(self.read(IMAGE_PREFIX + digest)))
+        image.load()
+        with self._lock:
+            self._keyframes[digest] = image
+            if len(self._keyframes) > self._keyframe_cache_size:
+                self._keyframes.popitem(last=False)
+        return image
+
+    def close(self) -> None:
+        with self._lock:
+            self._zip.close()
+
+
+class ArchiveImageRef(ScreenshotRef):
+    """Screenshot stored as a member of a trajectory archive."""
+
+    __slots__ = ("reader", "digest")
+
+    def __init__(self, reader: _ArchiveReader, digest: str) -> None:
+        self.reader = reader
+        self.digest = digest
+
+    def read(self) -> bytes:
+        return self.reader.read(IMAGE_PREFIX + self.digest)
+
+
+class ArchiveDeltaRef(ScreenshotRef):
+    """Screenshot stored as a delta against a keyframe of a trajectory archive."""
+
+    __slots__ = ("reader", "keyframe", "patch")
+
+    def __init__(self, reader: _ArchiveReader, keyframe: str, patch: str) -> None:
+        self.reader = reader
+        self.keyframe = keyframe
+        self.patch = patch
+
+    def load_image(self) -> Image.Image:
+        return apply_delta(self.reader.keyframe(self.keyframe), self.reader.read(DELTA_PREFIX + self.patch))
+
+    def read(self) -> bytes:
+        # The restored pixels are identical; the PNG bytes may differ from the original
+        buffer = BytesIO()
+        self.load_image().save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+def read_traj_archive(path: str) -> TrajMemory:
+    """
+    Open a trajectory archive as a lazily hydrated TrajMemory.
+
+    Step metadata is loaded eagerly; screenshots are read from the archive
+    and decoded only when `TrajStep.load_screenshot` or
+    `TrajStep.load_screenshot_bytes` is called. The archive stays open while
+    any step references it.
+
+    Args:
+        path: Archive file path.
+
+    Returns:
+        TrajMemory with lazily loaded screenshots.
+    """
+    reader = _ArchiveReader(path)
+    header: Dict[str, Any] = json.loads(reader.read(HEADER_MEMBER))
+    if header.get("version") != ARCHIVE_VERSION:
+        reader.close()
+        raise ValueError(f"Unsupported trajectory archive version: {header.get('version')}")
+
+    refs: Dict[str, ScreenshotRef] = {}
+    steps = []
+    with reader._lock, reader._zip.open(STEPS_MEMBER) as member:
+        for line in member:
+            metadata = json.loads(line)
+            digest: Optional[str] = metadata.pop("image")
+            delta = metadata.pop("delta", None)
+            ref: Optional[ScreenshotRef] = None
+            if digest is not None:
+                ref = refs.setdefault(digest, ArchiveImageRef(reader, digest))
+            elif delta is not None:
+                ref = ArchiveDeltaRef(reader, *delta)
+            steps.append(TrajStep.from_metadata(metadata, screenshot_ref=ref))
+    return TrajMemory(task_goal=header["task_goal"], task_id=header["task_id"], steps=steps)
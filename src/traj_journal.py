@@ -0,0 +1,329 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Append-only on-disk journal for trajectories.
+
+A JournaledTrajMemory writes every step to its journal as it is appended and
+keeps screenshots in RAM only for the most recent steps; older screenshots
+are read back from the memory-mapped journal on access. Because steps are
+flushed as they are produced, the episode of a crashed worker can be
+recovered with `JournaledTrajMemory.recover`.
+
+Journal records are framed as kind (1 byte), payload length (uint32),
+CRC32 of the payload (uint32) and the payload. Kinds are "T" (task header,
+JSON), "I" (encoded screenshot), "S" (step metadata, JSON, referencing
+the offset and length of its "I" record) and "U" (updated metadata of the
+latest step, e.g. a user or MCP reply attached after the step was
+appended). A torn or corrupt tail is truncated when the journal is reopened.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+from logging_utils import get_logger
+from unified_memory import ScreenshotRef, TrajMemory, TrajStep
+
+logger = get_logger(__name__)
+
+_HEADER = struct.Struct("<cII")
+
+TASK_RECORD = b"T"
+IMAGE_RECORD = b"I"
+STEP_RECORD = b"S"
+UPDATE_RECORD = b"U"
+
+
+class TrajJournal:
+    """
+    Append-only record file with memory-mapped reads.
+
+    Args:
+        path: Journal file path, created on the first append; an existing
+            journal is reopened for appending after its valid records.
+        fsync: fsync after every step for durability against host crashes
+            (a flush is enough to survive a worker crash).
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        self._map_file = None
+        self._file = None
+        self._closed = False
+        self._size = 0
+        if os.path.exists(path):
+            self._size = self._valid_end()
+            if os.path.getsize(path) != self._size:
+                logger.warning("Truncating torn journal tail of %s at byte %d", path, self._size)
+                os.truncate(path, self._size)
+
+    def _scan(self, data: bytes) -> Iterator[Tuple[bytes, int, int]]:
+        position = 0
+        while position + _HEADER.size <= len(data):
+            kind, length, crc = _HEADER.unpack_from(data, position)
+            start = position + _HEADER.size
+            end = start + length
+            if end > len(data) or zlib.crc32(data[start:end]) != crc:
+                return
+            yield kind, start, length
+            position = end
+
+    def _valid_end(self) -> int:
+        if os.path.getsize(self.path) == 0:
+            return 0
+        end = 0
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for _, start, length in self._scan(data):
+                end = start + length
+        return end
+
+    def append(self, kind: bytes, payload: bytes, sync: bool = False) -> int:
+        """
+        Append one record.
+
+        Args:
+            kind: One-byte record kind.
+            payload: Record payload.
+            sync: Flush (and fsync if enabled) after writing.
+
+        Returns:
+            Offset of the payload in the journal.
+        """
+        with self._lock:
+            if self._file is None:
+                if self._closed:
+                    raise ValueError(f"Journal {self.path} is closed")
+                self._file = open(self.path, "ab")
+            self._file.write(_HEADER.pack(kind, len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            offset = self._size + _HEADER.size
+            self._size = offset + len(payload)
+            if sync:
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Read `length` payload bytes at `offset` through a memory map."""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Journal {self.path} is closed")
+            if self._map is None or offset + length > len(self._map):
+                if self._file is not None:
+                    self._file.flush()
+                self._remap()
+            return self._map[offset:offset + length]
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        if self._map_file is None:
+            self._map_file = open(self.path, "rb")
+        self._map = mmap.mmap(self._map_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def records(self) -> Iterator[Tuple[bytes, int, int]]:
+        """Yield (kind, payload offset, payload length) of every record."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            if self._size == 0:
+                return
+            self._remap()
+            data = self._map
+        yield from self._scan(data)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        """Stop appending and release the file handles and the memory map."""
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._map_file is not None:
+                self._map_file.close()
+                self._map_file = None
+
+    def delete(self) -> None:
+        """Close the journal and remove its file."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class JournalImageRef(ScreenshotRef):
+    """Screenshot stored in a TrajJournal."""
+
+    __slots__ = ("journal", "offset", "length")
+
+    def __init__(self, journal: TrajJournal, offset: int, length: int) -> None:
+        self.journal = journal
+        self.offset = offset
+        self.length = length
+
+    def read(self) -> bytes:
+        return self.journal.read(self.offset, self.length)
+
+
+class JournaledTrajMemory(TrajMemory):
+    """
+    TrajMemory that journals steps to disk and bounds screenshots in RAM.
+
+    Args:
+        path: Journal file path.
+        task_goal: The goal/instruction for this trajectory.
+        task_id: Unique identifier for the task.
+        keep_images: Number of most recent steps whose screenshots stay in
+            memory when `append_step` is called without an image window.
+        fsync: fsync the journal after every step.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        task_goal: str = "",
+        task_id: str = "",
+        keep_images: int = 2,
+        fsync: bool = False,
+    ) -> None:
+        super().__init__(task_goal=task_goal, task_id=task_id, steps=[])
+        self.keep_images = keep_images
+        self.journal = TrajJournal(path, fsync=fsync)
+        self._header: Optional[Tuple[str, str]] = None
+        # Metadata of the latest step as last written to the journal
+        self._journaled: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        return self.journal.path
+
+    def _write_header(self) -> None:
+        header = (self.task_goal, self.task_id)
+        if header != self._header:
+            payload = json.dumps({"task_goal": self.task_goal, "task_id": self.task_id})
+            self.journal.append(TASK_RECORD, payload.encode("utf-8"))
+            self._header = header
+
+    def sync_last_step(self) -> None:
+        """
+        Journal fields of the latest step that changed after it was appended.
+
+        The caller attaches ask_user_response and mcp_response to a step once
+        `predict` has returned; the agent calls this before the next request
+        so a crash does not lose them. Called by `append_step` and `close`.
+        """
+        if not self.steps:
+            return
+        metadata = json.dumps(self.steps[-1].to_metadata())
+        if metadata != self._journaled:
+            self.journal.append(UPDATE_RECORD, metadata.encode("utf-8"), sync=True)
+            self._journaled = metadata
+
+    def append_step(self, step: TrajStep, image_window: Optional[int] = None) -> None:
+        """
+        Journal a step, append it, and spill screenshots outside the window.
+
+        Args:
+            step: Step to append.
+            image_window: Number of most recent steps whose screenshots stay
+                in memory (default: keep_images).
+        """
+        self.sync_last_step()
+        self._write_header()
+        image = step.load_screenshot_bytes()
+        ref = None
+        if image is not None:
+            ref = JournalImageRef(self.journal, self.journal.append(IMAGE_RECORD, image), len(image))
+        metadata = step.to_metadata()
+        self._journaled = json.dumps(metadata)
+        metadata["image"] = [ref.offset, ref.length] if ref is not None else None
+        self.journal.append(STEP_RECORD, json.dumps(metadata).encode("utf-8"), sync=True)
+
+        step.screenshot_ref = ref
+        keep = self.keep_images if image_window is None else image_window
+        super().append_step(step, image_window=keep)
+        self.spill_images(keep)
+
+    def spill_images(self, keep_last: int) -> None:
+        """Release in-memory screenshots of all but the last `keep_last` steps."""
+        spill_until = len(self.steps) - max(keep_last, 0)
+        for step in self.steps[:max(spill_until, 0)]:
+            if step.screenshot_ref is not None and (
+                step.screenshot is not None or step.screenshot_bytes is not None
+            ):
+                step.spill_images(step.screenshot_ref)
+
+    def close(self) -> None:
+        """Journal pending step updates and stop; spilled screenshots are no longer readable."""
+        if not self.journal.closed:
+            self.sync_last_step()
+        self.journal.close()
+
+    def delete(self) -> None:
+        """Close and remove the journal, e.g. once the episode ended cleanly."""
+        self.journal.delete()
+
+    @classmethod
+    def recover(
+        cls, path: str, keep_images: int = 2, fsync: bool = False
+    ) -> "JournaledTrajMemory":
+        """
+        Rebuild a trajectory from its journal, e.g. after a worker crash.
+
+        Screenshots are not loaded; they are read from the journal on access.
+        Appending to the recovered memory continues the same journal.
+
+        Args:
+            path: Journal file path.
+            keep_images: See `JournaledTrajMemory`.
+            fsync: See `JournaledTrajMemory`.
+
+        Returns:
+            The recovered JournaledTrajMemory.
+        """
+        memory = cls(path, keep_images=keep_images, fsync=fsync)
+        steps: List[TrajStep] = []
+        for kind, offset, length in memory.journal.records():
+            payload = memory.journal.read(offset, length)
+            if kind == TASK_RECORD:
+                header = json.loads(payload)
+                memory.task_goal, memory.task_id = header["task_goal"], header["task_id"]
+                memory._header = (memory.task_goal, memory.task_id)
+            elif kind == STEP_RECORD:
+                metadata = json.loads(payload)
+                image = metadata.pop("image")
+                ref = JournalImageRef(memory.journal, *image) if image is not None else None
+                steps.append(TrajStep.from_metadata(metadata, screenshot_ref=ref))
+            elif kind == UPDATE_RECORD and steps:
+                steps[-1] = TrajStep.from_metadata(json.loads(payload), screenshot_ref=steps[-1].screenshot_ref)
+        memory.steps = steps
+        if steps:
+            memory._journaled = json.dumps(steps[-1].to_metadata())
+        return memory
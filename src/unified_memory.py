@@ -13,11 +13,31 @@
 
 """Unified memory structures for trajectory tracking."""
 
-from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+import base64
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, fields
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
 
 from PIL import Image
 
+from utils import safe_pil_to_bytes
+
+# TrajStep fields holding image data; they are not part of the step metadata
+IMAGE_FIELDS = ("screenshot", "screenshot_bytes", "image_url", "screenshot_ref")
+
+
+class ScreenshotRef(ABC):
+    """Handle to screenshot bytes stored outside the process (journal, archive)."""
+
+    @abstractmethod
+    def read(self) -> bytes:
+        """Return the encoded screenshot bytes."""
+
+    def load_image(self) -> Image.Image:
+        """Return the decoded screenshot."""
+        return Image.open(BytesIO(self.read()))
+
 
 @dataclass
 class TrajStep:
@@ -25,7 +45,8 @@ class TrajStep:
     Represents a single step in an agent's trajectory.
 
     Attributes:
-        screenshot: PIL Image of the screen at this step.
+        screenshot: PIL Image of the screen at this step, or None once the
+            image was spilled to `screenshot_ref`.
         accessibility_tree: Accessibility tree data for the screen.
         prediction: Raw model prediction/response.
         action: Parsed action dictionary.
@@ -36,9 +57,22 @@ class TrajStep:
         model_name: Name of the model used.
         screenshot_bytes: Original screenshot as bytes (for compatibility).
         structured_action: Structured action with metadata.
+        ask_user_response: User reply to an ask_user action, if any.
+        mcp_response: Result of an MCP tool call, if any.
+        image_url: Encoded data-URL payload of the screenshot, cached while
+            the step is inside the agent's image window.
+        image_size: (width, height) of the decoded screenshot.
+        content_hash: Hash of the screenshot pixels, set when the agent
+            deduplicates screenshots.
+        thumbnail: Grayscale thumbnail bytes used for near-duplicate checks.
+        duplicate_of_previous: Whether the screenshot is (near-)identical to
+            the previous step's screenshot.
+        screenshot_ref: Where the screenshot bytes live once they are no
+            longer held in memory. Use `load_screenshot` and
+            `load_screenshot_bytes` to access the image of any step.
     """
 
-    screenshot: Image.Image
+    screenshot: Optional[Image.Image]
     accessibility_tree: Optional[Dict[str, Any]]
     prediction: str
     action: Dict[str, Any]
@@ -51,6 +85,59 @@ class TrajStep:
     structured_action: Optional[Dict[str, Any]] = None
     ask_user_response: Optional[str] = None
     mcp_response: Optional[str] = None
+    image_url: Optional[str] = None
+    image_size: Optional[Tuple[int, int]] = None
+    content_hash: Optional[str] = None
+    thumbnail: Optional[bytes] = field(default=None, repr=False)
+    duplicate_of_previous: bool = False
+    screenshot_ref: Optional[ScreenshotRef] = field(default=None, repr=False)
+
+    def load_screenshot_bytes(self) -> Optional[bytes]:
+        """Return the encoded screenshot, reading it back from storage if needed."""
+        if self.screenshot_bytes is not None:
+            return self.screenshot_bytes
+        if self.screenshot_ref is not None:
+            return self.screenshot_ref.read()
+        if self.screenshot is not None:
+            return safe_pil_to_bytes(self.screenshot)
+        return None
+
+    def load_screenshot(self) -> Optional[Image.Image]:
+        """Return the screenshot as a PIL Image, decoding it from storage if needed."""
+        if self.screenshot is not None:
+            return self.screenshot
+        if self.screenshot_bytes is None and self.screenshot_ref is not None:
+            return self.screenshot_ref.load_image()
+        data = self.load_screenshot_bytes()
+        return Image.open(BytesIO(data)) if data is not None else None
+
+    def spill_images(self, ref: ScreenshotRef) -> None:
+        """Drop the in-memory images; they are read back from `ref` on access."""
+        self.screenshot_ref = ref
+        self.screenshot = None
+        self.screenshot_bytes = None
+        self.image_url = None
+
+    def to_metadata(self) -> Dict[str, Any]:
+        """Return the JSON-serializable fields of the step (everything but images)."""
+        metadata = {
+            f.name: getattr(self, f.name) for f in fields(self) if f.name not in IMAGE_FIELDS
+        }
+        if self.thumbnail is not None:
+            metadata["thumbnail"] = base64.b64encode(self.thumbnail).decode("ascii")
+        return metadata
+
+    @classmethod
+    def from_metadata(
+        cls, metadata: Dict[str, Any], screenshot_ref: Optional[ScreenshotRef] = None
+    ) -> "TrajStep":
+        """Rebuild a step from `to_metadata` output; images are loaded lazily from `screenshot_ref`."""
+        metadata = dict(metadata)
+        if metadata.get("thumbnail") is not None:
+            metadata["thumbnail"] = base64.b64decode(metadata["thumbnail"])
+        if metadata.get("image_size") is not None:
+            metadata["image_size"] = tuple(metadata["image_size"])
+        return cls(screenshot=None, screenshot_ref=screenshot_ref, **metadata)
 
 
 @dataclass
@@ -67,3 +154,27 @@ class TrajMemory:
     task_goal: str
     task_id: str
     steps: List[TrajStep] = field(default_factory=list)
+
+    def append_step(self, step: TrajStep, image_window: Optional[int] = None) -> None:
+        """
+        Append a step and release cached image payloads that left the window.
+
+        Args:
+            step: Step to append.
+            image_window: Number of most recent steps whose encoded screenshot
+                is still needed. None keeps every cached payload.
+        """
+        self.steps.append(step)
+        if image_window is not None:
+            self.evict_image_payloads(image_window)
+
+    def evict_image_payloads(self, keep_last: int) -> None:
+        """
+        Drop cached image payloads of all but the last `keep_last` steps.
+
+        Args:
+            keep_last: Number of most recent steps that keep their payload.
+        """
+        evict_until = len(self.steps) - max(keep_last, 0)
+        for step in self.steps[:max(evict_until, 0)]:
+            step.image_url = None
@@ -14,9 +14,13 @@
 """Utility functions for image processing and conversion."""
 
 import base64
+import hashlib
+import math
+from dataclasses import dataclass, fields
 from io import BytesIO
-from typing import Union, Optional, Tuple, Dict, Any
+from typing import Union, Optional, Tuple, Type, TypeVar, Dict, Any
 
+import numpy as np
 from PIL import Image
 from PIL import ImageDraw
 
@@ -31,10 +35,257 @@ def safe_pil_to_bytes(image: Union[Image.Image, bytes]) -> bytes:
     else:
         raise TypeError(f"Expected PIL Image or bytes, got {type(image)}")
 
-def pil_to_base64(image: Image.Image) -> str:
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+ConfigT = TypeVar("ConfigT")
+
+
+def config_from_conf(cls: Type[ConfigT], conf: Union[ConfigT, Dict[str, Any], None], label: str) -> ConfigT:
+    """
+    Build a config dataclass from an instance, a dict of its fields, or None.
+
+    Args:
+        cls: Config dataclass.
+        conf: An instance of `cls` (returned as is), a dict of its fields,
+            or None for the defaults.
+        label: Name of the config used in the error message.
+
+    Raises:
+        ValueError: If the dict has keys that are not fields of `cls`.
+    """
+    if isinstance(conf, cls):
+        return conf
+    conf = conf or {}
+    unknown = set(conf) - {f.name for f in fields(cls)}
+    if unknown:
+        raise ValueError(f"Unknown {label} keys: {sorted(unknown)}")
+    return cls(**conf)
+
+
+IMAGE_MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+@dataclass(frozen=True)
+class ImageCodec:
+    """
+    Wire encoding used for screenshots sent to the model.
+
+    Attributes:
+        format: One of "png", "jpeg" or "webp".
+        quality: Lossy quality (1-100) for JPEG/WebP; None uses the Pillow default.
+        compress_level: zlib level (0-9) for PNG; None uses the Pillow default (6).
+    """
+
+    format: str = "png"
+    quality: Optional[int] = None
+    compress_level: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if self.format not in IMAGE_MIME_TYPES:
+            raise ValueError(
+                f"Unsupported image format: {self.format}, expected one of {list(IMAGE_MIME_TYPES)}"
+            )
+
+    @classmethod
+    def from_conf(cls, runtime_conf: Dict[str, Any]) -> "ImageCodec":
+        """Build a codec from the image_format/image_quality/image_compress_level keys."""
+        return cls(
+            format=runtime_conf.get("image_format", "png").lower(),
+            quality=runtime_conf.get("image_quality"),
+            compress_level=runtime_conf.get("image_compress_level"),
+        )
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_MIME_TYPES[self.format]
+
+    def encode(self, image: Image.Image) -> bytes:
+        """Encode a PIL Image into bytes with this codec."""
+        params: Dict[str, Any] = {}
+        if self.format == "png":
+            if self.compress_level is not None:
+                params["compress_level"] = self.compress_level
+        elif self.quality is not None:
+            params["quality"] = self.quality
+        buffer = BytesIO()
+        image.save(buffer, format=self.format.upper(), **params)
+        return buffer.getvalue()
+
+    def to_data_url(self, image: Image.Image) -> str:
+        """Encode a PIL Image into a base64 data URL with this codec."""
+        encoded_string = base64.b64encode(self.encode(image)).decode("utf-8")
+        return f"data:{self.mime_type};base64,{encoded_string}"
+
+
+def smart_resize(
+    height: int,
+    width: int,
+    factor: int = 32,
+    min_pixels: int = 16 * 16 * 4,
+    max_pixels: int = 16 * 16 * 4 * 1280,
+) -> Tuple[int, int]:
+    """
+    Compute the size the Qwen-VL processor resizes an image to.
+
+    Same policy as `qwen_vl_utils.smart_resize` (used by eval_server.py): both
+    sides are rounded to a multiple of `factor` and the image is scaled so
+    its area lies within [min_pixels, max_pixels], keeping the aspect ratio.
+
+    Returns:
+        Tuple of (resized_height, resized_width).
+    """
+    if max(height, width) / min(height, width) > 200:
+        raise ValueError(
+            f"absolute aspect ratio must be smaller than 200, got {max(height, width) / min(height, width)}"
+        )
+    h_bar = max(factor, round(height / factor) * factor)
+    w_bar = max(factor, round(width / factor) * factor)
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(factor, math.floor(height / beta / factor) * factor)
+        w_bar = max(factor, math.floor(width / beta / factor) * factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / factor) * factor
+        w_bar = math.ceil(width * beta / factor) * factor
+    return h_bar, w_bar
+
+
+def resize_to_pixel_budget(
+    image: Image.Image,
+    min_pixels: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+    factor: int = 32,
+) -> Image.Image:
+    """
+    Resize an image to the model's pixel budget before encoding.
+
+    The model predicts coordinates normalized to the image it sees, so
+    normalized outputs stay valid for the original screenshot and are mapped
+    back by multiplying with the original width and height.
+
+    Args:
+        image: PIL Image to resize.
+        min_pixels: Minimum number of pixels (None disables the lower bound).
+        max_pixels: Maximum number of pixels (None disables the upper bound).
+        factor: Both sides are rounded to a multiple of this value.
+
+    Returns:
+        Resized image, or the input image if no budget is set or the size
+        is unchanged.
+    """
+    if min_pixels is None and max_pixels is None:
+        return image
+    resized_height, resized_width = smart_resize(
+        image.height,
+        image.width,
+        factor=factor,
+        min_pixels=min_pixels or 0,
+        max_pixels=max_pixels or image.height * image.width * 4,
+    )
+    if (resized_width, resized_height) == image.size:
+        return image
+    return image.resize((resized_width, resized_height))
+
+
+def image_content_hash(image: Union[Image.Image, bytes]) -> str:
+    """
+    Hash the content of a screenshot.
+
+    Encoded bytes are hashed as they are; PIL Images by their pixels, mode
+    and size.
+
+    Returns:
+        Hex digest.
+    """
+    if isinstance(image, bytes):
+        return hashlib.blake2b(image, digest_size=16).hexdigest()
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def image_fingerprint(
+    image: Image.Image,
+    thumbnail_size: Tuple[int, int] = (64, 64),
+) -> Tuple[str, bytes]:
+    """
+    Compute a content hash and a small grayscale thumbnail of an image.
+
+    The hash detects pixel-identical screenshots; the thumbnail is compared
+    with `thumbnail_change_ratio` to detect near-identical ones cheaply.
+
+    Args:
+        image: PIL Image to fingerprint.
+        thumbnail_size: (width, height) of the grayscale thumbnail.
+
+    Returns:
+        Tuple of (hex digest, raw 8-bit thumbnail bytes).
+    """
+    thumbnail = image.resize(thumbnail_size, Image.BOX).convert("L").tobytes()
+    return image_content_hash(image), thumbnail
+
+
+def thumbnail_change_ratio(a: bytes, b: bytes, tolerance: int = 8) -> float:
+    """
+    Fraction of thumbnail cells that differ by more than `tolerance` gray levels.
+
+    Args:
+        a: Thumbnail bytes from `image_fingerprint`.
+        b: Thumbnail bytes of the same size.
+        tolerance: Per-cell difference ignored as noise (0-255).
+
+    Returns:
+        Changed fraction in [0, 1]; 1.0 if the thumbnails are not comparable.
+    """
+    if len(a) != len(b) or not a:
+        return 1.0
+    diff = np.abs(
+        np.frombuffer(a, dtype=np.uint8).astype(np.int16) - np.frombuffer(b, dtype=np.uint8)
+    )
+    return float(np.count_nonzero(diff > tolerance)) / diff.size
+
+
+def approx_text_tokens(text: str) -> int:
+    """
+    Approximate the token count of `text` without a tokenizer.
+
+    Counts about four ASCII characters per token and one token per other
+    (e.g. CJK) character, close enough to BPE tokenizers for budgeting.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4) + len(text) - ascii_chars
+
+
+def truncate_text_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate `text` to about `max_tokens` tokens (see `approx_text_tokens`).
+
+    Args:
+        text: Text to truncate.
+        max_tokens: Approximate token limit.
+
+    Returns:
+        `text` unchanged if it fits, otherwise its longest fitting prefix.
+    """
+    if approx_text_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * 4
+    for end, char in enumerate(text):
+        budget -= 1 if char.isascii() else 4
+        if budget < 0:
+            return text[:end]
+    return text
+
+
+def pil_to_base64(image: Image.Image, codec: Optional[ImageCodec] = None) -> str:
+    if codec is None:
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return base64.b64encode(codec.encode(image)).decode("utf-8")
 
 def save_screenshot(screenshot: Image.Image, path: str) -> None:
   screenshot.save(path)
@@ -0,0 +1,259 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for endpoint load balancing.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import openai
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import endpoints
+from endpoints import (
+    ConsistentHashRing,
+    EndpointPool,
+    EndpointPoolConfig,
+    RoutedClient,
+    scrape_prefix_cache_hit_rate,
+)
+from mai_grounding_agent import MAIGroundingAgent
+from mai_naivigation_agent import MAIUINaivigationAgent
+
+URLS = ["http://a.test/v1", "http://b.test/v1", "http://c.test/v1"]
+
+
+@pytest.fixture
+def pool():
+    return EndpointPool(URLS, EndpointPoolConfig(health_check_interval=0, min_samples=2, eject_seconds=10))
+
+
+def test_least_outstanding_routing(pool):
+    """Concurrent requests spread over replicas by outstanding count."""
+    first = pool.acquire()
+    second = pool.acquire()
+    third = pool.acquire()
+    assert {first.url, second.url, third.url} == set(URLS)
+
+    pool.release(second, 0.1, ok=True)
+    assert pool.acquire() is second
+
+
+def test_failing_replica_ejected_and_reinstated(pool):
+    """Consecutive failures take a replica out until the cool-down ends."""
+    bad = pool.endpoints[0]
+    for _ in range(pool.config.max_failures):
+        pool.release(pool.acquire([bad]), None, ok=False)
+
+    assert all(pool.acquire().url != bad.url for _ in range(6))
+
+    with patch.object(endpoints.time, "monotonic", return_value=bad.ejected_until + 1):
+        assert bad.available(endpoints.time.monotonic())
+        assert bad.url in {pool.acquire().url for _ in range(6)}
+
+
+def test_unhealthy_replica_skipped(pool):
+    """Replicas failing the health check are not routed to."""
+    ok_response = MagicMock(status_code=200)
+    with patch.object(endpoints.httpx, "get", side_effect=[ok_response, endpoints.httpx.ConnectError("down"), ok_response]):
+        pool.check_health()
+    assert not pool.endpoints[1].healthy
+    assert all(pool.acquire().url != URLS[1] for _ in range(6))
+
+
+def test_slow_replica_ejected(pool):
+    """A replica much slower than its peers is ejected."""
+    fast_a, fast_b, slow = pool.endpoints
+    for _ in range(pool.config.min_samples):
+        pool.release(pool.acquire([fast_a]), 0.1, ok=True)
+        pool.release(pool.acquire([fast_b]), 0.1, ok=True)
+        pool.release(pool.acquire([slow]), 2.0, ok=True)
+
+    assert not slow.available(endpoints.time.monotonic())
+    assert fast_a.available(endpoints.time.monotonic())
+
+
+def test_last_replica_never_ejected():
+    """Ejection keeps at least one replica in rotation."""
+    pool = EndpointPool(URLS[:1], EndpointPoolConfig(health_check_interval=0))
+    for _ in range(5):
+        pool.release(pool.acquire(), None, ok=False)
+    assert pool.endpoints[0].available(endpoints.time.monotonic())
+
+
+def test_routed_client_keeps_stream_leased(pool):
+    """A streamed request stays outstanding until its stream is closed."""
+    clients = {url: MagicMock() for url in URLS}
+    routed = RoutedClient(pool, clients)
+
+    stream = routed.chat.completions.create(model="m", messages=[], stream=True)
+    leased = [e for e in pool.endpoints if e.outstanding]
+    assert len(leased) == 1
+    clients[leased[0].url].chat.completions.create.assert_called_once()
+
+    stream.close()
+    assert leased[0].outstanding == 0
+
+
+def test_client_errors_and_cancellation_do_not_eject(pool):
+    """Only transport errors, timeouts, 5xx and 429 count as replica failures."""
+    clients = {url: MagicMock() for url in URLS}
+    routed = RoutedClient(pool, clients)
+    request = httpx.Request("POST", URLS[0])
+    bad_request = openai.BadRequestError("too long", response=httpx.Response(400, request=request), body=None)
+    for client in clients.values():
+        client.chat.completions.create.side_effect = bad_request
+    for _ in range(pool.config.max_failures * len(URLS)):
+        with pytest.raises(openai.BadRequestError):
+            routed.chat.completions.create(model="m", messages=[])
+    assert all(e.available(endpoints.time.monotonic()) and not e.outstanding for e in pool.endpoints)
+
+    async_clients = {url: MagicMock() for url in URLS}
+    for client in async_clients.values():
+        client.chat.completions.create = AsyncMock(side_effect=asyncio.CancelledError())
+    async_routed = RoutedClient(pool, async_clients, is_async=True)
+    for _ in range(pool.config.max_failures * len(URLS)):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(async_routed.chat.completions.create(model="m", messages=[]))
+    assert all(not e.consecutive_failures for e in pool.endpoints)
+
+    for client in clients.values():
+        client.chat.completions.create.side_effect = openai.APIConnectionError(request=request)
+    for _ in range(pool.config.max_failures):
+        with pytest.raises(openai.APIConnectionError):
+            routed.chat.completions.create(model="m", messages=[])
+    assert sum(e.consecutive_failures for e in pool.endpoints) == pool.config.max_failures
+
+
+def test_health_checks_send_api_key(pool):
+    """Health checks authenticate with the API key of each replica's client."""
+    clients = {url: MagicMock(api_key=f"key-{i}") for i, url in enumerate(URLS)}
+    RoutedClient(pool, clients)
+    with patch.object(endpoints.httpx, "get", return_value=MagicMock(status_code=200)) as get:
+        pool.check_health()
+    assert [call.kwargs["headers"] for call in get.call_args_list] == [
+        {"Authorization": f"Bearer key-{i}"} for i in range(len(URLS))
+    ]
+
+
+def test_agent_routes_over_replicas():
+    """An agent given several base URLs spreads requests over them."""
+    conf = {"endpoint_pool": {"health_check_interval": 0}}
+    with patch("mai_grounding_agent.OpenAI") as openai_cls:
+        openai_cls.side_effect = lambda base_url, **kwargs: MagicMock(name=base_url)
+        agent = MAIGroundingAgent(URLS[:2], "test-model", runtime_conf=conf)
+
+    assert isinstance(agent.llm, RoutedClient)
+    for client in agent.llm.clients.values():
+        client.chat.completions.create.return_value.choices[0].message.content = (
+            "<answer>{\"coordinate\": [10, 20]}</answer>"
+        )
+
+    for _ in range(4):
+        _, result = agent.predict("tap", Image.new("RGB", (64, 64)))
+    assert result["coordinate"] == [10 / 999, 20 / 999]
+    calls = [client.chat.completions.create.call_count for client in agent.llm.clients.values()]
+    assert sum(calls) == 4 and all(calls)
+
+
+def test_hash_ring_remaps_only_removed_replica():
+    """Removing a replica only moves the sessions that were pinned to it."""
+    full = ConsistentHashRing(URLS)
+    reduced = ConsistentHashRing(URLS[:2])
+    keys = [f"task-{i}" for i in range(200)]
+    for key in keys:
+        pinned = full.preference(key)
+        assert sorted(pinned) == sorted(URLS)
+        if pinned[0] != URLS[2]:
+            assert reduced.preference(key)[0] == pinned[0]
+
+
+def test_session_pinned_until_overloaded():
+    """A session sticks to its replica and spills over once it is overloaded."""
+    pool = EndpointPool(URLS, EndpointPoolConfig(health_check_interval=0, affinity_spill_outstanding=2))
+    pinned = pool.acquire(session_key="task-1")
+    pool.release(pinned, 0.1, ok=True)
+    for _ in range(5):
+        endpoint = pool.acquire(session_key="task-1")
+        assert endpoint is pinned
+        pool.release(endpoint, 0.1, ok=True)
+
+    held = [pool.acquire(session_key="task-1") for _ in range(2)]
+    assert all(endpoint is pinned for endpoint in held)
+    spilled = pool.acquire(session_key="task-1")
+    assert spilled is not pinned
+    assert spilled.url == pool._ring.preference("task-1")[1]
+
+
+def test_prefix_cache_stats_from_usage(pool):
+    """Cached prompt tokens reported in usage blocks give a per-replica hit rate."""
+    endpoint = pool.endpoints[0]
+    response = MagicMock()
+    response.usage.prompt_tokens = 1000
+    response.usage.prompt_tokens_details.cached_tokens = 800
+    pool.record_usage(endpoint, response)
+    pool.record_usage(endpoint, MagicMock())  # no usage reported
+
+    stats = pool.prefix_cache_stats()
+    assert stats[endpoint.url] == {"prompt_tokens": 1000, "cached_tokens": 800, "hit_rate": 0.8}
+    assert stats[URLS[1]]["hit_rate"] is None
+
+
+def test_scrape_prefix_cache_hit_rate():
+    """The hit rate is read from vLLM's prefix-cache counters at the server root."""
+    metrics = (
+        "# HELP vllm:prefix_cache_queries Prefix cache queries\n"
+        'vllm:prefix_cache_queries_total{model_name="m"} 400.0\n'
+        'vllm:prefix_cache_hits_total{model_name="m"} 300.0\n'
+    )
+    with patch.object(endpoints.httpx, "get", return_value=MagicMock(status_code=200, text=metrics)) as get:
+        assert scrape_prefix_cache_hit_rate("http://a.test:8000/v1") == 0.75
+    get.assert_called_once_with("http://a.test:8000/metrics", timeout=5.0)
+
+    with patch.object(endpoints.httpx, "get", return_value=MagicMock(status_code=404)):
+        assert scrape_prefix_cache_hit_rate("http://a.test:8000/v1") is None
+
+
+def test_navigation_agent_pins_episode():
+    """With session affinity every step of an episode hits the same replica."""
+    conf = {"endpoint_pool": {"health_check_interval": 0}, "session_affinity": True}
+    with patch("mai_naivigation_agent.OpenAI") as openai_cls:
+        openai_cls.side_effect = lambda base_url, **kwargs: MagicMock(name=base_url)
+        agent = MAIUINaivigationAgent(URLS, "test-model", runtime_conf=conf)
+    for client in agent.llm.clients.values():
+        client.chat.completions.create.return_value.choices[0].message.content = (
+            '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+            '"arguments":{"action":"click","coordinate":[500,500]}}</tool_call>'
+        )
+
+    def calls():
+        return {url: client.chat.completions.create.call_count for url, client in agent.llm.clients.items()}
+
+    agent.traj_memory.task_id = "episode-7"
+    for _ in range(4):
+        agent.predict("Open settings", {"screenshot": Image.new("RGB", (64, 64))})
+    pinned = agent.llm.pool._ring.preference("episode-7")[0]
+    assert calls()[pinned] == 4
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,189 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the persistent grounding result cache.
+"""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from grounding_cache import GroundingCache, GroundingCacheConfig, get_grounding_cache
+from mai_grounding_agent import AsyncMAIGroundingAgent, MAIGroundingAgent
+from utils import safe_pil_to_bytes
+
+GROUNDING_RESPONSE = "<grounding_think>gear</grounding_think>\n<answer>\n{\"coordinate\": [999, 0]}\n</answer>"
+RESULT = {"thinking": "gear", "coordinate": [1.0, 0.0]}
+
+
+def make_agent(cache, agent_class=MAIGroundingAgent, **conf):
+    with patch('mai_grounding_agent.OpenAI'), patch('mai_grounding_agent.AsyncOpenAI'):
+        agent = agent_class("http://test.com", "test-model", runtime_conf={"grounding_cache": cache, **conf})
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = GROUNDING_RESPONSE
+    if agent_class is AsyncMAIGroundingAgent:
+        agent.llm.chat.completions.create = AsyncMock(return_value=completion)
+    else:
+        agent.llm.chat.completions.create.return_value = completion
+    return agent
+
+
+def test_memory_lru_and_stats():
+    """The in-memory level evicts the least recently used result."""
+    cache = GroundingCache({"max_entries": 2})
+    cache.put("a", "ns", "pa", RESULT)
+    cache.put("b", "ns", "pb", RESULT)
+    assert cache.get("a") == ("pa", RESULT)
+    cache.put("c", "ns", "pc", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == "pa" and cache.get("c")[0] == "pc"
+
+    cache.get("a")[1]["coordinate"] = None
+    assert cache.get("a")[1] == RESULT
+
+    stats = cache.stats.as_dict()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (5, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(5 / 6)
+
+
+def test_results_do_not_share_nested_values(tmp_path):
+    """Mutating a stored or returned coordinate never changes the cached result."""
+    cache = GroundingCache({"path": str(tmp_path / "cache.sqlite")})
+    result = {"thinking": "gear", "coordinate": [1.0, 0.0]}
+    cache.put("a", "ns", "pa", result)
+    result["coordinate"][0] = 0.5
+    cache.get("a")[1]["coordinate"][0] = 0.25
+    assert cache.get("a") == ("pa", RESULT)
+
+    cache._memory.clear()
+    cache.get("a")[1]["coordinate"][1] = 0.75
+    assert cache.get("a") == ("pa", RESULT)
+    assert cache.stats.disk_hits == 1
+    cache.close()
+
+
+def test_sqlite_persistence_and_eviction(tmp_path):
+    """Results survive a new cache on the same file; the LRU beyond max_disk_entries is deleted."""
+    config = GroundingCacheConfig(path=str(tmp_path / "cache" / "grounding.sqlite"), max_disk_entries=2)
+    cache = GroundingCache(config)
+    for key in ("a", "b", "c"):
+        cache.put(key, "ns", f"p{key}", RESULT)
+    cache.close()
+
+    reopened = GroundingCache(config)
+    assert reopened.get("a") is None
+    assert reopened.get("c") == ("pc", RESULT)
+    assert reopened.stats.disk_hits == 1
+    reopened.clear("other")
+    assert reopened.get("b") == ("pb", RESULT)
+    reopened.clear()
+    assert reopened.get("b") is None
+    reopened.close()
+
+
+def test_ttl_expiry(tmp_path):
+    """Results older than ttl are dropped from both levels."""
+    cache = GroundingCache({"path": str(tmp_path / "cache.sqlite"), "ttl": 60})
+    with patch("grounding_cache.time.time", return_value=1000.0):
+        cache.put("a", "ns", "pa", RESULT)
+    with patch("grounding_cache.time.time", return_value=1059.0):
+        assert cache.get("a") is not None
+    with patch("grounding_cache.time.time", return_value=1061.0):
+        assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    cache.close()
+
+
+def test_agent_caches_by_content_and_configuration(tmp_path):
+    """Repeated requests are answered from the cache; a new configuration misses."""
+    conf = {"path": str(tmp_path / "cache.sqlite")}
+    agent = make_agent(conf)
+    image = Image.new("RGB", (100, 200), (0, 0, 255))
+    assert agent.predict("open settings", image) == (GROUNDING_RESPONSE, RESULT)
+    assert agent.predict("open settings", image.copy()) == (GROUNDING_RESPONSE, RESULT)
+    assert agent.llm.chat.completions.create.call_count == 1
+    assert get_grounding_cache(conf) is agent.cache
+
+    agent.predict("open wifi", image)
+    assert agent.llm.chat.completions.create.call_count == 2
+
+    # Another model or sampling configuration does not see these results
+    other = make_agent(conf, temperature=0.5)
+    other.predict("open settings", image)
+    other.predict("open settings", image)
+    assert other.llm.chat.completions.create.call_count == 1
+    assert other.cache_namespace != agent.cache_namespace
+    assert make_agent(conf, stream=True).cache_namespace == agent.cache_namespace
+
+
+def test_failures_are_not_cached():
+    """Errors are not stored, so the request is sent again."""
+    agent = make_agent({}, retry_policy={"max_attempts": 1})
+    agent.llm.chat.completions.create.return_value.choices[0].message.content = "<answer>{bad</answer>"
+    image = Image.new("RGB", (100, 200))
+    agent.predict("open settings", image)
+    agent.predict("open settings", image)
+    assert agent.llm.chat.completions.create.call_count == 2
+    assert agent.cache.stats.stores == 0
+
+
+def test_batch_sends_only_misses():
+    """predict_batch answers cached requests locally, in input order."""
+    agent = make_agent({})
+    image = safe_pil_to_bytes(Image.new("RGB", (100, 200), (0, 255, 0)))
+    agent.predict("b", image)
+
+    results = agent.predict_batch([("a", image), ("b", image), ("c", image)])
+    assert [prediction for prediction, _ in results] == [GROUNDING_RESPONSE] * 3
+    assert agent.llm.chat.completions.create.call_count == 3
+
+    async_agent = make_agent(agent.cache, AsyncMAIGroundingAgent)
+    results = asyncio.run(async_agent.predict_batch([("a", image), ("d", image)]))
+    assert [result for _, result in results] == [RESULT, RESULT]
+    assert async_agent.llm.chat.completions.create.await_count == 1
+
+
+
+def test_async_agent_queries_sqlite_off_the_event_loop(tmp_path):
+    """The async agent reads and writes the persistent cache in worker threads."""
+    cache = GroundingCache({"path": str(tmp_path / "cache.sqlite")})
+    agent = make_agent(cache, AsyncMAIGroundingAgent)
+    threads = []
+    get, put = cache.get, cache.put
+
+    def record(method):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+        return wrapper
+
+    image = Image.new("RGB", (100, 200), (255, 0, 0))
+    with patch.object(cache, "get", record(get)), patch.object(cache, "put", record(put)):
+        asyncio.run(agent.predict("open settings", image))
+        asyncio.run(agent.predict_batch([("open wifi", image)]))
+    assert len(threads) == 4 and threading.get_ident() not in threads
+    cache.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,178 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for guided decoding of the action space.
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import httpx
+import openai
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from guided_decoding import (
+    guided_extra_body,
+    parse_action_space,
+    response_regex,
+    tool_call_schema,
+)
+from mai_naivigation_agent import MAIUINaivigationAgent
+from prompt import MAI_MOBILE_SYS_PROMPT, MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP
+
+OUTPUT_MESSAGES_DIR = Path(__file__).parent / "output_messages"
+MCP_TOOLS = [{"name": "get_weather", "parameters": {"type": "object", "properties": {"location": {"type": "string"}}}}]
+
+
+def call(arguments, name="mobile_use"):
+    return f"<thinking>\nplan\n</thinking>\n<tool_call>\n{json.dumps({'name': name, 'arguments': arguments})}\n</tool_call>"
+
+
+def test_parse_action_space():
+    """Coordinates, enums and optional fields are read from the prompt."""
+    actions = {action.name: action for action in parse_action_space(MAI_MOBILE_SYS_PROMPT)}
+    assert list(actions) == [
+        "click", "long_press", "type", "swipe", "open", "drag",
+        "system_button", "wait", "terminate", "answer",
+    ]
+    assert actions["swipe"].fields == [("direction", ("up", "down", "left", "right")), ("coordinate", "coordinate")]
+    assert actions["swipe"].optional == ("coordinate",)
+    assert actions["system_button"].fields == [("button", ("back", "home", "menu", "enter"))]
+    assert actions["terminate"].fields == [("status", ("success", "fail"))]
+    assert actions["type"].fields == [("text", "string")]
+    assert actions["wait"].fields == []
+
+    mcp_prompt = MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP.render(tools="")
+    assert {"ask_user", "double_click"} <= {action.name for action in parse_action_space(mcp_prompt)}
+
+
+@pytest.mark.parametrize("response, accepted", [
+    (call({"action": "click", "coordinate": [500, 250]}), True),
+    (call({"action": "swipe", "direction": "up"}), True),
+    (call({"action": "swipe", "direction": "up", "coordinate": [1, 2]}), True),
+    (call({"action": "type", "text": 'say "hi"\n'}), True),
+    (call({"location": "Paris"}, name="get_weather"), True),
+    ("plan</think>" + call({"action": "wait"}).split("</thinking>")[1], True),
+    (call({"action": "system_button", "button": "power"}), False),
+    (call({"action": "click", "coordinate": [500]}), False),
+    (call({"action": "click"}), False),
+    (call({"action": "scroll", "direction": "up"}), False),
+    (call({"action": "wait"}).replace("</tool_call>", ""), False),
+])
+def test_response_regex(response, accepted):
+    """The response regex accepts exactly the prompt's actions and MCP tools."""
+    mcp_prompt = MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP.render(tools="x")
+    pattern = re.compile(response_regex(parse_action_space(mcp_prompt), MCP_TOOLS))
+    assert bool(pattern.fullmatch(response)) is accepted
+
+
+def test_response_regex_without_thinking():
+    """Without thinking the response is the bare tool call."""
+    pattern = re.compile(response_regex(parse_action_space(MAI_MOBILE_SYS_PROMPT), thinking=False))
+    assert pattern.fullmatch('<tool_call>\n{"name":"mobile_use","arguments":{"action":"wait"}}\n</tool_call>')
+    assert not pattern.fullmatch(call({"action": "wait"}))
+
+
+def test_response_regex_accepts_recorded_responses():
+    """Every recorded assistant response with a prompt action matches the regex."""
+    mcp_prompt = MAI_MOBILE_SYS_PROMPT_ASK_USER_MCP.render(tools="x")
+    tools = [{"name": "get_weather"}, {"name": "search_restaurant"}]
+    pattern = re.compile(response_regex(parse_action_space(mcp_prompt), tools))
+    responses = [
+        message["content"][0]["text"]
+        for path in OUTPUT_MESSAGES_DIR.glob("*.json")
+        for message in json.loads(path.read_text())
+        # The fixtures' "mcp_tool" action is not in the action space
+        if message["role"] == "assistant" and '"mcp_tool"' not in message["content"][0]["text"]
+    ]
+    assert responses
+    assert all(pattern.fullmatch(response) for response in responses)
+
+
+def test_tool_call_schema():
+    """The schema has one branch per action and per MCP tool."""
+    schema = tool_call_schema(parse_action_space(MAI_MOBILE_SYS_PROMPT), MCP_TOOLS)
+    mobile_use, weather = schema["anyOf"]
+    assert weather["properties"]["arguments"] == MCP_TOOLS[0]["parameters"]
+    swipe = mobile_use["properties"]["arguments"]["anyOf"][3]
+    assert swipe["properties"]["action"] == {"const": "swipe"}
+    assert swipe["required"] == ["action", "direction"]
+
+    body = guided_extra_body("structural_tag", MAI_MOBILE_SYS_PROMPT)
+    assert body["response_format"]["triggers"] == ["<tool_call>"]
+    with pytest.raises(ValueError):
+        guided_extra_body("grammar", MAI_MOBILE_SYS_PROMPT)
+    with pytest.raises(ValueError):
+        guided_extra_body("regex", "no actions here")
+
+
+def test_agent_falls_back_when_guided_decoding_is_rejected():
+    """A server without guided decoding support gets unconstrained requests."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model", runtime_conf={"guided_decoding": "regex"}
+        )
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = call({"action": "wait"})
+    rejected = openai.BadRequestError(
+        "unknown field guided_regex",
+        response=httpx.Response(400, request=httpx.Request("POST", "http://test.com")),
+        body=None,
+    )
+    create = agent.llm.chat.completions.create
+    create.side_effect = [rejected, completion, completion]
+
+    screenshot = {"screenshot": Image.new("RGB", (100, 200))}
+    assert agent.predict("Wait", screenshot)[1] == {"action": "wait"}
+    first, second = (c.kwargs["extra_body"] for c in create.call_args_list)
+    assert "guided_regex" in first and "guided_regex" not in second
+    assert second["top_k"] == -1
+
+    agent.predict("Wait", screenshot)
+    assert "guided_regex" not in create.call_args.kwargs["extra_body"]
+    assert create.call_count == 3
+
+
+def test_unrelated_bad_request_keeps_guided_decoding():
+    """A 400 that is not about guided decoding is not resent unconstrained."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model", runtime_conf={"guided_decoding": "regex"}
+        )
+    too_long = openai.BadRequestError(
+        "maximum context length is 32768 tokens",
+        response=httpx.Response(400, request=httpx.Request("POST", "http://test.com")),
+        body=None,
+    )
+    create = agent.llm.chat.completions.create
+    create.side_effect = too_long
+
+    with pytest.raises(openai.BadRequestError):
+        agent._complete([{"role": "user", "content": "Wait"}])
+    assert agent.predict("Wait", {"screenshot": Image.new("RGB", (100, 200))})[0] == "llm client error"
+    assert create.call_count == 2
+    assert "guided_regex" in agent.guided_extra_body
+    assert "guided_regex" in create.call_args.kwargs["extra_body"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,63 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the agent logging helpers.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import logging_utils
+from logging_utils import LOGGER_NAME, configure_logging, get_logger
+
+
+def test_records_propagate_to_application_handlers(caplog):
+    """By default the agent logger only has a NullHandler and propagates."""
+    logger = get_logger("test")
+    root = logging.getLogger(LOGGER_NAME)
+    assert root.propagate
+    assert all(isinstance(handler, logging.NullHandler) for handler in root.handlers)
+
+    with caplog.at_level(logging.INFO, logger=LOGGER_NAME):
+        logger.info("hello %s", "world")
+    assert caplog.records[-1].getMessage() == "hello world"
+
+
+def test_configure_logging_is_opt_in():
+    """configure_logging installs the queue-backed stream sink."""
+    root = logging.getLogger(LOGGER_NAME)
+    saved = root.handlers[:], root.level, root.propagate
+    stream = io.StringIO()
+    try:
+        configure_logging(stream=stream)
+        assert not root.propagate
+        get_logger("test").info("queued")
+        logging_utils._listener.stop()
+        logging_utils._listener = None
+        assert stream.getvalue() == "queued\n"
+    finally:
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1])
+        root.propagate = saved[2]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
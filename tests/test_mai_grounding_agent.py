@@ -0,0 +1,281 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for MAIGroundingAgent.predict functionality.
+"""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mai_grounding_agent import AsyncMAIGroundingAgent, MAIGroundingAgent
+
+
+GROUNDING_RESPONSE = (
+    "<grounding_think>The settings icon is at the top right.</grounding_think>\n"
+    "<answer>\n{\"coordinate\": [999, 0]}\n</answer>"
+)
+
+
+def create_dummy_image(width=100, height=100, color=(255, 0, 0)):
+    """Create a dummy PIL Image for testing."""
+    return Image.new("RGB", (width, height), color)
+
+
+def make_completion(text):
+    """Create a mock chat completion response carrying `text`."""
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = text
+    return response
+
+
+class TestPredict:
+    """Test cases for predict on the sync and async agents."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a MAIGroundingAgent with a mocked LLM client."""
+        with patch('mai_grounding_agent.OpenAI'):
+            agent = MAIGroundingAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+            )
+        agent.llm.chat.completions.create.return_value = make_completion(GROUNDING_RESPONSE)
+        return agent
+
+    def test_predict(self, agent):
+        """A valid response is parsed into a normalized coordinate."""
+        prediction, result = agent.predict("open settings", create_dummy_image())
+
+        assert prediction == GROUNDING_RESPONSE
+        assert result["coordinate"] == [1.0, 0.0]
+        assert result["thinking"] == "The settings icon is at the top right."
+
+    def test_predict_returns_error_flag_after_retries(self, agent):
+        """Unparseable responses are retried and finally reported as an error."""
+        agent.llm.chat.completions.create.return_value = make_completion("<answer>{bad json</answer>")
+
+        prediction, result = agent.predict("open settings", create_dummy_image())
+
+        assert prediction == "llm client error"
+        assert result == {"thinking": None, "coordinate": None}
+        assert agent.llm.chat.completions.create.call_count == 3
+
+    def test_async_predict(self):
+        """The async agent awaits the client and shares parsing with the sync agent."""
+        with patch('mai_grounding_agent.AsyncOpenAI'):
+            agent = AsyncMAIGroundingAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+            )
+        agent.llm.chat.completions.create = AsyncMock(return_value=make_completion(GROUNDING_RESPONSE))
+
+        threads = set()
+        build_messages = agent._build_messages
+
+        def record_thread(*args):
+            threads.add(threading.get_ident())
+            return build_messages(*args)
+
+        agent._build_messages = record_thread
+        prediction, result = asyncio.run(agent.predict("open settings", create_dummy_image()))
+
+        assert prediction == GROUNDING_RESPONSE
+        assert result["coordinate"] == [1.0, 0.0]
+        # The screenshot is encoded off the event loop
+        assert threads and threading.get_ident() not in threads
+
+
+
+class TestPredictBatch:
+    """Test cases for predict_batch."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create an agent that echoes the instruction's index as x coordinate."""
+        with patch('mai_grounding_agent.OpenAI'):
+            agent = MAIGroundingAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+            )
+
+        def respond(**kwargs):
+            instruction = kwargs["messages"][1]["content"][0]["text"].strip()
+            if instruction == "broken":
+                return make_completion("<answer>{bad json</answer>")
+            return make_completion(f'<answer>{{"coordinate": [{instruction}, 0]}}</answer>')
+
+        agent.llm.chat.completions.create.side_effect = respond
+        return agent
+
+    def test_results_in_input_order(self, agent):
+        """Results line up with the requests regardless of completion order."""
+        image = create_dummy_image()
+        requests = [(str(i), image) for i in range(20)]
+
+        results = agent.predict_batch(requests, max_concurrency=4)
+
+        assert [result["coordinate"][0] * 999 for _, result in results] == pytest.approx(range(20))
+
+    def test_shared_image_encoded_once(self, agent):
+        """Instructions on the same screenshot share one encoding."""
+        image_a, image_b = create_dummy_image(), create_dummy_image(color=(0, 0, 255))
+        requests = [("1", image_a), ("2", image_a), ("3", image_b), ("4", image_a)]
+
+        with patch.object(agent, "_encode_image", wraps=agent._encode_image) as encode:
+            agent.predict_batch(requests)
+
+        assert encode.call_count == 2
+
+    def test_images_encoded_by_workers(self, agent):
+        """Requests are sent while later images are still to be encoded."""
+        events = []
+        encode_image, respond = agent._encode_image, agent.llm.chat.completions.create.side_effect
+
+        def encode(image):
+            events.append("encode")
+            return encode_image(image)
+
+        def send(**kwargs):
+            events.append("send")
+            return respond(**kwargs)
+
+        agent.llm.chat.completions.create.side_effect = send
+        requests = [(str(i), create_dummy_image(color=(i, 0, 0))) for i in range(3)]
+        with patch.object(agent, "_encode_image", side_effect=encode):
+            agent.predict_batch(requests, max_concurrency=1)
+
+        assert events == ["encode", "send"] * 3
+
+    def test_failures_reported_per_item(self, agent):
+        """A failing item carries its error and does not affect the others."""
+        image = create_dummy_image()
+
+        results = agent.predict_batch([("1", image), ("broken", image), ("2", b"not an image")])
+
+        assert results[0][1]["coordinate"] is not None
+        assert results[1][0] == "llm client error"
+        assert "Invalid JSON" in results[1][1]["error"]
+        assert results[2][0] == "llm client error"
+        assert results[2][1]["error"]
+
+    def test_async_predict_batch(self):
+        """The async agent bounds concurrency with a semaphore and keeps order."""
+        with patch('mai_grounding_agent.AsyncOpenAI'):
+            agent = AsyncMAIGroundingAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+            )
+        agent.llm.chat.completions.create = AsyncMock(return_value=make_completion(GROUNDING_RESPONSE))
+
+        results = asyncio.run(agent.predict_batch([("a", create_dummy_image())] * 5, max_concurrency=2))
+
+        assert len(results) == 5
+        assert all(result["coordinate"] == [1.0, 0.0] for _, result in results)
+
+
+def make_chunk(content, finish_reason=None):
+    """Create a mock streamed chat completion chunk."""
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = content
+    chunk.choices[0].finish_reason = finish_reason
+    return chunk
+
+
+class TestStreaming:
+    """Test cases for streaming mode with early cut-off."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a streaming MAIGroundingAgent with a mocked LLM client."""
+        with patch('mai_grounding_agent.OpenAI'):
+            return MAIGroundingAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"stream": True},
+            )
+
+    def test_stream_closed_after_answer_tag(self, agent):
+        """The stream is closed once </answer> arrives, even split across chunks."""
+        pieces = ["<grounding_think>x</grounding_think><answer>", '{"coordinate": [999, 0]}</ans',
+                  "wer> trailing", "never read"]
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([make_chunk(piece) for piece in pieces])
+        agent.llm.chat.completions.create.return_value = stream
+
+        prediction, result = agent.predict("open settings", create_dummy_image())
+
+        assert prediction.endswith("</answer>")
+        assert result["coordinate"] == [1.0, 0.0]
+        stream.close.assert_called_once()
+        kwargs = agent.llm.chat.completions.create.call_args.kwargs
+        assert kwargs["stream"] is True
+        assert kwargs["stop"] == ["</answer>"]
+        assert kwargs["extra_body"]["include_stop_str_in_output"] is True
+        metrics = result["stream_metrics"]
+        assert metrics["cut_off"] and metrics["num_chunks"] == 3
+        assert 0 <= metrics["time_to_first_token"] <= metrics["time_to_action"] <= metrics["total_time"]
+
+    def test_stripped_stop_sequence_restored(self, agent):
+        """A server that strips the stop sequence still yields a parseable answer."""
+        chunks = [make_chunk('<answer>{"coordinate": [0, 999]}'), make_chunk(None, finish_reason="stop")]
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(chunks)
+        agent.llm.chat.completions.create.return_value = stream
+
+        _, result = agent.predict("open settings", create_dummy_image())
+
+        assert result["coordinate"] == [0.0, 1.0]
+        assert not result["stream_metrics"]["cut_off"]
+
+    def test_batch_results_carry_their_own_metrics(self, agent):
+        """Concurrent streamed calls each return the metrics of their own stream."""
+        def create(**kwargs):
+            stream = MagicMock()
+            num_chunks = len(kwargs["messages"][1]["content"][0]["text"].strip())
+            pieces = ["<answer>"] + [" "] * (num_chunks - 2) + ['{"coordinate": [0, 999]}</answer>']
+            stream.__iter__.return_value = iter([make_chunk(piece) for piece in pieces])
+            return stream
+
+        agent.llm.chat.completions.create.side_effect = create
+        image = create_dummy_image()
+        results = agent.predict_batch([("ab", image), ("abcd", image), ("abc", image)], max_concurrency=3)
+        assert [result["stream_metrics"]["num_chunks"] for _, result in results] == [2, 4, 3]
+
+
+def test_shared_client_reused_across_agents():
+    """Agents opting into the shared client reuse one client per endpoint."""
+    conf = {"shared_client": True, "client_pool": {"max_connections": 8}}
+    agent_a = MAIGroundingAgent("http://shared.test/v1", "test-model", runtime_conf=conf)
+    agent_b = MAIGroundingAgent("http://shared.test/v1", "test-model", runtime_conf=conf)
+    agent_c = MAIGroundingAgent("http://other.test/v1", "test-model", runtime_conf=conf)
+    private = MAIGroundingAgent("http://shared.test/v1", "test-model")
+
+    assert agent_a.llm is agent_b.llm
+    assert agent_a.llm is not agent_c.llm
+    assert private.llm is not agent_a.llm
+    assert agent_a.llm.max_retries == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
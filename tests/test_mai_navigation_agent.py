@@ -15,13 +15,15 @@
 Unit tests for MAIUINaivigationAgent._build_messages functionality.
 """
 
+import asyncio
 import base64
 import json
 import os
 import sys
+import threading
 from io import BytesIO
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from PIL import Image
@@ -29,7 +31,14 @@ from PIL import Image
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from mai_naivigation_agent import MAIUINaivigationAgent, mask_image_urls_for_logging
+from mai_naivigation_agent import (
+    AsyncMAIUINaivigationAgent,
+    MAIUINaivigationAgent,
+    TRUNCATED_THINKING_MARKER,
+    UNCHANGED_SCREEN_TEXT,
+    mask_image_urls_for_logging,
+)
+from prompt import MAI_MOBILE_SYS_PROMPT_NO_THINKING
 from unified_memory import TrajMemory, TrajStep
 
 
@@ -51,6 +60,14 @@ def image_to_bytes(img):
     return buffer.getvalue()
 
 
+def make_completion(text):
+    """Create a mock chat completion response carrying `text`."""
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = text
+    return response
+
+
 def dump_messages_to_file(messages, test_name):
     """
     Dump messages to a JSON file for inspection.
@@ -573,6 +590,345 @@ class TestBuildMessages:
             pytest.fail(f"Invalid base64 encoding: {e}")
 
 
+def test_mask_image_urls_for_logging_does_not_mutate():
+    """Masking returns a redacted view and leaves the request untouched."""
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "system"}]},
+        {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}]},
+    ]
+    masked = mask_image_urls_for_logging(messages)
+
+    assert masked[1]["content"][0]["image_url"]["url"] == "[IMAGE_DATA]"
+    assert messages[1]["content"][0]["image_url"]["url"] == "data:image/png;base64,AAAA"
+    assert masked[0]["content"][0] is messages[0]["content"][0]
+
+
+class TestImagePayloadCache:
+    """Test cases for cached screenshot payloads on TrajStep."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create an agent whose LLM client always returns a click action."""
+        with patch('mai_naivigation_agent.OpenAI'):
+            agent = MAIUINaivigationAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"history_n": 3}
+            )
+        agent.llm.chat.completions.create.return_value = make_completion(
+            '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+            '"arguments":{"action":"click","coordinate":[500,500]}}</tool_call>'
+        )
+        return agent
+
+    def test_history_images_encoded_once(self, agent):
+        """Each screenshot is encoded once, then reused from the step cache."""
+        encoded = []
+        encode_image = agent._encode_image
+
+        def record(image):
+            encoded.append(encode_image(image))
+            return encoded[-1]
+
+        with patch.object(agent, "_encode_image", side_effect=record):
+            for i in range(4):
+                agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 60, 0, 0))})
+        assert len(encoded) == 4
+
+        sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+        urls = [
+            c["image_url"]["url"]
+            for msg in sent for c in msg["content"] if "image_url" in c
+        ]
+        assert urls == encoded[1:]
+
+    def test_payloads_evicted_outside_window(self, agent):
+        """Only the last history_n - 1 steps keep their encoded payload."""
+        for i in range(5):
+            agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 40, 0, 0))})
+
+        cached = [step.image_url is not None for step in agent.traj_memory.steps]
+        assert cached == [False, False, False, True, True]
+        assert all(step.image_size == (100, 100) for step in agent.traj_memory.steps)
+
+
+def test_screenshots_resized_to_pixel_budget():
+    """Screenshots are resized before encoding; coordinates stay normalized."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3, "max_pixels": 64 * 64 * 16},
+        )
+    agent.llm.chat.completions.create.return_value = make_completion(
+        '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+        '"arguments":{"action":"click","coordinate":[999,0]}}</tool_call>'
+    )
+
+    _, action = agent.predict("Open settings", {"screenshot": create_dummy_image(1080, 2400)})
+
+    sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+    encoded = sent[-1]["content"][0]["image_url"]["url"].split(",")[1]
+    sent_image = Image.open(BytesIO(base64.b64decode(encoded)))
+    assert sent_image.width * sent_image.height <= 64 * 64 * 16
+    assert sent_image.width % 32 == 0 and sent_image.height % 32 == 0
+    assert agent.traj_memory.steps[0].image_size == (1080, 2400)
+    assert action["coordinate"] == [1.0, 0.0]
+
+
+def test_async_predict_records_steps():
+    """The async agent shares message building and step recording."""
+    with patch('mai_naivigation_agent.AsyncOpenAI'):
+        agent = AsyncMAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3},
+        )
+    agent.llm.chat.completions.create = AsyncMock(return_value=make_completion(
+        '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+        '"arguments":{"action":"click","coordinate":[500,500]}}</tool_call>'
+    ))
+
+    async def run_episode():
+        for i in range(2):
+            await agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 60, 0, 0))})
+
+    threads = set()
+    prepare_request = agent._prepare_request
+
+    def record_thread(*args):
+        threads.add(threading.get_ident())
+        return prepare_request(*args)
+
+    agent._prepare_request = record_thread
+    asyncio.run(run_episode())
+
+    assert len(agent.traj_memory.steps) == 2
+    # Screenshots are prepared off the event loop
+    assert threads and threading.get_ident() not in threads
+    sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+    assert [msg["role"] for msg in sent] == ["system", "user", "user", "assistant", "user"]
+
+
+def test_chunked_layout_extends_previous_prompt():
+    """In the chunked layout, prompts only change in place when a chunk is dropped."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3, "history_layout": "chunked"},
+        )
+    agent.llm.chat.completions.create.return_value = make_completion(
+        '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+        '"arguments":{"action":"click","coordinate":[500,500]}}</tool_call>'
+    )
+
+    prompts = []
+    for i in range(7):
+        agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 30, 0, 0))})
+        prompts.append(agent.llm.chat.completions.create.call_args.kwargs["messages"])
+
+    # With history_n=3 images are dropped two at a time, before steps 4 and 6
+    for step in range(1, 7):
+        previous, current = prompts[step - 1], prompts[step]
+        extends = current[:len(previous)] == previous
+        assert extends == (step not in (4, 6))
+    num_images = [sum(m["content"][0]["type"] == "image_url" for m in p) for p in prompts]
+    assert num_images == [1, 2, 3, 4, 3, 4, 3]
+
+
+def test_warm_up_primes_system_prompt():
+    """warm_up sends a one-token request with the system prompt."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(llm_base_url="http://test.com", model_name="test-model")
+
+    assert agent.warm_up() == 1
+    kwargs = agent.llm.chat.completions.create.call_args.kwargs
+    assert kwargs["max_tokens"] == 1
+    assert kwargs["messages"][0]["content"][0]["text"] == agent.system_prompt
+
+
+def test_history_messages_serialized_once():
+    """History steps are serialized once and the messages match a fresh build."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3},
+        )
+    agent.llm.chat.completions.create.side_effect = [
+        make_completion(
+            f'<thinking>step {i}</thinking><tool_call>{{"name":"mobile_use",'
+            f'"arguments":{{"action":"click","coordinate":[{i * 100},500]}}}}</tool_call>'
+        )
+        for i in range(6)
+    ]
+
+    with patch.object(agent, "mem2response", wraps=agent.mem2response) as mem2response:
+        for i in range(6):
+            agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 40, 0, 0))})
+    assert mem2response.call_count == 5
+
+    images = agent._prepare_images(create_dummy_image())
+    with patch('mai_naivigation_agent.OpenAI'):
+        fresh = MAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3},
+        )
+    fresh.load_traj(agent.traj_memory)
+    assert agent._build_messages("Open settings", images) == fresh._build_messages("Open settings", images)
+
+    # Cached messages of steps dropped from the trajectory are forgotten
+    agent.traj_memory = TrajMemory(task_goal="", task_id="other", steps=agent.traj_memory.steps[:2])
+    messages = agent._build_messages("Open settings", [create_dummy_image()] * 3)
+    assert [m["role"] for m in messages].count("assistant") == 2
+
+
+def test_history_compacted_to_token_budget():
+    """Over budget, the oldest thinking is truncated; actions and recent steps stay intact."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            llm_base_url="http://test.com",
+            model_name="test-model",
+            runtime_conf={"history_n": 3, "history_token_budget": 600, "compact_thinking_tokens": 8},
+        )
+    agent.llm.chat.completions.create.side_effect = [
+        make_completion(
+            f'<thinking>step {i} ' + "reasoning " * 60 + '</thinking><tool_call>{"name":"mobile_use",'
+            f'"arguments":{{"action":"click","coordinate":[{i * 100},500]}}}}</tool_call>'
+        )
+        for i in range(8)
+    ]
+
+    prompts = []
+    for i in range(8):
+        agent.predict("Open settings", {"screenshot": create_dummy_image(color=(i * 30, 0, 0))})
+        prompts.append(agent.llm.chat.completions.create.call_args.kwargs["messages"])
+
+    responses = [m["content"][0]["text"] for m in prompts[-1] if m["role"] == "assistant"]
+    assert len(responses) == 7
+    compacted = [TRUNCATED_THINKING_MARKER in text for text in responses]
+    assert compacted == [True] * 4 + [False] * 3
+    for i, text in enumerate(responses):
+        assert f'"coordinate":[{i * 100},500]' in text
+    assert responses[-1] == agent.mem2response(agent.traj_memory.steps[6])
+
+    # A compacted step renders the same in every later prompt
+    first = next(
+        m for m in prompts[5]
+        if m["role"] == "assistant" and TRUNCATED_THINKING_MARKER in m["content"][0]["text"]
+    )
+    assert first == next(m for m in prompts[-1] if m["role"] == "assistant")
+
+
+class TestScreenshotDedup:
+    """Test cases for (near-)duplicate screenshot handling."""
+
+    def make_agent(self, **conf):
+        with patch('mai_naivigation_agent.OpenAI'):
+            agent = MAIUINaivigationAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"history_n": 4, **conf},
+            )
+        agent.llm.chat.completions.create.return_value = make_completion(
+            '<thinking>wait</thinking><tool_call>{"name":"mobile_use",'
+            '"arguments":{"action":"wait"}}</tool_call>'
+        )
+        return agent
+
+    def test_share_reuses_encoding(self):
+        """Identical screenshots are encoded once and flagged as duplicates."""
+        agent = self.make_agent(dedup_screenshots="share")
+        with patch.object(agent, "_encode_image", wraps=agent._encode_image) as encode:
+            for _ in range(3):
+                agent.predict("Open settings", {"screenshot": create_dummy_image()})
+
+        assert encode.call_count == 1
+        assert [step.duplicate_of_previous for step in agent.traj_memory.steps] == [False, True, True]
+        sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+        urls = {m["content"][0]["image_url"]["url"] for m in sent if m["content"][0]["type"] == "image_url"}
+        assert len(urls) == 1
+
+    def test_marker_replaces_duplicate_history_images(self):
+        """Duplicate history images after the first are sent as a text marker."""
+        agent = self.make_agent(dedup_screenshots="marker")
+        for color in [(255, 0, 0), (255, 0, 0), (0, 255, 0)]:
+            agent.predict("Open settings", {"screenshot": create_dummy_image(color=color)})
+
+        sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+        kinds = [m["content"][0]["type"] for m in sent if m["role"] == "user"][1:]
+        assert kinds == ["image_url", "text", "image_url"]
+        assert UNCHANGED_SCREEN_TEXT in [m["content"][0].get("text") for m in sent]
+
+    def test_threshold_controls_near_duplicates(self):
+        """A small local change only counts as a duplicate above the threshold."""
+        base = create_dummy_image(200, 200, color=(255, 255, 255))
+        changed = base.copy()
+        changed.paste((0, 0, 0), (0, 0, 10, 10))
+
+        strict = self.make_agent(dedup_screenshots="share")
+        loose = self.make_agent(dedup_screenshots="share", dedup_threshold=0.01)
+        for agent in (strict, loose):
+            agent.predict("Open settings", {"screenshot": base})
+            agent.predict("Open settings", {"screenshot": changed})
+
+        assert not strict.traj_memory.steps[1].duplicate_of_previous
+        assert loose.traj_memory.steps[1].duplicate_of_previous
+
+
+class TestNoThinkingMode:
+    """Test cases for the no-thinking prompt mode."""
+
+    def test_bare_tool_call_predictions(self):
+        """Bare tool calls parse, and history is rendered without thinking."""
+        with patch('mai_naivigation_agent.OpenAI'):
+            agent = MAIUINaivigationAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"thinking": False},
+            )
+        agent.llm.chat.completions.create.return_value = make_completion(
+            '<tool_call>\n{"name":"mobile_use","arguments":{"action":"open","text":"Settings"}}\n</tool_call>'
+        )
+        for _ in range(2):
+            _, action = agent.predict("Open settings", {"screenshot": create_dummy_image()})
+        assert action == {"action": "open", "text": "Settings"}
+        assert agent.traj_memory.steps[0].thought is None
+
+        sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+        assert sent[0]["content"][0]["text"] == MAI_MOBILE_SYS_PROMPT_NO_THINKING
+        history = [m["content"][0]["text"] for m in sent if m["role"] == "assistant"]
+        assert history == [
+            '<tool_call>\n{"name":"mobile_use","arguments":{"action":"open","text":"Settings"}}\n</tool_call>'
+        ]
+        assert agent.history_responses == history * 2
+
+    def test_thinking_mode_still_requires_thinking(self):
+        """The default mode keeps rejecting bare tool calls."""
+        with patch('mai_naivigation_agent.OpenAI'):
+            agent = MAIUINaivigationAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"retry_policy": {"max_attempts": 1}},
+            )
+        agent.llm.chat.completions.create.return_value = make_completion(
+            '<tool_call>{"name":"mobile_use","arguments":{"action":"wait"}}</tool_call>'
+        )
+        assert agent.predict("Wait", {"screenshot": create_dummy_image()}) == ("llm client error", {"action": None})
+
+    def test_not_supported_with_mcp_tools(self):
+        """There is no no-thinking prompt with MCP tools."""
+        with patch('mai_naivigation_agent.OpenAI'), pytest.raises(ValueError):
+            MAIUINaivigationAgent(
+                llm_base_url="http://test.com",
+                model_name="test-model",
+                runtime_conf={"thinking": False},
+                mcp_tools=[{"name": "get_weather", "parameters": {"type": "object"}}],
+            )
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
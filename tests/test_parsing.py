@@ -0,0 +1,202 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for single-pass response parsing.
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from guided_decoding import ActionSpec, parse_action_space
+from mai_grounding_agent import parse_grounding_response
+from mai_naivigation_agent import MAIUINaivigationAgent, parse_action_to_structure_output
+from parsing import (
+    close_json,
+    parse_coordinates,
+    parse_tagged_text,
+    repair_tool_call,
+    split_grounding_response,
+)
+from PIL import Image
+from prompt import MAI_MOBILE_SYS_PROMPT
+
+CALL = '{"name":"mobile_use","arguments":{"action":"click","coordinate":[500,250]}}'
+
+
+@pytest.mark.parametrize("text", [
+    f"<thinking>\nOpen it\n</thinking>\n<tool_call>\n{CALL}\n</tool_call>",
+    f"Open it\n</think>\n<tool_call>\n{CALL}\n</tool_call>",
+    f"<think>Open it</think><tool_call>{CALL}</tool_call>",
+    f"<thinking>Open it</ Think ><tool_call>{CALL}</tool_call> trailing",
+])
+def test_parse_tagged_text_variants(text):
+    """Thinking closed by </thinking> or any </think> variant is parsed."""
+    result = parse_tagged_text(text)
+    assert result["thinking"] == "Open it"
+    assert result["tool_call"]["arguments"]["coordinate"] == [500, 250]
+
+
+def test_parse_tagged_text_incomplete():
+    """Incomplete responses parse to None; invalid JSON raises ValueError."""
+    assert parse_tagged_text("<thinking>a</thinking><tool_call>{") == {"thinking": None, "tool_call": None}
+    assert parse_tagged_text(f"<tool_call>{CALL}</tool_call>") == {"thinking": None, "tool_call": None}
+    with pytest.raises(ValueError):
+        parse_tagged_text("<thinking>a</thinking><tool_call>{,}</tool_call>")
+
+
+def test_parse_tagged_text_without_thinking():
+    """Bare tool calls are accepted only when thinking is not required."""
+    text = f"<tool_call>\n{CALL}\n</tool_call>"
+    result = parse_tagged_text(text, require_thinking=False)
+    assert result["thinking"] is None
+    assert result["tool_call"]["arguments"]["action"] == "click"
+    # A response that still thinks is parsed as usual
+    result = parse_tagged_text(f"<thinking>a</thinking><tool_call>{CALL}</tool_call>", require_thinking=False)
+    assert result["thinking"] == "a"
+    repaired = repair_tool_call('<tool_call>{"name":"mobile_use","arguments":{"action":"wait"', require_thinking=False)
+    assert repaired == {"thinking": None, "tool_call": {"name": "mobile_use", "arguments": {"action": "wait"}}}
+
+
+def test_grounding_and_coordinates():
+    """Grounding sections and coordinate pairs are extracted."""
+    text = '<grounding_think>gear</grounding_think>\n<answer>\n{"coordinate":[999,0]}\n</answer>'
+    assert split_grounding_response(text) == ("gear", '\n{"coordinate":[999,0]}\n')
+    assert parse_grounding_response(text) == {"thinking": "gear", "coordinate": [1.0, 0.0]}
+    assert parse_coordinates(text) == (999, 0)
+    assert parse_coordinates("no answer") == (-1, -1)
+
+
+def test_pathological_outputs_parse_in_linear_time():
+    """Unclosed, repeated tags do not trigger quadratic backtracking."""
+    for text in ("<thinking>" * 20000, "<answer>" * 20000, "<thinking>t</thinking>" + "<tool_call>" * 20000):
+        start = time.perf_counter()
+        parse_tagged_text(text)
+        split_grounding_response(text)
+        assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{"text": "say "hi" now"}', {"text": 'say "hi" now'}),
+    ('{"a": "x\\', {"a": "x"}),
+])
+def test_close_json(text, expected):
+    """Truncated and near-valid JSON is closed in one pass."""
+    assert json.loads(close_json(text)) == expected
+
+
+@pytest.mark.parametrize("text, arguments", [
+    # Cut off by max_tokens after the last value
+    ('<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"type","text":"hello"',
+     {"action": "type", "text": "hello"}),
+    ('<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[50,60]}',
+     {"action": "click", "coordinate": [50, 60]}),
+    # Malformed JSON
+    ('<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"swipe","direction":"up",},}</tool_call>',
+     {"action": "swipe", "direction": "up"}),
+    ('<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"type","text":"a "b" c"}}</tool_call>',
+     {"action": "type", "text": 'a "b" c'}),
+    # Missing tool_call tag, bare action
+    ('t</think>{"action":"wait"}', {"action": "wait"}),
+    # Not repairable as JSON, fields read one by one
+    ('<thinking>t</thinking><tool_call>{name: mobile_use, "arguments": {"action": "click", "coordinate": [5, 6]]]}',
+     {"action": "click", "coordinate": [5, 6]}),
+])
+def test_repair_tool_call(text, arguments):
+    """Truncated or malformed tool calls are recovered."""
+    result = repair_tool_call(text)
+    assert result["thinking"] == "t"
+    assert result["tool_call"] == {"name": "mobile_use", "arguments": arguments}
+
+
+@pytest.mark.parametrize("text", [
+    '<tool_call>{"name":"mobile_use","arguments":{"action":"wait"}}</tool_call>',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[50',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"drag","start_coordinate":[1,2]',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"act',
+    '<thinking>t</thinking>',
+    # Cut off inside a value: the rest of it would be made up
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[500,50',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[50,60,',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"type","text":"hello wor',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"swipe","direction":"up",',
+    # Values outside the action space
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"terminate","status":"succ"}',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"swipe","direction":"u"}',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"system_button","button":"hom"}',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"clik","coordinate":[5,6]}',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[5,6,7]}',
+    '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[5,6,7,8]}',
+    '<thinking>t</thinking><tool_call>{name: mobile_use, "arguments": {"action": "click", "coordinate": [5, 6, 7]}',
+])
+def test_repair_tool_call_unrecoverable(text):
+    """Responses without thinking, cut inside a value or with an invalid action are not repaired."""
+    assert repair_tool_call(text) is None
+
+
+def test_repair_validates_against_prompt_action_space():
+    """Actions and enum values come from the system prompt's action space when given."""
+    actions = parse_action_space(MAI_MOBILE_SYS_PROMPT)
+    ask = '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"ask_user","text":"which?"}'
+    assert repair_tool_call(ask) is not None
+    assert repair_tool_call(ask, action_space=actions) is None
+
+    swipe = '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"swipe","direction":"left"}'
+    assert repair_tool_call(swipe, action_space=actions)["tool_call"]["arguments"]["direction"] == "left"
+    custom = [ActionSpec("swipe", [("direction", ("up", "down"))])]
+    assert repair_tool_call(swipe, action_space=custom) is None
+
+
+def test_parse_action_repair_is_opt_in():
+    """Strict parsing raises on truncated output; repair recovers and tags the action."""
+    text = '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"click","coordinate":[999,0]'
+    with pytest.raises(ValueError):
+        parse_action_to_structure_output(text)
+    result = parse_action_to_structure_output(text, repair=True)
+    assert result["repaired"] is True
+    assert result["action_json"] == {"action": "click", "coordinate": [1.0, 0.0]}
+    assert parse_action_to_structure_output(f"<thinking>t</thinking><tool_call>{CALL}</tool_call>")["repaired"] is False
+
+
+def test_agent_repairs_instead_of_retrying():
+    """With repair_output, a truncated response is used without re-sampling."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model", runtime_conf={"repair_output": True}
+        )
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = (
+        '<thinking>t</thinking><tool_call>{"name":"mobile_use","arguments":{"action":"type","text":"hello"'
+    )
+    agent.llm.chat.completions.create.return_value = completion
+
+    _, action = agent.predict("Search", {"screenshot": Image.new("RGB", (100, 200))})
+    assert action == {"action": "type", "text": "hello"}
+    assert agent.llm.chat.completions.create.call_count == 1
+    assert agent.traj_memory.steps[-1].structured_action["repaired"] is True
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
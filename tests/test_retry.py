@@ -0,0 +1,165 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the retry policy and circuit breaker.
+"""
+
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import httpx
+import openai
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from retry import (
+    CircuitBreaker,
+    RetryError,
+    RetryPolicy,
+    classify_failure,
+    run_with_retries,
+)
+
+
+def status_error(cls, status_code, headers=None):
+    """Create an openai status error with a mocked HTTP response."""
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    return cls("error", response=response, body=None)
+
+
+def fast_policy(**kwargs):
+    """A policy without real sleeping."""
+    return RetryPolicy(base_delay=0.0, max_delay=0.0, **kwargs)
+
+
+def test_classify_failure():
+    """Failures are split into transport, overload, parse and fatal."""
+    request = httpx.Request("POST", "http://test.com")
+    assert classify_failure(openai.APIConnectionError(request=request)) == "transport"
+    assert classify_failure(openai.APITimeoutError(request=request)) == "transport"
+    assert classify_failure(httpx.ConnectError("reset")) == "transport"
+    assert classify_failure(status_error(openai.RateLimitError, 429)) == "overload"
+    assert classify_failure(status_error(openai.InternalServerError, 503)) == "overload"
+    assert classify_failure(status_error(openai.BadRequestError, 400)) == "fatal"
+    assert classify_failure(ValueError("Invalid JSON in tool_call")) == "parse"
+    assert classify_failure(TypeError("bad argument")) == "fatal"
+    assert classify_failure(KeyError("missing")) == "fatal"
+
+
+def test_policy_from_conf():
+    """A policy is built from an instance, a dict of its fields or None."""
+    policy = RetryPolicy(max_attempts=5)
+    assert RetryPolicy.from_conf(policy) is policy
+    assert RetryPolicy.from_conf({"max_attempts": 5}) == policy
+    assert RetryPolicy.from_conf(None) == RetryPolicy()
+    with pytest.raises(ValueError, match="Unknown retry policy keys: \\['max_attempt'\\]"):
+        RetryPolicy.from_conf({"max_attempt": 5})
+
+
+def test_backoff_is_bounded_and_honours_retry_after():
+    """Backoff grows exponentially up to max_delay; Retry-After wins."""
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0, jitter=0.5)
+    for retry_index in range(6):
+        delay = policy.backoff(retry_index)
+        expected = min(2 ** retry_index, 4.0)
+        assert expected / 2 <= delay <= expected
+    error = status_error(openai.RateLimitError, 429, headers={"retry-after": "2"})
+    assert policy.backoff(0, error) == 2.0
+
+
+def test_parse_failures_resample_with_new_seed_and_temperature():
+    """A parse failure is retried with a different seed and temperature."""
+    seen = []
+
+    def request(overrides):
+        seen.append(overrides)
+        return "bad" if len(seen) < 3 else "good"
+
+    def parse(text):
+        if text != "good":
+            raise ValueError("Invalid JSON")
+        return text
+
+    assert run_with_retries(request, parse, fast_policy(), base_seed=42) == "good"
+    assert seen == [{}, {"seed": 43, "temperature": 0.3}, {"seed": 44, "temperature": 0.3}]
+
+
+def test_fatal_errors_are_not_retried():
+    """Client errors such as 400 fail on the first attempt."""
+    request = MagicMock(side_effect=status_error(openai.BadRequestError, 400))
+
+    with pytest.raises(RetryError) as excinfo:
+        run_with_retries(request, str, fast_policy())
+
+    assert excinfo.value.kind == "fatal"
+    assert request.call_count == 1
+
+
+def test_unknown_errors_are_raised_as_is():
+    """Programming errors are not retried and do not count against the endpoint."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    request = MagicMock(side_effect=TypeError("unexpected keyword argument"))
+
+    with pytest.raises(TypeError):
+        run_with_retries(request, str, fast_policy(), breaker)
+    assert request.call_count == 1
+    assert not breaker.is_open
+
+
+def test_circuit_breaker_fails_fast():
+    """Once open, the breaker rejects calls without touching the endpoint."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    request = MagicMock(side_effect=httpx.ConnectError("refused"))
+
+    with pytest.raises(RetryError):
+        run_with_retries(request, str, fast_policy(max_attempts=3), breaker)
+    assert breaker.is_open
+    calls = request.call_count
+
+    with pytest.raises(RetryError) as excinfo:
+        run_with_retries(request, str, fast_policy(), breaker)
+    assert excinfo.value.kind == "circuit_open"
+    assert request.call_count == calls
+
+
+def test_circuit_breaker_half_open_probe():
+    """After reset_timeout a single probe is allowed; success closes the circuit."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_circuit_breaker_fatal_probe_does_not_wedge():
+    """A probe failing with a client error is released; the next call probes and closes the circuit."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    bad_request = MagicMock(side_effect=status_error(openai.BadRequestError, 400))
+    with pytest.raises(RetryError) as excinfo:
+        run_with_retries(bad_request, str, fast_policy(), breaker)
+    assert excinfo.value.kind == "fatal"
+
+    assert run_with_retries(MagicMock(return_value="ok"), str, fast_policy(), breaker) == "ok"
+    assert not breaker.is_open
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,68 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for screenshot delta coding.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from screenshot_delta import apply_delta, diff_rects, encode_delta
+
+
+def make_pair():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(256, 128, 3), dtype=np.uint8)
+    reference = Image.fromarray(pixels)
+    changed = pixels.copy()
+    changed[40:50, 10:20] = 0
+    changed[200:210, 100:128] = 255
+    return reference, Image.fromarray(changed)
+
+
+def test_diff_rects_cover_changes():
+    """Changed regions are found as tile-aligned rectangles clipped to the image."""
+    reference, image = make_pair()
+    rects = diff_rects(np.asarray(reference), np.asarray(image), tile=32)
+    assert rects == [(0, 32, 32, 32), (96, 192, 32, 32)]
+    assert diff_rects(np.asarray(reference), np.asarray(reference)) == []
+
+
+def test_delta_round_trip_is_lossless():
+    """Applying a delta restores the screenshot pixel for pixel."""
+    reference, image = make_pair()
+    payload = encode_delta(reference, image)
+    assert payload is not None and len(payload) < 0.1 * reference.width * reference.height * 3
+
+    restored = apply_delta(reference, payload)
+    assert np.array_equal(np.asarray(restored), np.asarray(image))
+
+
+def test_large_change_falls_back_to_keyframe():
+    """A delta is refused when too much of the screen changed or sizes differ."""
+    reference, _ = make_pair()
+    inverted = Image.fromarray(255 - np.asarray(reference))
+    assert encode_delta(reference, inverted, max_ratio=0.3) is None
+    assert encode_delta(reference, reference.resize((64, 64))) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
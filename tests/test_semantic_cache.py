@@ -0,0 +1,141 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the near-duplicate instruction cache.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mai_grounding_agent import AsyncMAIGroundingAgent, MAIGroundingAgent
+from semantic_cache import SemanticCache, SemanticCacheConfig, compatible, normalize_instruction
+
+GROUNDING_RESPONSE = "<grounding_think>gear</grounding_think>\n<answer>\n{\"coordinate\": [999, 0]}\n</answer>"
+RESULT = {"thinking": "gear", "coordinate": [1.0, 0.0]}
+
+
+def make_agent(agent_class=MAIGroundingAgent, **conf):
+    with patch('mai_grounding_agent.OpenAI'), patch('mai_grounding_agent.AsyncOpenAI'):
+        agent = agent_class("http://test.com", "test-model", runtime_conf=conf)
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = GROUNDING_RESPONSE
+    if agent_class is AsyncMAIGroundingAgent:
+        agent.llm.chat.completions.create = AsyncMock(return_value=completion)
+    else:
+        agent.llm.chat.completions.create.return_value = completion
+    return agent
+
+
+def test_normalize_and_word_guard():
+    """Filler words are dropped; positional or swapped words are never near duplicates."""
+    assert normalize_instruction("Please click the 'Settings' button.") == "settings"
+    assert normalize_instruction("Click the button") == "click the button"
+
+    assert compatible("close console", "close console panel")
+    assert compatible("closes package explorer", "close package explorer panel")
+    assert not compatible("left of play", "right of play")
+    assert not compatible("input field labeled min", "input field labeled max")
+    assert not compatible("settings", "settings left")
+    assert not compatible("open tab 2", "open tab")
+    with pytest.raises(ValueError, match="Unknown semantic cache keys"):
+        SemanticCacheConfig.from_conf({"treshold": 0.5})
+
+
+def test_paraphrase_hits_on_same_screen_only():
+    """A paraphrase returns the cached result with its match; other elements and screens miss."""
+    cache = SemanticCache()
+    cache.put("screen", "Close the console", "p", RESULT)
+    cache.put("screen", "Go to the left of play", "q", {"coordinate": [0.1, 0.1]})
+
+    prediction, result = cache.get("screen", "close console panel")
+    assert prediction == "p" and result["coordinate"] == RESULT["coordinate"]
+    assert result["semantic_match"]["instruction"] == "close console"
+    assert 0.5 <= result["semantic_match"]["similarity"] < 1.0
+
+    result["coordinate"][0] = 0.5
+    assert cache.get("screen", "close console panel")[1]["coordinate"] == RESULT["coordinate"]
+
+    assert cache.get("screen", "go to the right of play") is None
+    assert cache.get("screen", "open wifi settings") is None
+    assert cache.get("other", "close console panel") is None
+    assert cache.match("screen", "right of play")[1] == "close console"
+    assert (cache.stats.hits, cache.stats.misses) == (2, 3)
+
+
+def test_eviction_keeps_document_frequencies_consistent():
+    """Evicted instructions no longer match nor weigh in the IDF."""
+    cache = SemanticCache({"max_screens": 2, "max_per_screen": 2})
+    cache.put("a", "open wifi settings", "p", RESULT)
+    cache.put("a", "open bluetooth settings", "p", RESULT)
+    cache.put("a", "open display settings", "p", RESULT)
+    cache.put("a", "open display settings", "p", RESULT)
+    assert cache.get("a", "open wifi settings") is None
+    cache.put("b", "search", "p", RESULT)
+    cache.put("c", "search", "p", RESULT)
+    assert cache.get("a", "open display settings") is None
+    assert cache.stats.evictions == 3
+
+    cache.put("b", "x", "p", RESULT)
+    cache.put("c", "x", "p", RESULT)
+    cache.put("d", "x", "p", RESULT)
+    cache.put("e", "x", "p", RESULT)
+    assert cache._num_documents == 2
+    assert cache._document_frequency.sum() == 2 * len(cache.features("x")[0])
+
+
+def test_agent_answers_near_duplicates_locally():
+    """A paraphrase on the same screenshot is not sent; another screenshot is."""
+    agent = make_agent(semantic_cache={})
+    image = Image.new("RGB", (100, 200), (0, 0, 255))
+    assert agent.predict("open settings", image) == (GROUNDING_RESPONSE, RESULT)
+
+    prediction, result = agent.predict("Tap the Settings icon to open settings", image.copy())
+    assert prediction == GROUNDING_RESPONSE and result["coordinate"] == RESULT["coordinate"]
+    assert result["semantic_match"]["instruction"] == "open settings"
+    assert agent.llm.chat.completions.create.call_count == 1
+
+    agent.predict("open settings", Image.new("RGB", (100, 200)))
+    assert agent.llm.chat.completions.create.call_count == 2
+    assert make_agent(semantic_cache={"threshold": 0.9}).cache_namespace == agent.cache_namespace
+
+
+def test_exact_cache_feeds_semantic_index():
+    """Results of the persistent cache also answer near-duplicates, in batches too."""
+    agent = make_agent(grounding_cache={}, semantic_cache=SemanticCache())
+    image = Image.new("RGB", (100, 200), (0, 255, 0))
+    agent.predict("open settings", image)
+    agent.semantic_cache = SemanticCache()
+
+    results = agent.predict_batch([("open settings", image), ("open settings now", image), ("search", image)])
+    assert "semantic_match" not in results[0][1]
+    assert results[1][1]["semantic_match"]["instruction"] == "open settings"
+    assert agent.llm.chat.completions.create.call_count == 2
+
+    async_agent = make_agent(AsyncMAIGroundingAgent, semantic_cache=agent.semantic_cache)
+    results = asyncio.run(async_agent.predict_batch([("search now", image)]))
+    assert results[0][1]["coordinate"] == RESULT["coordinate"]
+    assert async_agent.llm.chat.completions.create.await_count == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,139 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the offline prompt token estimator.
+"""
+
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mai_grounding_agent import MAIGroundingAgent
+from mai_naivigation_agent import MAIUINaivigationAgent
+from token_estimator import (
+    GENERATION_PROMPT_TOKENS,
+    IMAGE_OVERHEAD_TOKENS,
+    MESSAGE_OVERHEAD_TOKENS,
+    TokenEstimator,
+    data_url_image_size,
+)
+from utils import ImageCodec
+
+
+class WordTokenizer:
+    """Tokenizer stand-in with one token per whitespace-separated word."""
+
+    def encode(self, text, add_special_tokens=True):
+        return text.split()
+
+    def decode(self, token_ids):
+        return " ".join(token_ids)
+
+
+def test_image_tokens_follow_smart_resize():
+    """One token per 32 x 32 patch after resizing, plus the vision tags."""
+    estimator = TokenEstimator(max_pixels=1024 * 1024)
+    assert estimator.image_tokens(640, 320) == 20 * 10 + IMAGE_OVERHEAD_TOKENS
+    # 1080 x 2400 exceeds max_pixels and is scaled down to 672 x 1504
+    assert estimator.image_tokens(1080, 2400) == 21 * 47 + IMAGE_OVERHEAD_TOKENS
+
+
+@pytest.mark.parametrize("image_format", ["png", "jpeg", "webp"])
+def test_data_url_image_size(image_format):
+    """Image sizes are read from the data-URL header."""
+    url = ImageCodec(image_format).to_data_url(Image.new("RGB", (300, 200), (10, 20, 30)))
+    assert data_url_image_size(url) == (300, 200)
+    assert data_url_image_size("https://example.com/screen.png") is None
+
+
+def test_image_cache_does_not_keep_payloads():
+    """Image counts are cached by digest, bounded by cache_size."""
+    estimator = TokenEstimator(cache_size=2)
+    urls = [ImageCodec().to_data_url(Image.new("RGB", (100 + i, 200))) for i in range(3)]
+    counts = [estimator._url_tokens(url) for url in urls]
+    assert counts == [estimator.image_tokens(100 + i, 200) for i in range(3)]
+    assert len(estimator._url_cache) == 2
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in estimator._url_cache)
+    with patch.object(estimator, "_count_url") as count:
+        assert estimator._url_tokens(urls[2]) == counts[2]
+    count.assert_not_called()
+
+
+def test_estimate_grounding_messages():
+    """Estimates add text, image and chat template tokens."""
+    with patch('mai_grounding_agent.OpenAI'):
+        agent = MAIGroundingAgent("http://test.com", "test-model")
+    messages = agent._build_messages("tap the gear icon", Image.new("RGB", (640, 320)))
+
+    estimator = TokenEstimator(tokenizer=WordTokenizer())
+    estimate = estimator.estimate(messages)
+    text = len(agent.system_prompt.split()) + 4
+    assert estimate.text_tokens == text + 2 * MESSAGE_OVERHEAD_TOKENS + GENERATION_PROMPT_TOKENS
+    assert estimate.image_tokens == 20 * 10 + IMAGE_OVERHEAD_TOKENS
+    assert estimate.num_images == 1
+
+
+def test_history_budget_counts_with_tokenizer():
+    """With a tokenizer, compaction budgets and truncates thinking in its tokens."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model",
+            runtime_conf={
+                "history_n": 3, "history_verbatim_steps": 1, "tokenizer": WordTokenizer(),
+                "history_token_budget": 40, "compact_thinking_tokens": 3,
+            },
+        )
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = (
+        "<thinking>" + "reasoning " * 20 + '</thinking><tool_call>{"name":"mobile_use",'
+        '"arguments":{"action":"wait"}}</tool_call>'
+    )
+    agent.llm.chat.completions.create.return_value = completion
+    for _ in range(3):
+        agent.predict("Open settings", {"screenshot": Image.new("RGB", (40, 80))})
+
+    sent = agent.llm.chat.completions.create.call_args.kwargs["messages"]
+    assistant = [m["content"][0]["text"] for m in sent if m["role"] == "assistant"]
+    assert assistant[0].startswith("<thinking>\nreasoning reasoning reasoning [...]\n</thinking>")
+    assert ("reasoning " * 20).strip() in assistant[1]
+
+
+def test_agents_do_not_send_oversized_prompts():
+    """Requests over max_prompt_tokens are rejected before they are sent."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model", runtime_conf={"max_prompt_tokens": 1000}
+        )
+    prediction, action = agent.predict("Open settings", {"screenshot": Image.new("RGB", (1080, 2400))})
+    assert (prediction, action) == ("prompt too long", {"action": None})
+    agent.llm.chat.completions.create.assert_not_called()
+
+    with patch('mai_grounding_agent.OpenAI'):
+        grounding = MAIGroundingAgent(
+            "http://test.com", "test-model", runtime_conf={"max_prompt_tokens": 1000}
+        )
+    results = grounding.predict_batch([("tap", Image.new("RGB", (1080, 2400)))])
+    assert "PromptTooLongError" in results[0][1]["error"]
+    grounding.llm.chat.completions.create.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
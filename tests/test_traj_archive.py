@@ -0,0 +1,115 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for trajectory archives.
+"""
+
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mai_naivigation_agent import MAIUINaivigationAgent
+from traj_archive import read_traj_archive, write_traj_archive
+from unified_memory import TrajMemory, TrajStep
+from utils import safe_pil_to_bytes
+
+
+def make_memory(colors):
+    steps = []
+    for index, color in enumerate(colors):
+        image = Image.new("RGB", (40, 80), color)
+        steps.append(TrajStep(
+            screenshot=image,
+            accessibility_tree=None,
+            prediction=f"prediction {index}",
+            action={"action": "click", "coordinate": [0.5, 0.25]},
+            conclusion="",
+            thought=f"thought {index}",
+            step_index=index,
+            agent_type="MAIMobileAgent",
+            model_name="test-model",
+            screenshot_bytes=safe_pil_to_bytes(image),
+            structured_action={"action_json": {"action": "click", "coordinate": [0.5, 0.25]}},
+        ))
+    return TrajMemory(task_goal="Open settings", task_id="task-1", steps=steps)
+
+
+def test_round_trip_is_lazy(tmp_path):
+    """Reading an archive restores metadata and loads screenshots on access."""
+    memory = make_memory([(255, 0, 0), (0, 255, 0)])
+    path = str(tmp_path / "episode.zip")
+    write_traj_archive(memory, path)
+
+    loaded = read_traj_archive(path)
+    assert (loaded.task_goal, loaded.task_id) == ("Open settings", "task-1")
+    assert [step.to_metadata() for step in loaded.steps] == [step.to_metadata() for step in memory.steps]
+    assert all(step.screenshot is None and step.screenshot_bytes is None for step in loaded.steps)
+    assert loaded.steps[1].load_screenshot_bytes() == memory.steps[1].screenshot_bytes
+    assert loaded.steps[1].load_screenshot().getpixel((0, 0)) == (0, 255, 0)
+
+
+def test_identical_screenshots_stored_once(tmp_path):
+    """Images are content-addressed, so repeated screenshots share one member."""
+    path = str(tmp_path / "episode.zip")
+    write_traj_archive(make_memory([(255, 0, 0), (255, 0, 0), (0, 0, 255)]), path)
+
+    with zipfile.ZipFile(path) as archive:
+        images = [name for name in archive.namelist() if name.startswith("images/")]
+    assert len(images) == 2
+
+
+def test_delta_codec_restores_pixels(tmp_path):
+    """The delta codec stores small changes as deltas and restores them exactly."""
+    memory = make_memory([(255, 0, 0)] * 3)
+    for index, step in enumerate(memory.steps):
+        step.screenshot.paste((0, 0, 255), (0, 0, 4 + index, 4))
+        step.screenshot_bytes = safe_pil_to_bytes(step.screenshot)
+    memory.steps.append(make_memory([(0, 255, 0)]).steps[0])
+
+    path = str(tmp_path / "episode.zip")
+    write_traj_archive(memory, path, codec="delta", delta_tile=8)
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+    assert sum(name.startswith("images/") for name in names) == 2
+    assert sum(name.startswith("deltas/") for name in names) == 2
+
+    loaded = read_traj_archive(path)
+    for original, step in zip(memory.steps, loaded.steps):
+        assert list(step.load_screenshot().getdata()) == list(original.screenshot.getdata())
+
+
+def test_agent_save_and_load_archive(tmp_path):
+    """Agents save and resume trajectories through archives."""
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent("http://test.com", "test-model")
+    agent.load_traj(make_memory([(255, 0, 0), (0, 255, 0)]))
+    path = str(tmp_path / "episode.zip")
+    agent.save_traj_archive(path)
+    expected = agent.save_traj()
+
+    with patch('mai_naivigation_agent.OpenAI'):
+        resumed = MAIUINaivigationAgent("http://test.com", "test-model")
+    resumed.load_traj_archive(path)
+    assert resumed.save_traj() == expected
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
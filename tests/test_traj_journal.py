@@ -0,0 +1,201 @@
+# Copyright (c) 2025, Alibaba Cloud and its affiliates;
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the on-disk trajectory journal.
+"""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mai_naivigation_agent import AsyncMAIUINaivigationAgent, MAIUINaivigationAgent
+from traj_journal import JournaledTrajMemory
+from unified_memory import TrajStep
+from utils import safe_pil_to_bytes
+
+
+def make_step(index, color=(255, 0, 0)):
+    image = Image.new("RGB", (40, 80), color)
+    return TrajStep(
+        screenshot=image,
+        accessibility_tree={"node": index},
+        prediction=f"prediction {index}",
+        action={"action": "wait"},
+        conclusion="",
+        thought=f"thought {index}",
+        step_index=index,
+        agent_type="MAIMobileAgent",
+        model_name="test-model",
+        screenshot_bytes=safe_pil_to_bytes(image),
+        structured_action={"action_json": {"action": "wait"}},
+        image_size=image.size,
+    )
+
+
+def make_completion():
+    """Create a mock chat completion response carrying a click action."""
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = (
+        '<thinking>tap</thinking><tool_call>{"name":"mobile_use",'
+        '"arguments":{"action":"click","coordinate":[500,500]}}</tool_call>'
+    )
+    return completion
+
+
+def test_only_window_kept_in_memory(tmp_path):
+    """Screenshots outside the window are spilled and read back from disk."""
+    memory = JournaledTrajMemory(str(tmp_path / "episode.journal"), task_goal="goal", task_id="t1")
+    originals = []
+    for i in range(5):
+        step = make_step(i, color=(i * 50, 0, 0))
+        originals.append(step.screenshot_bytes)
+        memory.append_step(step, image_window=2)
+
+    in_memory = [step.screenshot_bytes is not None for step in memory.steps]
+    assert in_memory == [False, False, False, True, True]
+    assert [step.load_screenshot_bytes() for step in memory.steps] == originals
+    assert memory.steps[0].load_screenshot().getpixel((0, 0)) == (0, 0, 0)
+
+
+def test_recover_after_crash(tmp_path):
+    """A journal with a torn tail recovers every complete step."""
+    path = tmp_path / "episode.journal"
+    memory = JournaledTrajMemory(str(path), task_goal="goal", task_id="t1")
+    for i in range(3):
+        memory.append_step(make_step(i, color=(0, i * 80, 0)), image_window=1)
+    expected = memory.steps[2].load_screenshot_bytes()
+    complete_size = path.stat().st_size
+
+    # Simulate a worker dying halfway through writing the next step
+    with open(path, "ab") as f:
+        f.write(b"I\x00\x10\x00\x00garbage")
+
+    recovered = JournaledTrajMemory.recover(str(path))
+    assert path.stat().st_size == complete_size
+    assert (recovered.task_goal, recovered.task_id) == ("goal", "t1")
+    assert [step.thought for step in recovered.steps] == ["thought 0", "thought 1", "thought 2"]
+    assert recovered.steps[0].accessibility_tree == {"node": 0}
+    assert recovered.steps[2].image_size == (40, 80)
+    assert recovered.steps[2].screenshot is None
+    assert recovered.steps[2].load_screenshot_bytes() == expected
+
+    # The recovered memory keeps appending to the same journal
+    recovered.append_step(make_step(3), image_window=1)
+    assert len(JournaledTrajMemory.recover(str(path)).steps) == 4
+
+
+def test_replies_set_after_append_are_recovered(tmp_path):
+    """ask_user and MCP replies attached after the append reach the journal."""
+    path = str(tmp_path / "episode.journal")
+    memory = JournaledTrajMemory(path, task_goal="goal", task_id="t1")
+    for i in range(2):
+        memory.append_step(make_step(i), image_window=1)
+        memory.steps[-1].ask_user_response = f"reply {i}"
+    memory.sync_last_step()
+    memory.sync_last_step()
+    recovered = JournaledTrajMemory.recover(path)
+    assert [step.ask_user_response for step in recovered.steps] == ["reply 0", "reply 1"]
+    assert recovered.steps[1].load_screenshot_bytes() == memory.steps[1].load_screenshot_bytes()
+
+    recovered.steps[-1].mcp_response = "tool result"
+    recovered.close()
+    recovered = JournaledTrajMemory.recover(path)
+    assert [step.mcp_response for step in recovered.steps] == [None, "tool result"]
+    assert len(recovered.steps) == 2
+
+
+def test_agent_with_journal_sends_same_messages(tmp_path):
+    """Journaling does not change the messages sent to the model."""
+    def run(conf):
+        with patch('mai_naivigation_agent.OpenAI'):
+            agent = MAIUINaivigationAgent("http://test.com", "test-model", runtime_conf=conf)
+        agent.llm.chat.completions.create.return_value = make_completion()
+        for i in range(5):
+            agent.predict("Open settings", {"screenshot": Image.new("RGB", (40, 80), (i * 40, 0, 0))})
+        return agent, agent.llm.chat.completions.create.call_args.kwargs["messages"]
+
+    plain_agent, plain = run({"history_n": 3})
+    journaled_agent, journaled = run({"history_n": 3, "traj_journal_dir": str(tmp_path)})
+
+    assert journaled == plain
+    assert [step.screenshot is not None for step in journaled_agent.traj_memory.steps] == [False] * 3 + [True] * 2
+    assert journaled_agent.history_images == plain_agent.history_images
+    assert len(list(tmp_path.glob("*.journal"))) == 1
+
+    journaled_agent.reset()
+    assert list(tmp_path.glob("*.journal")) == []  # clean reset deletes it, the next one is created lazily
+
+
+def test_close_releases_map_and_reset_keeps_journal_on_request(tmp_path):
+    """close() releases the memory map; keep_traj_journals retains ended episodes."""
+    memory = JournaledTrajMemory(str(tmp_path / "episode.journal"))
+    for i in range(3):
+        memory.append_step(make_step(i), image_window=1)
+    assert memory.steps[0].load_screenshot_bytes() is not None
+    journal = memory.journal
+    map_, map_file = journal._map, journal._map_file
+    memory.close()
+    assert map_.closed and map_file.closed and journal._map is None
+    with pytest.raises(ValueError, match="is closed"):
+        memory.steps[0].load_screenshot_bytes()
+    memory.delete()
+    assert list(tmp_path.glob("*.journal")) == []
+
+    with patch('mai_naivigation_agent.OpenAI'):
+        agent = MAIUINaivigationAgent(
+            "http://test.com", "test-model",
+            runtime_conf={"traj_journal_dir": str(tmp_path), "keep_traj_journals": True},
+        )
+    agent.traj_memory.append_step(make_step(0))
+    agent.reset()
+    assert len(list(tmp_path.glob("*.journal"))) == 1
+
+
+
+def test_async_agent_journals_off_the_event_loop(tmp_path):
+    """The async agent writes and flushes the journal in worker threads."""
+    with patch('mai_naivigation_agent.AsyncOpenAI'):
+        agent = AsyncMAIUINaivigationAgent(
+            "http://test.com", "test-model", runtime_conf={"traj_journal_dir": str(tmp_path)}
+        )
+    agent.llm.chat.completions.create = AsyncMock(return_value=make_completion())
+    threads = []
+    append = agent.traj_memory.journal.append
+
+    def record(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return append(*args, **kwargs)
+
+    agent.traj_memory.journal.append = record
+
+    async def run_episode():
+        for i in range(2):
+            await agent.predict("Open settings", {"screenshot": Image.new("RGB", (40, 80), (i * 40, 0, 0))})
+            agent.traj_memory.steps[-1].ask_user_response = f"reply {i}"
+
+    asyncio.run(run_episode())
+    assert len(threads) == 6 and threading.get_ident() not in threads
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])